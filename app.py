@@ -1,69 +1,187 @@
+import atexit
 import os
 import json
+import base64
+import logging
+import re
+import time
+import uuid
 import tempfile
+import threading
 from database import Database
 from datetime import datetime, timezone, timedelta
 import asyncio
 from functools import wraps
-from typing import Optional, List, Dict, Any
+from typing import Callable, Optional, List, Dict, Any, Tuple
 from apscheduler.schedulers.background import BackgroundScheduler
 
-from flask import Flask, render_template, request, jsonify, Response
+from flask import Flask, Request, render_template, request, jsonify, Response
 from flask_cors import CORS
-from werkzeug.utils import secure_filename
-import requests
-from tusclient import client
-import aiohttp
-from cachetools import TTLCache
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+from werkzeug.utils import secure_filename, send_file as send_file_with_environ
+from werkzeug.wsgi import FileWrapper
 
-from rate_limiter import RateLimiter, rate_limit
+from rate_limiter import RateLimiter, MemoryBackend, SQLiteBackend, rate_limit
+from upload_admission import UploadAdmission, admit_upload
+from storage import StorageBackend, StorageDownload, StorageError
+from local_storage import LocalStorage
+from tusky_client import TuskyClient, TuskyError, stream_length
+from content_hash import ContentHash, chunk_content_hash, stream_content_hash
+from deletion_queue import DeletionQueue
+from deadline_scheduler import DeadlineScheduler
+from listing_cache import ListingCache
+from capsule_cache import CapsuleCache, CapsuleMeta
+from blob_cache import BlobCache
+from prefetcher import Prefetcher
+from transfers import Completion, TrackedBody, tracked_file_wrapper
+from leader_lease import LeaderLease
+from notifications import EventBus, Subscription
+from metrics import REGISTRY, SCHEDULER_RUN_SECONDS, Gauge, Histogram
+from logging_setup import configure_logging
 
 if os.name == 'nt':
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
-rate_limiter = RateLimiter(
-    requests_per_minute=40,  # 분당 60개 요청 제한
-    requests_per_hour=1000   # 시간당 1000개 요청 제한
-)
-
 app = Flask(__name__, static_url_path='', static_folder='static')
 CORS(app)
-cache = TTLCache(maxsize=100, ttl=5)  # 5 sec
 
 VAULT_NAME = "Time Capsule"
 CONFIG_FILE = "vault_config.json"
 vault_id = None
 api_key = None
+vault_resolved = False
+vault_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
 
 def load_or_create_vault(api_key):
     global vault_id
-    url = "https://api.tusky.io/vaults"
-    headers = {"Api-Key": api_key, "Content-Type": "application/json"}
-    response = requests.post(url, headers=headers, json={"name": VAULT_NAME})
+    vault = tusky.run(tusky.create_vault(VAULT_NAME))
     
-    if response.status_code not in (200, 201):
-        raise Exception(f"Failed to create vault: {response.status_code} - {response.text}")
-    
-    vault_id = response.json().get('id')
+    vault_id = vault.get('id')
     with open(CONFIG_FILE, 'w') as f:
         json.dump({'vault_id': vault_id, 'api_key': api_key}, f)
-    print(f"Created and saved new vault: {vault_id}")
+    logger.info("Created and saved new vault", extra={'vault_id': vault_id})
+
+def get_vault_id() -> Optional[str]:
+    """Vault for new capsules; created on first use if vault_config.json has none, then cached"""
+    global vault_resolved
+    # 로컬 저장소는 볼트가 필요 없음
+    if vault_resolved or Config.STORAGE_BACKEND != "tusky":
+        return vault_id
+    with vault_lock:
+        if not vault_resolved:
+            if vault_id:
+                logger.info("Using existing vault", extra={'vault_id': vault_id})
+            elif api_key:
+                # 임포트 시점이 아니라 첫 업로드에서 생성하므로 네트워크 없이도 앱이 기동됨
+                try:
+                    load_or_create_vault(api_key)
+                except TuskyError as e:
+                    raise TimeCapsuleError(f"Vault is unavailable: {e.message}", 503)
+            vault_resolved = True
+    return vault_id
 
+# API 키는 모든 Tusky 호출에 필요하므로 설정 파일만 먼저 읽음 (네트워크 호출 없음)
 if os.path.exists(CONFIG_FILE):
     with open(CONFIG_FILE, 'r') as f:
         config = json.load(f)
         vault_id = config.get('vault_id')
         api_key = config.get('api_key')
-        if vault_id:
-            print(f"Using existing vault: {vault_id}")
-        else:
-            load_or_create_vault(api_key)
 
 class Config:
+    STORAGE_BACKEND = os.environ.get("TIMECAPSULE_STORAGE", "tusky")  # "local" keeps capsules in LOCAL_STORAGE_DIR
+    LOCAL_STORAGE_DIR = "storage"
     TUSKY_API_URL = "https://api.tusky.io"
     UPLOAD_FOLDER = "temp_uploads"
     MAX_CONTENT_LENGTH = 2 * 1024 * 1024 * 1024  # 2.5GB limit
     CHUNK_SIZE = 5 * 1024 * 1024  # 5MB chunks for upload
+    DOWNLOAD_CHUNK_SIZE = 64 * 1024  # smallest read size when proxying downloads
+    DOWNLOAD_CHUNK_SIZE_MAX = 1024 * 1024  # largest read size, used for big bodies
+    TUSKY_MAX_CONNECTIONS = 32  # keep-alive connections shared by all requests
+    TUSKY_MAX_CONCURRENCY = 16  # concurrent in-flight Tusky calls
+    TUSKY_TIMEOUT = 30  # seconds, per non-streaming call
+    TUSKY_RETRIES = 3
+    CAPSULE_RETENTION = timedelta(days=7)  # capsules are kept this long after unlock
+    RATE_LIMIT_BACKEND = "sqlite"  # "sqlite" shares limits across workers, "memory" is per process
+    RATE_LIMIT_DB = "ratelimit.db"
+    LISTING_CACHE_SIZE = 10000  # users whose /api/files listing is kept in memory
+    LISTING_CACHE_TTL = 300  # seconds; entries are also invalidated per recipient on change
+    LISTING_PAGE_MAX = 200  # largest page size accepted by /api/files
+    CAPSULE_CACHE_SIZE = 100000  # capsules whose download metadata is kept in memory
+    CAPSULE_CACHE_TTL = 3600  # seconds; entries are also invalidated when a capsule is added or deleted
+    DELETION_BATCH_SIZE = 100  # capsules trashed per single empty-trash call
+    DELETION_POLL_INTERVAL = 30  # seconds between deletion queue retries
+    UPLOAD_PARALLELISM = 4  # concurrent partial uploads when tus concatenation is available
+    UPLOAD_BATCH_MAX_FILES = 500  # capsules accepted by one /api/upload/batch request
+    UPLOAD_BATCH_PARALLELISM = 8  # capsules of a batch uploaded to storage at the same time
+    UPLOAD_SESSION_TTL = timedelta(days=1)  # unfinished resumable uploads are dropped after this
+    UPLOAD_MAX_INFLIGHT_BYTES = 8 * 1024 * 1024 * 1024  # declared upload bytes a process receives at once
+    UPLOAD_MAX_INFLIGHT_BYTES_PER_USER = 2 * 1024 * 1024 * 1024  # the same, per user
+    UPLOAD_MIN_FREE_DISK = 1024 * 1024 * 1024  # kept free in UPLOAD_FOLDER, where upload bodies are spooled
+    UPLOAD_QUEUE_SIZE = 32  # uploads waiting for admission before new ones are rejected
+    UPLOAD_QUEUE_TIMEOUT = 10  # seconds an upload waits for admission before it is rejected
+    BLOB_CACHE_DIR = "blob_cache"  # local copies of recently downloaded capsules
+    BLOB_CACHE_MAX_BYTES = 4 * 1024 * 1024 * 1024  # total size before least recently used blobs are evicted
+    BLOB_CACHE_MAX_BLOB = 256 * 1024 * 1024  # larger capsules are streamed from Tusky without caching
+    BLOB_CACHE_STALE_PART = 3600  # seconds without writes before a partial blob is treated as abandoned
+    PREFETCH_LEAD = timedelta(minutes=10)  # capsules are pulled into the blob cache this long before unlock
+    PREFETCH_CONCURRENCY = 2  # capsules prefetched at the same time
+    PREFETCH_BANDWIDTH = 20 * 1024 * 1024  # bytes per second shared by all prefetches; None for no limit
+    EXPIRY_SWEEP_INTERVAL = timedelta(hours=1)  # backstop sweep for expired capsules and stale upload sessions
+    SERVER = os.environ.get("TIMECAPSULE_SERVER", "wsgi")  # "asgi" (asgi.py) and "worker" (maintenance.py) run the sweep themselves
+    MAINTENANCE = os.environ.get("TIMECAPSULE_MAINTENANCE", "elect")  # "off" leaves maintenance to other processes
+    MAINTENANCE_LEASE_TTL = 30  # seconds; a dead leader is replaced within about this long
+    ASGI_THREADS = 64  # threads running Flask views under asgi.py; streamed bodies do not hold one
+    EVENTS_POLL_INTERVAL = 0.25  # seconds between reads of the event log; bounds cross-worker latency
+    EVENTS_HEARTBEAT = 15  # seconds of silence before an SSE keep-alive comment
+    EVENTS_QUEUE_SIZE = 256  # undelivered events per client before it is made to reconnect
+    EVENTS_RETENTION = timedelta(days=1)  # how far back Last-Event-ID can resume
+    EVENTS_WSGI_MAX_STREAMS = 4  # open event streams per process under WSGI, where each holds a worker thread
+    LOG_LEVEL = "INFO"
+    LOG_FORMAT = "json"  # "json" for one object per line, "text" for plain lines
+
+configure_logging(Config.LOG_LEVEL, Config.LOG_FORMAT)
+
+cache = ListingCache(maxsize=Config.LISTING_CACHE_SIZE, ttl=Config.LISTING_CACHE_TTL)
+blob_cache = BlobCache(Config.BLOB_CACHE_DIR, max_bytes=Config.BLOB_CACHE_MAX_BYTES,
+                       stale_part_age=Config.BLOB_CACHE_STALE_PART)
+
+class UploadRequest(Request):
+    """Spools multipart file parts to Config.UPLOAD_FOLDER, whose free space admission control watches"""
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=500 * 1024, mode='rb+', dir=Config.UPLOAD_FOLDER)
+
+app.request_class = UploadRequest
+
+# 업로드 본문을 읽기 전에 선언된 크기만큼 예약 - 한도를 넘으면 대기하거나 503으로 거절
+upload_admission = UploadAdmission(
+    max_bytes=Config.UPLOAD_MAX_INFLIGHT_BYTES,
+    max_bytes_per_user=Config.UPLOAD_MAX_INFLIGHT_BYTES_PER_USER,
+    spool_dir=Config.UPLOAD_FOLDER,
+    min_free_disk=Config.UPLOAD_MIN_FREE_DISK,
+    max_queued=Config.UPLOAD_QUEUE_SIZE,
+    max_wait=Config.UPLOAD_QUEUE_TIMEOUT
+)
+
+rate_limiter = RateLimiter(
+    requests_per_minute=40,  # 분당 60개 요청 제한
+    requests_per_hour=1000,  # 시간당 1000개 요청 제한
+    backend=SQLiteBackend(Config.RATE_LIMIT_DB) if Config.RATE_LIMIT_BACKEND == "sqlite" else MemoryBackend()
+)
+
+# 모든 Tusky 호출이 공유하는 클라이언트 (커넥션 풀 재사용)
+tusky = TuskyClient(
+    Config.TUSKY_API_URL,
+    api_key,
+    max_connections=Config.TUSKY_MAX_CONNECTIONS,
+    max_concurrency=Config.TUSKY_MAX_CONCURRENCY,
+    timeout=Config.TUSKY_TIMEOUT,
+    retries=Config.TUSKY_RETRIES
+)
+
+# 캡슐 내용을 저장하는 곳 - Tusky 또는 로컬 디스크 (로컬이면 다운로드를 sendfile로 바로 전송)
+storage: StorageBackend = LocalStorage(Config.LOCAL_STORAGE_DIR) if Config.STORAGE_BACKEND == "local" else tusky
 
 class TimeCapsuleError(Exception):
     def __init__(self, message: str, status_code: int = 400):
@@ -71,86 +189,180 @@ class TimeCapsuleError(Exception):
         self.status_code = status_code
         super().__init__(self.message)
 
+HTTP_REQUEST_SECONDS = Histogram(
+    'timecapsule_http_request_seconds', 'Time to produce an API response (streamed bodies excluded)',
+    ['route', 'method', 'status']
+)
+TRANSFER_THROUGHPUT = Histogram(
+    'timecapsule_transfer_throughput_bytes_per_second', 'Throughput of capsule uploads and proxied downloads',
+    ['direction'],
+    buckets=(64 * 1024, 256 * 1024, 1024 ** 2, 4 * 1024 ** 2, 16 * 1024 ** 2, 64 * 1024 ** 2, 256 * 1024 ** 2)
+)
+
+def response_status(result) -> int:
+    if isinstance(result, tuple):
+        return result[1] if len(result) > 1 and isinstance(result[1], int) else 200
+    return getattr(result, 'status_code', 200)
+
+def observe_throughput(direction: str, size: Optional[int], started: float):
+    elapsed = time.perf_counter() - started
+    if size and elapsed > 0:
+        TRANSFER_THROUGHPUT.observe(size / elapsed, direction=direction)
+
 def error_handler(f):
     @wraps(f)
     async def decorated_function(*args, **kwargs):
+        started = time.perf_counter()
         try:
-            return await f(*args, **kwargs)
+            result = await f(*args, **kwargs)
         except TimeCapsuleError as e:
-            return jsonify({'error': e.message}), e.status_code
+            result = jsonify({'error': e.message}), e.status_code
         except Exception as e:
-            return jsonify({'error': str(e)}), 500
+            logger.exception("Unhandled error", extra={'path': request.path})
+            result = jsonify({'error': str(e)}), 500
+        route = request.url_rule.rule if request.url_rule else request.path
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started, route=route, method=request.method, status=response_status(result)
+        )
+        return result
     return decorated_function
 
 class FileManager:
-    def __init__(self, api_key: str):
-        self.api_key = api_key
-        self.tus_client = client.TusClient(
-            f"{Config.TUSKY_API_URL}/uploads",
-            headers={'Api-Key': api_key}
-        )
+    def __init__(self, client: StorageBackend):
+        self.client = client
 
     async def upload_file(self, file, metadata: Dict[str, Any]) -> str:
-        temp_path = os.path.join(Config.UPLOAD_FOLDER, secure_filename(file.filename))
-        os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
-        
+        # 업로드 스트림을 임시 파일로 복사하지 않고 바로 tus PATCH 요청으로 전송
+        # (디스크에 쓰이는 것은 werkzeug가 UPLOAD_FOLDER에 스풀한 멀티파트 파트 한 번뿐)
+        length = stream_length(file.stream)
+        started = time.perf_counter()
         try:
-            file.save(temp_path)
-            with open(temp_path, 'rb') as file_stream:
-                uploader = self.tus_client.uploader(
-                    file_stream=file_stream,
-                    metadata=metadata,
-                    chunk_size=Config.CHUNK_SIZE
-                )
-                uploader.upload()
-            return uploader.url
-        finally:
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+            upload_url = await self.client.upload(
+                file.stream,
+                metadata,
+                length=length,
+                chunk_size=Config.CHUNK_SIZE,
+                parallelism=Config.UPLOAD_PARALLELISM
+            )
+        except StorageError as e:
+            raise TimeCapsuleError(e.message, e.status_code)
+        observe_throughput('upload', length, started)
+        return upload_url
 
-db = Database()
-file_manager = FileManager(api_key)
+    async def create_upload(self, length: int, metadata: Dict[str, Any]) -> str:
+        try:
+            return await self.client.create_upload(length, metadata)
+        except StorageError as e:
+            raise TimeCapsuleError(e.message, e.status_code)
 
-@app.route('/')
-def index():
-    return render_template('index.html')
+    async def upload_chunk(self, upload_url: str, offset: int, chunk: bytes) -> int:
+        try:
+            return await self.client.upload_chunk(upload_url, offset, chunk)
+        except StorageError as e:
+            raise TimeCapsuleError(e.message, e.status_code)
 
-@app.route('/api/files', methods=['GET'])
-@error_handler
-@rate_limit(rate_limiter)
-async def list_files():
-    user_id = request.args.get('user_id')
-    if not user_id:
-        raise TimeCapsuleError("User ID is required")
+    async def discard_upload(self, storage_id: str):
+        """Remove an uploaded object that no capsule references"""
+        try:
+            await self.client.trash(storage_id)
+            await self.client.empty_trash()
+        except StorageError as e:
+            logger.warning("Failed to discard upload", extra={'storage_id': storage_id, 'error': e.message})
 
-    print(user_id)
+db = Database(retention=Config.CAPSULE_RETENTION)
+file_manager = FileManager(storage)
+capsule_cache = CapsuleCache(db, maxsize=Config.CAPSULE_CACHE_SIZE, ttl=Config.CAPSULE_CACHE_TTL)
+# 다른 워커에서 추가/삭제/잠금 해제된 캡슐도 이벤트 로그를 통해 무효화
+event_bus = EventBus(db, poll_interval=Config.EVENTS_POLL_INTERVAL, max_queued=Config.EVENTS_QUEUE_SIZE,
+                     listeners=[capsule_cache.on_events, cache.on_events])
 
-    cache_key = f"files_{user_id}"
-    if cache_key in cache:
-        return jsonify(cache[cache_key])
+def listings_changed(user_ids: List[str]):
+    """Drop cached listings of these users and push the change to their event streams"""
+    cache.invalidate(user_ids)
+    # 이벤트는 변경과 같은 트랜잭션에서 기록되므로 바로 읽도록 깨움 (다른 워커는 다음 폴링에서 전달)
+    event_bus.notify()
 
-    files = db.get_user_files(user_id)
-    print(files)
-    cache[cache_key] = files
-    return jsonify(files)
+def invalidate_listings(file_ids: List[str]):
+    """Drop cached listings of every recipient of the given capsules"""
+    listings_changed(db.get_recipients(file_ids))
 
-@app.route('/api/upload', methods=['POST'])
-@error_handler
-@rate_limit(rate_limiter)
-async def upload():
-    if 'file' not in request.files:
-        raise TimeCapsuleError("Capsule not provided")
+def on_capsules_deleted(file_ids: List[str]):
+    # 삭제 대기 중인 캡슐은 이미 목록과 메타데이터 캐시에서 제외되어 있으므로 무효화 불필요
+    deadline_scheduler.discard(file_ids)
+    logger.info("Capsules deleted", extra={'file_ids': file_ids})
 
-    if 'user_id' not in request.form:
-        raise TimeCapsuleError("Capsule key is required")
+def on_storage_released(storage_ids: List[str]):
+    # 마지막 참조 캡슐까지 삭제된 저장소 객체의 로컬 사본 제거
+    # 임대를 가진 프로세스에서만 호출되므로 다른 워커가 채운 블롭도 공유 디렉터리에서 삭제
+    blob_cache.discard(storage_ids)
 
-    file = request.files['file']
-    if not file.filename:
-        raise TimeCapsuleError("Capsule name not provided")
+deletion_queue = DeletionQueue(
+    db,
+    storage,
+    batch_size=Config.DELETION_BATCH_SIZE,
+    poll_interval=Config.DELETION_POLL_INTERVAL,
+    on_deleted=on_capsules_deleted,
+    on_released=on_storage_released
+)
 
-    current_user_id = request.form['user_id']
-    allowed_users = request.form.get('allowed_users', '')
-    
+def on_maintenance_elected():
+    deletion_queue.start()
+    # 리더가 없던 동안 지난 잠금 해제/만료 마감 처리
+    deadline_scheduler.catch_up()
+
+# 원격 삭제 처리와 만료 정리는 임대를 가진 한 프로세스에서만 실행 (대기열 등록은 모든 워커가 수행)
+maintenance_lease = LeaderLease(
+    db,
+    'maintenance',
+    ttl=Config.MAINTENANCE_LEASE_TTL,
+    on_elected=on_maintenance_elected,
+    on_demoted=deletion_queue.stop
+)
+
+def on_capsules_unlocked(file_ids: List[str]):
+    invalidate_listings(file_ids)
+    logger.info("Capsules unlocked", extra={'file_ids': file_ids})
+
+def on_capsules_expired():
+    expired_files = db.get_expired_file_ids(datetime.now(timezone.utc))
+    if expired_files:
+        deletion_queue.enqueue(expired_files, 'expired')
+        capsule_cache.invalidate(expired_files)
+        invalidate_listings(expired_files)
+        logger.info("Expired capsules queued for deletion", extra={'count': len(expired_files)})
+
+# 잠금 해제 직후 몰리는 다운로드를 로컬에서 처리하도록 미리 캐시에 적재
+prefetcher = Prefetcher(
+    db,
+    blob_cache,
+    fill=lambda storage_id, writer: fetch_blob(storage_id, writer),
+    max_size=Config.BLOB_CACHE_MAX_BLOB,
+    concurrency=Config.PREFETCH_CONCURRENCY,
+    bandwidth=Config.PREFETCH_BANDWIDTH
+)
+
+deadline_scheduler = DeadlineScheduler(
+    db,
+    on_unlocked=on_capsules_unlocked,
+    on_expired=on_capsules_expired,
+    # 로컬 저장소의 캡슐은 이미 디스크에 있으므로 미리 가져올 필요 없음
+    on_prewarm=prefetcher.enqueue if storage.name == "tusky" else None,
+    prewarm_lead=Config.PREFETCH_LEAD,
+    # 잠금 해제/만료 처리와 미리 가져오기는 임대를 가진 프로세스에서만 실행 (블롭 캐시 디렉터리는 워커가 공유)
+    is_leader=lambda: maintenance_lease.is_leader
+)
+
+def register_capsule(file_id: str, file_data: Dict[str, Any]) -> bool:
+    """Add a capsule; returns False if its shared storage object is no longer live"""
+    if db.add_file(file_id, file_data) is None:
+        return False
+    capsule_cache.invalidate([file_id])
+    file = db.get_file(file_id)
+    deadline_scheduler.add(file_id, file['unlock_date'], file['expiry_date'])
+    listings_changed(file_data['allowed_users'])
+    return True
+
+def parse_allowed_users(allowed_users: str, current_user_id: str) -> List[str]:
     if not allowed_users:
         raise TimeCapsuleError("You must specify which users will be granted capsule access")
     
@@ -175,32 +387,517 @@ async def upload():
     if current_user_id not in allowed_users_list:
         allowed_users_list.append(current_user_id)
 
-    # print(allowed_users_list)
+    return allowed_users_list
+
+def encode_listing_cursor(file: Dict[str, Any]) -> str:
+    raw = f"{file['upload_date']}|{file['id']}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_listing_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        upload_date, file_id = raw.split('|', 1)
+        return upload_date, file_id
+    except (ValueError, UnicodeDecodeError):
+        raise TimeCapsuleError("Invalid cursor")
+
+@app.route('/')
+def index():
+    return render_template('index.html')
+
+@app.route('/api/files', methods=['GET'])
+@error_handler
+@rate_limit(rate_limiter)
+async def list_files():
+    user_id = request.args.get('user_id')
+    if not user_id:
+        raise TimeCapsuleError("User ID is required")
+
+    limit = request.args.get('limit', type=int)
+    if limit is not None and not 1 <= limit <= Config.LISTING_PAGE_MAX:
+        raise TimeCapsuleError(f"limit must be between 1 and {Config.LISTING_PAGE_MAX}")
+
+    cursor = request.args.get('cursor') or None
+    before = decode_listing_cursor(cursor) if cursor else None
+
+    page_key = (limit, cursor)
+    page, version, generation = cache.lookup(user_id, page_key)
+    if version is None:
+        # 목록 조회 전에 버전을 읽어야 새 데이터에 옛 버전이 붙지 않음
+        # 캐시된 버전은 이벤트 로그로 무효화되므로 조건부 요청도 그대로 사용
+        version = db.get_listing_version(user_id)
+
+    etag = f"v{version}.{limit or 'all'}.{cursor or 'head'}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    if page is None:
+        files, has_more = db.get_user_files_page(user_id, limit, before)
+        logger.debug("Listing cache miss", extra={'user_id': user_id, 'count': len(files)})
+        next_cursor = encode_listing_cursor(files[-1]) if has_more else None
+        # 직렬화된 본문을 캐시해 재직렬화 비용 제거
+        page = (json.dumps(files).encode('utf-8'), next_cursor)
+        cache.store(user_id, page_key, page, version, generation)
+
+    body, next_cursor = page
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+class EventStream:
+    """
+    Server-Sent Events body for one user: events missed since
+    ``last_event_id`` first, then live ones from the event bus, with a
+    keep-alive comment after ``Config.EVENTS_HEARTBEAT`` seconds of silence.
+    """
+    def __init__(self, subscription: Subscription, last_event_id: Optional[int],
+                 on_close: Optional[Callable[[], None]] = None):
+        self.subscription = subscription
+        self.last_event_id = last_event_id
+        self.on_close = on_close
+
+    def _backlog(self) -> List[Dict[str, Any]]:
+        if self.last_event_id is None:
+            return []
+        # 구독 이후에 읽으므로 빠지는 이벤트는 없고, 겹치는 이벤트는 id로 걸러냄
+        return db.get_events_after(self.last_event_id, limit=Config.EVENTS_QUEUE_SIZE,
+                                   user_id=self.subscription.user_id)
+
+    def _format(self, events: List[Dict[str, Any]]) -> bytes:
+        lines = []
+        for event in events:
+            if self.last_event_id is not None and event['id'] <= self.last_event_id:
+                continue
+            self.last_event_id = event['id']
+            data = json.dumps({'file_id': event['file_id']})
+            lines.append(f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n")
+        return ''.join(lines).encode('utf-8')
+
+    def __iter__(self):
+        yield b"retry: 3000\n\n"
+        backlog = self._format(self._backlog())
+        if backlog:
+            yield backlog
+        while not self.subscription.overflowed:
+            events = self.subscription.get(Config.EVENTS_HEARTBEAT)
+            yield self._format(events) or b": keep-alive\n\n"
+
+    async def __aiter__(self):
+        loop = asyncio.get_running_loop()
+        yield b"retry: 3000\n\n"
+        backlog = self._format(await loop.run_in_executor(None, self._backlog))
+        if backlog:
+            yield backlog
+        while not self.subscription.overflowed:
+            events = await self.subscription.get_async(Config.EVENTS_HEARTBEAT)
+            yield self._format(events) or b": keep-alive\n\n"
+
+    def close(self):
+        self.subscription.close()
+        if self.on_close:
+            on_close, self.on_close = self.on_close, None
+            on_close()
+
+# WSGI 서버에서는 열린 스트림마다 워커 스레드를 점유하므로 프로세스당 동시 스트림 수를 제한 (asgi.py는 제한 없음)
+wsgi_event_streams = threading.BoundedSemaphore(Config.EVENTS_WSGI_MAX_STREAMS) \
+    if Config.EVENTS_WSGI_MAX_STREAMS else None
+
+@app.route('/api/events', methods=['GET'])
+@error_handler
+@rate_limit(rate_limiter)
+async def capsule_events():
+    """Push capsule_added, capsule_unlocked and capsule_deleted events to one user"""
+    user_id = request.args.get('user_id')
+    if not user_id:
+        raise TimeCapsuleError("User ID is required")
+
+    # EventSource는 재연결 시 Last-Event-ID 헤더를 보냄
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        raise TimeCapsuleError("Invalid Last-Event-ID")
+
+    on_close = None
+    if Config.SERVER != "asgi":
+        if wsgi_event_streams is None or not wsgi_event_streams.acquire(blocking=False):
+            # EventSource는 200이 아닌 응답에는 재연결하지 않으므로 페이지는 실시간 갱신 없이 동작
+            raise TimeCapsuleError("Live update streams are at capacity on this WSGI server (asgi.py has no limit)", 503)
+        on_close = wsgi_event_streams.release
+
+    response = Response(
+        EventStream(event_bus.subscribe(user_id), last_event_id, on_close),
+        mimetype='text/event-stream',
+        direct_passthrough=True
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def upload_user_id() -> str:
+    """Capsule key of an upload form, which must match the user_id query parameter admit_upload budgets by"""
+    user_id = request.form.get('user_id')
+    if not user_id:
+        raise TimeCapsuleError("Capsule key is required")
+    query_user_id = request.args.get('user_id')
+    if query_user_id and query_user_id != user_id:
+        raise TimeCapsuleError("Capsule key does not match the user_id query parameter")
+    return user_id
+
+@app.route('/api/upload', methods=['POST'])
+@error_handler
+@admit_upload(upload_admission)
+@rate_limit(rate_limiter)
+async def upload():
+    if 'file' not in request.files:
+        raise TimeCapsuleError("Capsule not provided")
+
+    current_user_id = upload_user_id()
+
+    file = request.files['file']
+    if not file.filename:
+        raise TimeCapsuleError("Capsule name not provided")
+
+    allowed_users_list = parse_allowed_users(request.form.get('allowed_users', ''), current_user_id)
 
     file_data = {
         'filename': secure_filename(file.filename),
-        'unlock_date': request.form['unlock_date'],
+        'unlock_date': validate_unlock_date(request.form.get('unlock_date')),
         'allowed_users': allowed_users_list,
-        'file_size': os.fstat(file.fileno()).st_size,
+        'file_size': stream_length(file.stream),
         'mime_type': file.content_type,
         'uploader_id': current_user_id
     }
 
+    # 같은 내용이 이미 업로드되어 있으면 저장소 객체를 공유하고 업로드 생략
+    file_data['content_hash'] = stream_content_hash(file.stream)
+    if file_data['content_hash'] and file_data['file_size'] is not None:
+        storage_id = db.find_duplicate(file_data['content_hash'], file_data['file_size'])
+        if storage_id:
+            file_id = uuid.uuid4().hex
+            if register_capsule(file_id, dict(file_data, storage_id=storage_id)):
+                return jsonify({
+                    'status': 'success',
+                    'file_id': file_id,
+                    'url': None,
+                    'deduplicated': True
+                })
+
     metadata = {
         'filename': file_data['filename'],
-        'vaultId': vault_id
+        'vaultId': get_vault_id()
     }
 
     upload_url = await file_manager.upload_file(file, metadata)
-    file_id = upload_url.split('/')[-1]
-    
-    db.add_file(file_id, file_data)
-    cache.clear()
+    file_id = storage.storage_id(upload_url)
+
+    try:
+        register_capsule(file_id, file_data)
+    except Exception:
+        # 등록에 실패하면 업로드된 객체를 남기지 않음
+        await file_manager.discard_upload(file_id)
+        raise
 
     return jsonify({
         'status': 'success',
         'file_id': file_id,
-        'url': upload_url
+        'url': upload_url,
+        'deduplicated': False
+    })
+
+def validate_unlock_date(unlock_date: Optional[str]) -> str:
+    """Check an unlock date before anything is uploaded, so a bad one fails with 400 up front"""
+    if not unlock_date:
+        raise TimeCapsuleError("Unlock date is required")
+    try:
+        datetime.strptime(unlock_date, "%Y-%m-%dT%H:%M")
+    except ValueError:
+        raise TimeCapsuleError("Unlock date must use the YYYY-MM-DDTHH:MM format")
+    return unlock_date
+
+def build_batch_file_data(file, entry: Dict[str, Any], current_user_id: str) -> Dict[str, Any]:
+    """Capsule metadata for one batch item; manifest entries override the shared form fields"""
+    if not isinstance(entry, dict):
+        raise TimeCapsuleError("Manifest entries must be objects")
+    if not file.filename:
+        raise TimeCapsuleError("Capsule name not provided")
+
+    unlock_date = validate_unlock_date(entry.get('unlock_date') or request.form.get('unlock_date'))
+
+    allowed_users = entry.get('allowed_users', request.form.get('allowed_users', ''))
+    if isinstance(allowed_users, list):
+        allowed_users = json.dumps(allowed_users)
+
+    return {
+        'filename': secure_filename(entry.get('filename') or file.filename),
+        'unlock_date': unlock_date,
+        'allowed_users': parse_allowed_users(allowed_users, current_user_id),
+        'file_size': stream_length(file.stream),
+        'mime_type': file.content_type,
+        'uploader_id': current_user_id,
+        'content_hash': stream_content_hash(file.stream)
+    }
+
+@app.route('/api/upload/batch', methods=['POST'])
+@error_handler
+@admit_upload(upload_admission)
+@rate_limit(rate_limiter)
+async def upload_batch():
+    current_user_id = upload_user_id()
+
+    files = request.files.getlist('files')
+    if not files:
+        raise TimeCapsuleError("Capsules not provided")
+    if len(files) > Config.UPLOAD_BATCH_MAX_FILES:
+        raise TimeCapsuleError(f"At most {Config.UPLOAD_BATCH_MAX_FILES} capsules can be uploaded at once")
+
+    try:
+        manifest = json.loads(request.form.get('manifest') or '[]')
+    except json.JSONDecodeError:
+        raise TimeCapsuleError("The manifest must be a JSON array")
+    if not isinstance(manifest, list) or (manifest and len(manifest) != len(files)):
+        raise TimeCapsuleError("The manifest must have one entry per capsule")
+
+    results: List[Optional[Dict[str, Any]]] = [None] * len(files)
+
+    def fail(index: int, message: str):
+        results[index] = {'index': index, 'filename': files[index].filename, 'status': 'error', 'error': message}
+
+    # 같은 내용은 한 번만 업로드 - 기존 객체나 배치 안의 첫 항목을 공유
+    groups: Dict[Any, List[Tuple[int, Dict[str, Any]]]] = {}
+    for index, file in enumerate(files):
+        try:
+            file_data = build_batch_file_data(file, manifest[index] if manifest else {}, current_user_id)
+        except TimeCapsuleError as e:
+            fail(index, e.message)
+            continue
+        key = (file_data['content_hash'], file_data['file_size']) if file_data['content_hash'] else index
+        groups.setdefault(key, []).append((index, file_data))
+
+    storage_ids: Dict[Any, Optional[str]] = {
+        key: db.find_duplicate(*key) if isinstance(key, tuple) and key[1] is not None else None
+        for key in groups
+    }
+
+    semaphore = asyncio.Semaphore(Config.UPLOAD_BATCH_PARALLELISM)
+
+    async def upload_one(index: int, file_data: Dict[str, Any]) -> str:
+        async with semaphore:
+            upload_url = await file_manager.upload_file(files[index], {
+                'filename': file_data['filename'],
+                'vaultId': get_vault_id()
+            })
+        return storage.storage_id(upload_url)
+
+    to_upload = [key for key in groups if storage_ids[key] is None]
+    uploaded = await asyncio.gather(
+        *(upload_one(*groups[key][0]) for key in to_upload),
+        return_exceptions=True
+    )
+
+    # (index, file_id, file_data) - 업로드한 항목이 그 객체를 공유하는 항목보다 먼저 삽입되도록 배치
+    entries: List[Tuple[int, str, Dict[str, Any]]] = []
+    for key, outcome in zip(to_upload, uploaded):
+        if isinstance(outcome, Exception):
+            message = outcome.message if isinstance(outcome, TimeCapsuleError) else str(outcome)
+            for index, _ in groups.pop(key):
+                fail(index, message)
+            continue
+        index, file_data = groups[key].pop(0)
+        entries.append((index, outcome, file_data))
+        storage_ids[key] = outcome
+
+    uploaded_ids = {file_id for _, file_id, _ in entries}
+    for key, items in groups.items():
+        for index, file_data in items:
+            entries.append((index, uuid.uuid4().hex, dict(file_data, storage_id=storage_ids[key])))
+
+    # 메타데이터는 한 트랜잭션으로 기록
+    added = set(db.add_files([(file_id, file_data) for _, file_id, file_data in entries]))
+
+    recipients = set()
+    for index, file_id, file_data in entries:
+        if file_id not in added:
+            fail(index, "The shared capsule content was deleted, please upload it again")
+            continue
+        unlock_date, expiry_date = db.capsule_dates(file_data['unlock_date'])
+        deadline_scheduler.add(file_id, unlock_date, expiry_date)
+        recipients.update(file_data['allowed_users'])
+        results[index] = {
+            'index': index,
+            'filename': file_data['filename'],
+            'status': 'success',
+            'file_id': file_id,
+            'deduplicated': file_id not in uploaded_ids
+        }
+
+    # 캐시 무효화는 배치 전체에 대해 한 번만
+    capsule_cache.invalidate(added)
+    listings_changed(recipients)
+
+    failed = sum(1 for result in results if result['status'] == 'error')
+    succeeded = len(results) - failed
+    # 전부 실패하면 오류, 일부만 실패하면 207
+    if not succeeded:
+        status, status_code = 'error', 400
+    elif failed:
+        status, status_code = 'partial', 207
+    else:
+        status, status_code = 'success', 200
+    return jsonify({
+        'status': status,
+        'succeeded': succeeded,
+        'failed': failed,
+        'results': results
+    }), status_code
+
+@app.route('/api/upload/session', methods=['POST'])
+@error_handler
+@rate_limit(rate_limiter)
+async def create_upload_session():
+    current_user_id = upload_user_id()
+
+    filename = secure_filename(request.form.get('filename', ''))
+    if not filename:
+        raise TimeCapsuleError("Capsule name not provided")
+
+    try:
+        file_size = int(request.form.get('file_size', ''))
+    except ValueError:
+        raise TimeCapsuleError("Capsule size is required")
+    if file_size < 0 or file_size > Config.MAX_CONTENT_LENGTH:
+        raise TimeCapsuleError("Capsule exceeds the maximum allowed size", 413)
+
+    unlock_date = validate_unlock_date(request.form.get('unlock_date'))
+
+    allowed_users_list = parse_allowed_users(request.form.get('allowed_users', ''), current_user_id)
+
+    file_data = {
+        'filename': filename,
+        'unlock_date': unlock_date,
+        'allowed_users': allowed_users_list,
+        'file_size': file_size,
+        'mime_type': request.form.get('mime_type') or None,
+        'uploader_id': current_user_id
+    }
+
+    metadata = {
+        'filename': filename,
+        'vaultId': get_vault_id()
+    }
+
+    upload_url = await file_manager.create_upload(file_size, metadata)
+    session_id = uuid.uuid4().hex
+    db.create_upload_session(session_id, upload_url, file_size, file_data, ContentHash().hexdigest())
+
+    return jsonify({
+        'session_id': session_id,
+        'upload_offset': 0,
+        'upload_length': file_size,
+        'chunk_size': Config.CHUNK_SIZE
+    }), 201
+
+def get_owned_upload_session(session_id: str) -> Dict[str, Any]:
+    user_id = request.args.get('user_id')
+    if not user_id:
+        raise TimeCapsuleError("Capsule key is required", 401)
+
+    session = db.get_upload_session(session_id)
+    if not session or session['uploader_id'] != user_id:
+        raise TimeCapsuleError("Upload session not found", 404)
+    return session
+
+# 청크 요청은 세션 소유자만 보낼 수 있으므로 요청 수 제한 대신 세션 검증을 적용
+@app.route('/api/upload/session/<session_id>', methods=['GET'])
+@error_handler
+async def get_upload_session(session_id: str):
+    session = get_owned_upload_session(session_id)
+    return jsonify({
+        'session_id': session['id'],
+        'upload_offset': session['upload_offset'],
+        'upload_length': session['upload_length'],
+        'chunk_size': Config.CHUNK_SIZE
+    })
+
+@app.route('/api/upload/session/<session_id>', methods=['PATCH'])
+@error_handler
+@admit_upload(upload_admission)
+async def upload_session_chunk(session_id: str):
+    session = get_owned_upload_session(session_id)
+
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+    except ValueError:
+        raise TimeCapsuleError("Upload-Offset header is required")
+
+    if offset != session['upload_offset']:
+        return jsonify({
+            'error': 'Upload offset mismatch',
+            'upload_offset': session['upload_offset']
+        }), 409
+
+    if request.content_length and request.content_length > Config.CHUNK_SIZE:
+        raise TimeCapsuleError("Chunk exceeds the maximum chunk size", 413)
+
+    chunk = request.get_data(cache=False)
+    if offset + len(chunk) > session['upload_length']:
+        raise TimeCapsuleError("Chunk exceeds the declared capsule size", 413)
+
+    new_offset = await file_manager.upload_chunk(session['upload_url'], offset, chunk)
+    # 중복 제거용 해시를 청크마다 이어서 계산하고 오프셋과 함께 저장 (다음 청크는 다른 워커가 받을 수 있음)
+    content_hash_state = None
+    if new_offset == offset + len(chunk):
+        content_hash_state = chunk_content_hash(session['content_hash_state'], offset, chunk,
+                                                final=new_offset == session['upload_length'])
+    if not db.update_upload_offset(session_id, offset, new_offset, content_hash_state):
+        current = db.get_upload_session(session_id)
+        return jsonify({
+            'error': 'Upload offset mismatch',
+            'upload_offset': current['upload_offset'] if current else None
+        }), 409
+
+    if new_offset < session['upload_length']:
+        return jsonify({
+            'session_id': session_id,
+            'upload_offset': new_offset,
+            'upload_length': session['upload_length']
+        })
+
+    # 마지막 청크까지 전송되면 캡슐 등록
+    uploaded_id = storage.storage_id(session['upload_url'])
+    file_data = dict(session['file_data'], content_hash=content_hash_state)
+    file_id = uploaded_id
+    deduplicated = False
+    try:
+        # 같은 내용이 이미 있으면 그 저장소 객체를 공유하고 방금 올린 객체는 삭제
+        storage_id = db.find_duplicate(content_hash_state, session['upload_length']) if content_hash_state else None
+        if storage_id and storage_id != uploaded_id:
+            duplicate_id = uuid.uuid4().hex
+            deduplicated = register_capsule(duplicate_id, dict(file_data, storage_id=storage_id))
+            if deduplicated:
+                file_id = duplicate_id
+        if not deduplicated:
+            register_capsule(file_id, file_data)
+    except Exception:
+        # 등록에 실패하면 세션과 업로드된 객체를 남기지 않음
+        db.delete_upload_session(session_id)
+        await file_manager.discard_upload(uploaded_id)
+        raise
+    db.delete_upload_session(session_id)
+    if deduplicated:
+        await file_manager.discard_upload(uploaded_id)
+
+    return jsonify({
+        'status': 'success',
+        'file_id': file_id,
+        'upload_offset': new_offset,
+        'upload_length': session['upload_length'],
+        'deduplicated': deduplicated
     })
 
 @app.route('/api/download/<file_id>', methods=['GET'])
@@ -211,79 +908,197 @@ async def download(file_id: str):
     if not user_id:
         raise TimeCapsuleError("Capsule key is required", 401)
 
-    file = db.get_file(file_id)
+    # 캐시된 메타데이터로 확인 (정수 시각 비교와 frozenset 조회, 미스일 때만 DB 조회)
+    file = capsule_cache.get(file_id)
     if not file:
         raise TimeCapsuleError("Capsule not found", 404)
 
     try:
-        current_date = datetime.now(timezone.utc)
-        unlock_date = datetime.strptime(file['unlock_date'], '%Y-%m-%d %H:%M:%S')
-        unlock_date = unlock_date.replace(tzinfo=timezone.utc)
-
-        if not file.get('unlocked', False) and current_date < unlock_date:
+        if not file.is_unlocked(time.time()):
+            unlock_date = file.unlock_date
             return jsonify({
                 'error': 'This capsule is still locked',
-                'message': f'This capsule will be unlocked at {unlock_date.strftime("%Y-%m-%d %H:%M")}',
-                'unlock_date': file['unlock_date']
+                'message': f'This capsule will be unlocked at {unlock_date[:16]}',
+                'unlock_date': unlock_date
             }), 403
 
-        allowed_users = file['allowed_users']
-        if isinstance(allowed_users, str):
-            allowed_users = json.loads(allowed_users)
-            
-        if user_id not in allowed_users:
+        if user_id not in file.recipients:
             raise TimeCapsuleError("You do not have permission to access the capsule", 403)
 
-        download_url = f"{Config.TUSKY_API_URL}/files/{file_id}/data"
-        headers = {'Api-Key': api_key}
-        
-        response = requests.get(download_url, headers=headers, stream=True)
-        if response.status_code != 200:
-            raise TimeCapsuleError("Failed to view capsule", response.status_code)
+        # 로컬 저장소의 캡슐은 파일을 바로 전송 (Range 처리와 sendfile은 send_file이 담당)
+        path = storage.local_path(file.storage_id)
+        if path:
+            return send_local_file(file, user_id, path, file.storage_id)
 
-        # 다운로드 상태 업데이트 및 삭제 여부 확인
-        should_delete = db.check_and_update_download(file_id, user_id)
-        
-        # 모든 수신자가 다운로드했다면 캡슐 삭제 처리
-        if should_delete:
-            async def delete_file():
-                try:
-                    headers = {
-                        'Content-Type': 'application/json',
-                        'Api-Key': api_key
-                    }
-                    
-                    trash_response = requests.patch(
-                        f"{Config.TUSKY_API_URL}/files/{file_id}",
-                        headers=headers,
-                        json={'status': 'deleted'}
-                    )
-                    
-                    if trash_response.status_code == 200:
-                        requests.delete(
-                            f"{Config.TUSKY_API_URL}/trash",
-                            headers=headers
-                        )
-                        db.delete_file(file_id)
-                        cache.clear()
-                        
-                except Exception as e:
-                    print(f"Error deleting file: {str(e)}")
-
-            asyncio.create_task(delete_file())
+        # 자주 받는 작은 캡슐은 로컬 캐시에서 전송 (동시 미스는 한 번만 저장소에서 가져옴)
+        if file.file_size and file.file_size <= Config.BLOB_CACHE_MAX_BLOB:
+            try:
+                blob = await blob_cache.get_or_fill(
+                    file.storage_id, lambda writer: fetch_blob(file.storage_id, writer)
+                )
+            except StorageError as e:
+                raise TimeCapsuleError(e.message, e.status_code)
+            if blob is not None:
+                return send_local_file(file, user_id, *blob)
 
+        # 이어받기를 위해 Range/If-Range를 그대로 저장소에 전달
+        upstream_headers = {'Accept-Encoding': 'identity'}
+        for header in ('Range', 'If-Range'):
+            if request.headers.get(header):
+                upstream_headers[header] = request.headers[header]
+
+        try:
+            response = await storage.download(file.storage_id, upstream_headers)
+        except StorageError as e:
+            raise TimeCapsuleError(e.message, e.status_code)
+        if response.status == 416:
+            response.close()
+            headers = {'Accept-Ranges': 'bytes'}
+            if response.headers.get('Content-Range'):
+                headers['Content-Range'] = response.headers['Content-Range']
+            return Response(status=416, headers=headers)
+        if response.status not in (200, 206):
+            response.close()
+            raise TimeCapsuleError("Failed to view capsule", response.status)
+
+        headers = {
+            'Content-Disposition': f'attachment; filename="{file.filename}"',
+            'Content-Type': file.mime_type or 'application/octet-stream',
+            'Accept-Ranges': 'bytes'
+        }
+        for header in ('Content-Length', 'Content-Range', 'ETag', 'Last-Modified'):
+            if response.headers.get(header):
+                headers[header] = response.headers[header]
+
+        content_length = response.headers.get('Content-Length')
+        length = int(content_length) if content_length else None
+        chunk_size = download_chunk_size(length)
+
+        # 마지막 바이트까지 전송된 경우에만 다운로드로 집계 (부분 요청으로 삭제되지 않도록)
+        completion = None
+        if request.method != 'HEAD' and serves_final_byte(response.status, response.headers.get('Content-Range')):
+            completion = Completion(length, lambda: record_download(file, user_id))
+
+        # direct_passthrough: ASGI 서버(asgi.py)가 본문을 비동기로 순회할 수 있도록 객체를 그대로 전달
         return Response(
-            response.iter_content(chunk_size=8192),
-            headers={
-                'Content-Disposition': f'attachment; filename="{file["filename"]}"',
-                'Content-Type': file['mime_type'] or 'application/octet-stream'
-            }
+            DownloadStream(response, chunk_size, completion),
+            status=response.status,
+            headers=headers,
+            direct_passthrough=True
         )
         
     except ValueError as e:
         raise TimeCapsuleError(f"date format error: {str(e)}", 400)
-    except requests.RequestException as e:
-        raise TimeCapsuleError(f"Download failed: {str(e)}", 500)
+
+CONTENT_RANGE_PATTERN = re.compile(r'bytes (\d+)-(\d+)/(\d+)')
+
+def serves_final_byte(status: int, content_range: Optional[str]) -> bool:
+    if status == 200:
+        return True
+    match = CONTENT_RANGE_PATTERN.fullmatch((content_range or '').strip())
+    return bool(match) and int(match.group(2)) == int(match.group(3)) - 1
+
+def download_chunk_size(length: Optional[int]) -> int:
+    """Read size for a proxied body: about 64 reads per body, within the configured bounds"""
+    if not length:
+        return Config.DOWNLOAD_CHUNK_SIZE
+    return max(Config.DOWNLOAD_CHUNK_SIZE, min(Config.DOWNLOAD_CHUNK_SIZE_MAX, length // 64))
+
+def record_download(file: CapsuleMeta, user_id: str):
+    try:
+        # 다운로드 기록과 마지막 수신자 판정, 삭제 대기열 추가가 한 트랜잭션에서 처리됨
+        # (동시에 끝난 마지막 다운로드들 중 한 호출만 True를 받음)
+        if db.record_download(file.id, user_id):
+            deletion_queue.wake()
+            capsule_cache.invalidate([file.id])
+            invalidate_listings([file.id])
+    except Exception:
+        logger.exception("Failed to record download", extra={'file_id': file.id})
+
+class DownloadStream:
+    """
+    Body of a proxied download. WSGI servers iterate it synchronously;
+    asgi.py iterates it asynchronously, so a long download holds no thread.
+    ``completion`` finishes only once every byte of the body has been sent.
+    """
+    def __init__(self, response: StorageDownload, chunk_size: int, completion: Optional[Completion] = None):
+        self.response = response
+        self.chunk_size = chunk_size
+        self.completion = completion
+
+    def __iter__(self):
+        # 클라이언트가 중간에 끊으면 GeneratorExit로 종료되어 completion이 호출되지 않음
+        started = time.perf_counter()
+        sent = 0
+        for chunk in self.response.iter_chunks(self.chunk_size):
+            sent += len(chunk)
+            yield chunk
+        observe_throughput('download', sent, started)
+        if self.completion:
+            self.completion.finish(sent)
+
+    async def __aiter__(self):
+        started = time.perf_counter()
+        sent = 0
+        while True:
+            chunk = await self.response.read(self.chunk_size)
+            if not chunk:
+                break
+            sent += len(chunk)
+            yield chunk
+        observe_throughput('download', sent, started)
+        if self.completion:
+            await self.completion.finish_async(sent)
+
+    def close(self):
+        self.response.close()
+
+async def fetch_blob(storage_id: str, writer):
+    response = await storage.download(storage_id, {'Accept-Encoding': 'identity'})
+    try:
+        if response.status != 200:
+            raise StorageError("Failed to view capsule", response.status)
+        while True:
+            chunk = await response.read(Config.DOWNLOAD_CHUNK_SIZE_MAX)
+            if not chunk:
+                break
+            writer.write(chunk)
+    finally:
+        response.close()
+
+def send_local_file(file: CapsuleMeta, user_id: str, path: str, etag: str) -> Response:
+    # send_file은 Range/If-Range를 직접 처리하고 WSGI 서버의 sendfile 경로를 사용
+    # 서버의 파일 래퍼를 전송 완료를 알려주는 하위 클래스로 바꿔 전달 (sendfile 경로는 그대로 유지)
+    wrapper = tracked_file_wrapper(request.environ.get('wsgi.file_wrapper', FileWrapper))
+    try:
+        response = send_file_with_environ(
+            path,
+            dict(request.environ, **{'wsgi.file_wrapper': wrapper}),
+            mimetype=file.mime_type or 'application/octet-stream',
+            as_attachment=True,
+            download_name=file.filename,
+            conditional=True,
+            etag=etag,
+            max_age=None,
+            response_class=app.response_class
+        )
+    except RequestedRangeNotSatisfiable as e:
+        return Response(status=416, headers={
+            'Accept-Ranges': 'bytes',
+            'Content-Range': f"bytes */{e.length}"
+        })
+    except FileNotFoundError:
+        # 확인 직후 삭제되어 휴지통으로 옮겨진 경우
+        raise TimeCapsuleError("Capsule not found", 404)
+    # 본문 전체가 전송된 경우에만 다운로드로 집계 (HEAD, 중단된 전송, 앞부분만 받는 Range 제외)
+    if request.method != 'HEAD' and serves_final_byte(response.status_code, response.headers.get('Content-Range')):
+        completion = Completion(response.content_length, lambda: record_download(file, user_id))
+        if isinstance(response.response, wrapper):
+            response.response.completion = completion
+        else:
+            # Range 응답은 werkzeug가 파일 래퍼를 감싸므로 그 바깥에서 셈
+            response.response = TrackedBody(response.response, completion)
+    return response
 
 @app.route('/api/delete/<file_id>', methods=['DELETE'])
 @error_handler
@@ -294,105 +1109,140 @@ async def delete_file_route(file_id: str):
         raise TimeCapsuleError("Capsule Key is required", 401)
 
     try:
-        file_info = db.get_file(file_id)
+        file_info = capsule_cache.get(file_id)
         if not file_info:
+            # 이미 삭제 대기 중인 캡슐은 다시 요청해도 같은 응답 (삭제 요청은 멱등)
+            pending = db.get_file(file_id)
+            if pending and pending['pending_deletion'] and pending['uploader_id'] == user_id:
+                return jsonify({'success': True, 'status': 'queued'}), 202
             raise TimeCapsuleError("Capsule not found", 404)
 
-        if file_info.get('uploader_id') != user_id:
+        if file_info.uploader_id != user_id:
             raise TimeCapsuleError("You do not have permission to delete capsules. Capsules can only be deleted by the user who uploaded them.", 403)
 
-        headers = {
-            'Content-Type': 'application/json',
-            'Api-Key': api_key
-        }
+        # 원격 삭제가 확인되면 대기열 작업자가 DB에서 캡슐을 제거
+        deletion_queue.enqueue([file_id], 'deleted_by_uploader')
 
-        # First, try to delete from Tusky storage
-        trash_response = requests.patch(
-            f"{Config.TUSKY_API_URL}/files/{file_id}",
-            headers=headers,
-            json={'status': 'deleted'}
-        )
-
-        if trash_response.status_code != 200:
-            print(f"Tusky deletion failed with status: {trash_response.status_code}")
-            print(f"Response content: {trash_response.text}")
-            raise TimeCapsuleError("Failed to move capsule to trash", trash_response.status_code)
-
-        # Then empty the trash
-        delete_response = requests.delete(
-            f"{Config.TUSKY_API_URL}/trash",
-            headers=headers
-        )
-
-        if delete_response.status_code not in [200, 204]:
-            print(f"Trash emptying failed with status: {delete_response.status_code}")
-            print(f"Response content: {delete_response.text}")
-            raise TimeCapsuleError("Failed to empty trash", delete_response.status_code)
-
-        # Finally, delete from local database
-        with db.get_connection() as conn:
-            cursor = conn.cursor()
-            # Delete from download_tracking first due to foreign key constraint
-            cursor.execute("DELETE FROM download_tracking WHERE file_id = ?", (file_id,))
-            cursor.execute("DELETE FROM files WHERE id = ?", (file_id,))
-            conn.commit()  # Explicitly commit the transaction
-
-        # Clear the cache after successful deletion
-        cache.clear()
+        # 대기 중인 캡슐은 목록에서 바로 제외되므로 수신자 캐시만 무효화
+        capsule_cache.invalidate([file_id])
+        listings_changed(file_info.recipients)
         
-        return jsonify({'success': True})
+        return jsonify({'success': True, 'status': 'queued'}), 202
 
     except TimeCapsuleError as e:
         raise e
     except Exception as e:
-        print(f"Unexpected error during deletion: {str(e)}")
+        logger.exception("Unexpected error during deletion", extra={'file_id': file_id})
         raise TimeCapsuleError(str(e), 500)
 
 def check_expired_files():
-    with db.get_connection() as conn:
-        cursor = conn.cursor()
-        current_time = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
-        
-        # 만료된 캡슐 조회
-        cursor.execute("""
-            SELECT id FROM files 
-            WHERE expiry_date < ? 
-        """, (current_time,))
-        
-        expired_files = cursor.fetchall()
-        
-        for (file_id,) in expired_files:
-            try:
-                headers = {
-                    'Content-Type': 'application/json',
-                    'Api-Key': api_key
-                }
-                
-                # Tusky API에서 캡슐 삭제
-                trash_response = requests.patch(
-                    f"{Config.TUSKY_API_URL}/files/{file_id}",
-                    headers=headers,
-                    json={'status': 'deleted'}
-                )
-                
-                if trash_response.status_code == 200:
-                    requests.delete(
-                        f"{Config.TUSKY_API_URL}/trash",
-                        headers=headers
-                    )
-                    
-                    # 데이터베이스에서 캡슐 정보 삭제
-                    db.delete_file(file_id)
-                    cache.clear()
-                    print(f"Expired file deleted: {file_id}")
-                    
-            except Exception as e:
-                print(f"Error deleting expired file {file_id}: {str(e)}")
-
-# 스케줄러 초기화 및 시작
+    with SCHEDULER_RUN_SECONDS.time(job='expiry_sweep'):
+        # 정확한 만료 처리는 DeadlineScheduler가 담당하고, 이 작업은 누락분을 보완
+        on_capsules_expired()
+        deletion_queue.drain()
+
+        # 오래된 미완료 업로드 세션 정리
+        stale_sessions = db.delete_stale_upload_sessions(datetime.now(timezone.utc) - Config.UPLOAD_SESSION_TTL)
+        if stale_sessions:
+            logger.info("Stale upload sessions removed", extra={'count': stale_sessions})
+
+        db.prune_events(datetime.now(timezone.utc) - Config.EVENTS_RETENTION)
+
+def run_maintenance():
+    """Scheduled expiry sweep; a no-op outside the process holding the maintenance lease"""
+    if maintenance_lease.is_leader:
+        check_expired_files()
+
+def stats_gauge(name: str, documentation: str, stats, keys: List[str], kind: str = 'gauge'):
+    """Expose selected entries of a component's stats() as one labelled metric"""
+    Gauge(name, documentation, ['stat'], kind=kind,
+          callback=lambda: {(key,): value for key, value in stats().items() if key in keys})
+
+# 스크레이프 시점에 각 구성 요소의 stats()를 읽음 (값은 이 프로세스 기준)
+stats_gauge('timecapsule_listing_cache', 'Listing cache state and counters', cache.stats,
+            ['size', 'hits', 'misses', 'hit_ratio', 'evictions', 'invalidations'])
+stats_gauge('timecapsule_capsule_cache', 'Capsule metadata cache state and counters', capsule_cache.stats,
+            ['size', 'hits', 'misses', 'hit_ratio', 'invalidations'])
+stats_gauge('timecapsule_upload_admission', 'Upload admission reservations and queue', upload_admission.stats,
+            ['in_flight', 'in_flight_bytes', 'queued', 'queued_bytes', 'admitted', 'rejected', 'hold_seconds'])
+stats_gauge('timecapsule_blob_cache', 'Blob cache state and counters', blob_cache.stats,
+            ['blobs', 'bytes', 'hits', 'misses', 'hit_ratio', 'fills', 'evictions', 'inflight'])
+stats_gauge('timecapsule_db_pool', 'SQLite connection pool state and counters', db.pool.stats,
+            ['open', 'idle', 'hits', 'misses', 'waits', 'wait_time'])
+stats_gauge('timecapsule_deadline_scheduler', 'Deadline scheduler heap', deadline_scheduler.stats,
+            ['heap_size', 'tracked_capsules'])
+stats_gauge('timecapsule_event_bus', 'SSE subscriptions and delivered events', event_bus.stats,
+            ['users', 'subscriptions', 'delivered'])
+stats_gauge('timecapsule_prefetcher', 'Prefetch queue and results', prefetcher.stats,
+            ['queued', 'prefetched', 'failed'])
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+# 스케줄러 초기화 (asgi.py와 maintenance.py는 각자 주기적으로 실행)
 scheduler = BackgroundScheduler()
-scheduler.add_job(func=check_expired_files, trigger="interval", hours=1)
-scheduler.start()
+scheduler.add_job(func=run_maintenance, trigger="interval",
+                  seconds=Config.EXPIRY_SWEEP_INTERVAL.total_seconds())
+
+services_started = False
+services_lock = threading.Lock()
+
+def start_services():
+    """
+    Start this process's background work: schema setup, blob cache index,
+    deadline scheduler, prefetcher and the maintenance election. Idempotent;
+    runs on the first request unless a server entry point calls it earlier.
+    """
+    global services_started
+    with services_lock:
+        if services_started:
+            return
+        db.init_db()
+        blob_cache.load()
+        os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
+        event_bus.start()
+        deadline_scheduler.start()
+        prefetcher.start()
+        if Config.MAINTENANCE != "off":
+            maintenance_lease.start()
+            atexit.register(maintenance_lease.stop)
+        if Config.SERVER == "wsgi":
+            scheduler.start()
+        services_started = True
+
+def stop_services():
+    """Stop background work, hand over the maintenance lease and close storage connections"""
+    global services_started
+    with services_lock:
+        if not services_started:
+            return
+        if scheduler.running:
+            scheduler.shutdown(wait=False)
+        maintenance_lease.stop()
+        deletion_queue.stop()
+        prefetcher.stop()
+        deadline_scheduler.stop()
+        event_bus.stop()
+        storage.close()
+        tusky.close()
+        services_started = False
+
+@app.before_request
+def ensure_services():
+    # 포크 이후 각 워커에서 스레드를 시작하므로 gunicorn --preload와도 안전
+    if not services_started:
+        start_services()
+
+def create_app(start: bool = False) -> Flask:
+    """
+    Application factory, e.g. ``gunicorn 'app:create_app()'``. Importing this
+    module does no network or database I/O and starts no threads; services
+    start on the first request in each worker, or immediately with ``start``.
+    """
+    if start:
+        start_services()
+    return app
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
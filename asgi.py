@@ -0,0 +1,241 @@
+"""
+ASGI entry point:
+
+    uvicorn asgi:application
+
+Flask views run on a thread pool, as under a threaded WSGI server, but
+response bodies that can be iterated asynchronously (proxied Tusky
+downloads, cached blobs) are streamed from the event loop, so a long
+download holds no thread. Request bodies are pulled from the server on
+demand, so uploads still stream through to Tusky without being buffered.
+The expiry sweep runs on the loop instead of in an APScheduler thread.
+"""
+import asyncio
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from werkzeug.wsgi import FileWrapper
+
+os.environ.setdefault("TIMECAPSULE_SERVER", "asgi")
+
+from app import app, Config, run_maintenance, start_services, stop_services
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+class RequestBody:
+    """wsgi.input that reads http.request messages from the loop as the view consumes them"""
+    def __init__(self, receive, loop: asyncio.AbstractEventLoop):
+        self._receive = receive
+        self._loop = loop
+        self._buffer = bytearray()
+        self.more = True
+
+    def _fill(self):
+        message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+        if message['type'] == 'http.disconnect':
+            # 본문이 짧게 끝나면 werkzeug가 ClientDisconnected로 처리
+            self.more = False
+            return
+        self._buffer.extend(message.get('body', b''))
+        self.more = message.get('more_body', False)
+
+    def read(self, size: int = -1) -> bytes:
+        while self.more and (size is None or size < 0 or len(self._buffer) < size):
+            self._fill()
+        if size is None or size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def readline(self, size: int = -1) -> bytes:
+        while self.more and b'\n' not in self._buffer and (size is None or size < 0 or len(self._buffer) < size):
+            self._fill()
+        end = self._buffer.find(b'\n') + 1 or len(self._buffer)
+        if size is not None and size >= 0:
+            end = min(end, size)
+        data = bytes(self._buffer[:end])
+        del self._buffer[:end]
+        return data
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
+
+def make_file_wrapper(executor: ThreadPoolExecutor):
+    class AsyncFileWrapper(FileWrapper):
+        """wsgi.file_wrapper whose reads can be awaited; used by send_file for cached blobs"""
+        def __init__(self, file, buffer_size: int = 8192):
+            super().__init__(file, max(buffer_size, Config.DOWNLOAD_CHUNK_SIZE_MAX))
+
+        async def __aiter__(self):
+            loop = asyncio.get_running_loop()
+            while True:
+                data = await loop.run_in_executor(executor, self.file.read, self.buffer_size)
+                if not data:
+                    return
+                yield data
+    return AsyncFileWrapper
+
+class ASGIApplication:
+    def __init__(self, wsgi_app, threads: int, sweep_interval: float):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='asgi')
+        self.file_wrapper = make_file_wrapper(self.executor)
+        self.sweep_interval = sweep_interval
+        self._sweeper: Optional[asyncio.Task] = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        else:
+            raise ValueError(f"Unsupported ASGI scope type: {scope['type']}")
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await asyncio.get_running_loop().run_in_executor(self.executor, start_services)
+                self._sweeper = asyncio.create_task(self._sweep_expired())
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self._sweeper:
+                    self._sweeper.cancel()
+                await asyncio.get_running_loop().run_in_executor(self.executor, stop_services)
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _sweep_expired(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await loop.run_in_executor(self.executor, run_maintenance)
+            except Exception:
+                logger.exception("Expiry sweep failed")
+
+    def _environ(self, scope, body: RequestBody) -> Dict[str, Any]:
+        script_name = scope.get('root_path', '').encode('utf-8').decode('latin1')
+        path_info = scope['path'].encode('utf-8').decode('latin1')
+        if path_info.startswith(script_name):
+            path_info = path_info[len(script_name):]
+        server = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': script_name,
+            'PATH_INFO': path_info,
+            'QUERY_STRING': scope['query_string'].decode('ascii'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+            'wsgi.file_wrapper': self.file_wrapper
+        }
+        if scope.get('client'):
+            environ['REMOTE_ADDR'] = scope['client'][0]
+        for name, value in scope['headers']:
+            name = name.decode('latin1')
+            if name == 'content-length':
+                key = 'CONTENT_LENGTH'
+            elif name == 'content-type':
+                key = 'CONTENT_TYPE'
+            else:
+                key = 'HTTP_' + name.upper().replace('-', '_')
+            value = value.decode('latin1')
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+        return environ
+
+    def _call_app(self, environ) -> Tuple[int, List[Tuple[bytes, bytes]], Any]:
+        started = {}
+
+        def start_response(status: str, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers]
+
+            def write(data):
+                raise NotImplementedError("write() is not supported; return an iterable body")
+            return write
+
+        body = self.wsgi_app(environ, start_response)
+        return started['status'], started['headers'], body
+
+    def _next_batch(self, iterator, size: int = 64 * 1024):
+        # 작은 청크는 모아서 보내 스레드 전환 횟수를 줄임
+        batch = bytearray()
+        for chunk in iterator:
+            batch.extend(chunk)
+            if len(batch) >= size:
+                return bytes(batch)
+        return bytes(batch) if batch else _END
+
+    async def _watch_disconnect(self, receive, disconnected: asyncio.Event):
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                disconnected.set()
+                return
+
+    async def _http(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        request_body = RequestBody(receive, loop)
+        try:
+            status, headers, body = await loop.run_in_executor(
+                self.executor, self._call_app, self._environ(scope, request_body)
+            )
+        except Exception:
+            logger.exception("Unhandled error in WSGI application")
+            await send({'type': 'http.response.start', 'status': 500,
+                        'headers': [(b'content-type', b'text/plain')]})
+            await send({'type': 'http.response.body', 'body': b'Internal Server Error'})
+            return
+
+        # 뷰가 끝난 뒤에는 본문을 읽지 않으므로 남은 메시지를 버리며 연결 종료를 감시
+        disconnected = asyncio.Event()
+        watcher = asyncio.create_task(self._watch_disconnect(receive, disconnected))
+        try:
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+            if hasattr(body, '__aiter__'):
+                stream = body.__aiter__()
+                try:
+                    async for chunk in stream:
+                        if disconnected.is_set():
+                            return
+                        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                finally:
+                    await stream.aclose()
+            else:
+                iterator = iter(body)
+                while not disconnected.is_set():
+                    chunk = await loop.run_in_executor(self.executor, self._next_batch, iterator)
+                    if chunk is _END:
+                        break
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            watcher.cancel()
+            close = getattr(body, 'close', None)
+            if close:
+                await loop.run_in_executor(self.executor, close)
+
+application = ASGIApplication(
+    app,
+    threads=Config.ASGI_THREADS,
+    sweep_interval=Config.EXPIRY_SWEEP_INTERVAL.total_seconds()
+)
@@ -0,0 +1,108 @@
+"""
+Micro-benchmark of the download route's capsule lookup and checks.
+
+    python benchmarks/bench_capsule_cache.py --capsules 10000 --recipients 1,20,200
+
+Compares, per call, the lookup the route used to make (get_file, which
+decodes allowed_users, then a date-string comparison and a list membership
+test) with CapsuleCache on a miss (narrow query) and on a hit (integer
+comparison and frozenset lookup, no database access). CPU time is process
+time, so it includes SQLite but not time spent waiting. "bytes/entry" is
+the memory held per cached capsule.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Callable, Dict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_db import measure
+from capsule_cache import CapsuleCache
+from database import Database
+
+def seed(db: Database, capsules: int, recipients: int):
+    unlock_date = time.strftime('%Y-%m-%dT%H:%M', time.gmtime(time.time() - 3600))
+    for start in range(0, capsules, 1000):
+        db.add_files([(f"{i:012x}", {
+            'filename': f"capsule-{i}.bin",
+            'unlock_date': unlock_date,
+            'allowed_users': [f"user-{i}-{n}" for n in range(recipients)],
+            'file_size': 1024,
+            'mime_type': 'application/octet-stream',
+            'uploader_id': f"user-{i}-0"
+        }) for i in range(start, min(capsules, start + 1000))])
+
+def legacy_check(db: Database, file_id: str, user_id: str) -> bool:
+    file = db.get_file(file_id)
+    if not file or file['pending_deletion']:
+        return False
+    if not file['unlocked'] and datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S') < file['unlock_date']:
+        return False
+    return user_id in file['allowed_users']
+
+def cached_check(cache: CapsuleCache, file_id: str, user_id: str) -> bool:
+    file = cache.get(file_id)
+    return file is not None and file.is_unlocked(time.time()) and user_id in file.recipients
+
+def measure_cpu(call: Callable[[], object], iterations: int) -> Dict[str, float]:
+    started = time.process_time()
+    result = measure(call, iterations)
+    result['cpu_us'] = (time.process_time() - started) / iterations * 1e6
+    return result
+
+def bench(capsules: int, recipients: int, iterations: int) -> Dict[str, Dict[str, float]]:
+    with tempfile.TemporaryDirectory() as directory:
+        db = Database(os.path.join(directory, 'timecapsule.db'))
+        seed(db, capsules, recipients)
+        pick = lambda: random.randrange(capsules)
+        # 마지막 수신자를 골라 리스트 순회가 끝까지 가도록 함
+        user = lambda i: f"user-{i}-{recipients - 1}"
+
+        cache = CapsuleCache(db, maxsize=capsules)
+        results = {'get_file': measure_cpu(lambda: legacy_check(db, f"{pick():012x}", user(0)), iterations)}
+
+        def miss():
+            i = pick()
+            cache.invalidate([f"{i:012x}"])
+            return cached_check(cache, f"{i:012x}", user(i))
+        results['cache miss'] = measure_cpu(miss, iterations)
+
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        for i in range(capsules):
+            cache.get(f"{i:012x}")
+        per_entry = (tracemalloc.get_traced_memory()[0] - before) / capsules
+        tracemalloc.stop()
+
+        def hit():
+            i = pick()
+            return cached_check(cache, f"{i:012x}", user(i))
+        results['cache hit'] = measure_cpu(hit, iterations)
+        results['cache hit']['bytes_per_entry'] = per_entry
+        db.pool.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--capsules', type=int, default=10000)
+    parser.add_argument('--recipients', default='1,20,200', help="comma separated recipients per capsule")
+    parser.add_argument('--iterations', type=int, default=5000)
+    args = parser.parse_args()
+
+    print(f"{'recipients':>10} {'lookup':<11} {'ops/s':>10} {'p50 us':>9} {'p99 us':>9} "
+          f"{'CPU us':>8} {'bytes/entry':>12}")
+    for recipients in (int(value) for value in args.recipients.split(',')):
+        for lookup, result in bench(args.capsules, recipients, args.iterations).items():
+            per_entry = f"{result['bytes_per_entry']:.0f}" if 'bytes_per_entry' in result else '-'
+            print(f"{recipients:>10} {lookup:<11} {result['ops']:>10.0f} {result['p50_us']:>9.1f} "
+                  f"{result['p99_us']:>9.1f} {result['cpu_us']:>8.1f} {per_entry:>12}")
+
+if __name__ == '__main__':
+    main()
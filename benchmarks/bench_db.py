@@ -0,0 +1,109 @@
+"""
+Micro-benchmarks for the per-request database and rate limiter paths.
+
+    python benchmarks/bench_db.py --rows 10000,100000,1000000
+
+get_user_files is measured on a fresh database per table size, where every
+user receives --per-user capsules, so the per-call cost should stay flat as
+the table grows. get_file and get_capsule_meta compare the full row read
+with the narrower one that fills the capsule metadata cache.
+check_rate_limit is measured on both limiter backends.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from database import Database
+from rate_limiter import RateLimiter, MemoryBackend, SQLiteBackend
+
+SEED_BATCH = 5000
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+def measure(call: Callable[[], object], iterations: int) -> Dict[str, float]:
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - started)
+    return {
+        'ops': iterations / sum(timings),
+        'p50_us': percentile(timings, 50) * 1e6,
+        'p99_us': percentile(timings, 99) * 1e6
+    }
+
+def seed(db: Database, rows: int, users: int):
+    unlock_date = time.strftime('%Y-%m-%dT%H:%M', time.gmtime(time.time() + 86400))
+    for start in range(0, rows, SEED_BATCH):
+        db.add_files([(f"{i:012x}", {
+            'filename': f"capsule-{i}.bin",
+            'unlock_date': unlock_date,
+            'allowed_users': [f"user-{i % users}"],
+            'file_size': 1024,
+            'mime_type': 'application/octet-stream',
+            'uploader_id': f"user-{i % users}"
+        }) for i in range(start, min(rows, start + SEED_BATCH))])
+
+def bench_user_files(rows: int, per_user: int, iterations: int):
+    users = max(1, rows // per_user)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'timecapsule.db')
+        db = Database(path)
+        started = time.perf_counter()
+        seed(db, rows, users)
+        seeded = time.perf_counter() - started
+        db_bytes = sum(os.path.getsize(path + suffix) for suffix in ('', '-wal') if os.path.exists(path + suffix))
+
+        pick = lambda: f"user-{random.randrange(users)}"
+        results = {
+            'get_user_files': measure(lambda: db.get_user_files(pick()), iterations),
+            'get_user_files_page': measure(lambda: db.get_user_files_page(pick(), 20), iterations),
+            'get_file': measure(lambda: db.get_file(f"{random.randrange(rows):012x}"), iterations),
+            'get_capsule_meta': measure(lambda: db.get_capsule_meta(f"{random.randrange(rows):012x}"), iterations)
+        }
+        db.pool.close()
+    return seeded, db_bytes, results
+
+def bench_rate_limiter(iterations: int, users: int):
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, backend in (
+            ('memory', MemoryBackend()),
+            ('sqlite', SQLiteBackend(os.path.join(directory, 'ratelimit.db')))
+        ):
+            limiter = RateLimiter(requests_per_minute=10 ** 9, requests_per_hour=10 ** 9, backend=backend)
+            results[name] = measure(lambda: limiter.check_rate_limit(f"user-{random.randrange(users)}"), iterations)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', default='10000,100000,1000000', help="comma separated capsule counts")
+    parser.add_argument('--per-user', type=int, default=50, help="capsules received by each user")
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--limiter-users', type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"{'rows':>9} {'call':<20} {'ops/s':>10} {'p50 us':>9} {'p99 us':>9} {'seed s':>8} {'DB MB':>8}")
+    for rows in (int(value) for value in args.rows.split(',')):
+        seeded, db_bytes, results = bench_user_files(rows, args.per_user, args.iterations)
+        for call, result in results.items():
+            print(f"{rows:>9} {call:<20} {result['ops']:>10.0f} {result['p50_us']:>9.1f} "
+                  f"{result['p99_us']:>9.1f} {seeded:>8.1f} {db_bytes / 1e6:>8.1f}")
+
+    print()
+    print(f"{'backend':<9} {'call':<20} {'ops/s':>10} {'p50 us':>9} {'p99 us':>9}")
+    for backend, result in bench_rate_limiter(args.iterations, args.limiter_users).items():
+        print(f"{backend:<9} {'check_rate_limit':<20} {result['ops']:>10.0f} "
+              f"{result['p50_us']:>9.1f} {result['p99_us']:>9.1f}")
+
+if __name__ == '__main__':
+    main()
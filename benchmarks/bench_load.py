@@ -0,0 +1,207 @@
+"""
+Load-test the API end to end against the local Tusky stand-in.
+
+    python benchmarks/bench_load.py --concurrency 16 --uploads 200 --latency 0.005
+
+The app runs in-process on a threaded WSGI server inside a temporary working
+directory (fresh timecapsule.db, rate limit DB and blob cache), and is driven
+over HTTP through /api/upload, /api/files, /api/download and /api/delete.
+``--backend local`` stores capsules on disk instead of in the Tusky stand-in.
+Each phase reports requests/sec and p50/p99 latency; the run ends with peak
+RSS and the size of the capsule database.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone, timedelta
+from typing import Awaitable, Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import aiohttp
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+def file_size(path: str) -> int:
+    return sum(os.path.getsize(path + suffix) for suffix in ('', '-wal') if os.path.exists(path + suffix))
+
+def start_app(base_url: str):
+    """Import the app in the current directory, point it at the fake Tusky and serve it"""
+    from werkzeug.serving import make_server
+    import app as appmod
+
+    logging.getLogger().setLevel(logging.WARNING)
+    appmod.tusky.base_url = base_url
+    # 부하 테스트가 속도 제한에 걸리지 않도록 한도를 사실상 해제
+    appmod.rate_limiter.requests_per_minute = 10 ** 9
+    appmod.rate_limiter.requests_per_hour = 10 ** 9
+
+    server = make_server('127.0.0.1', 0, appmod.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return appmod, server, f"http://127.0.0.1:{server.server_port}"
+
+async def run_phase(name: str, calls: List[Callable[[aiohttp.ClientSession], Awaitable[int]]],
+                    session: aiohttp.ClientSession, concurrency: int) -> Dict[str, float]:
+    latencies: List[float] = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed(call):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                status = await call(session)
+            except aiohttp.ClientError:
+                status = None
+            latencies.append(time.perf_counter() - started)
+            if status is None or status >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(timed(call) for call in calls))
+    elapsed = time.perf_counter() - started
+    return {
+        'phase': name,
+        'requests': len(calls),
+        'errors': errors,
+        'seconds': elapsed,
+        'rps': len(calls) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000
+    }
+
+async def drive(base_url: str, args) -> List[Dict[str, float]]:
+    unlock_date = (datetime.now(timezone.utc) - timedelta(minutes=5)).strftime('%Y-%m-%dT%H:%M')
+    users = [f"bench-user-{i}" for i in range(args.users)]
+    capsules: List[tuple] = []
+
+    def upload(index: int):
+        async def call(session):
+            uploader = users[index % len(users)]
+            form = aiohttp.FormData()
+            # 중복 제거로 업로드가 생략되지 않도록 캡슐마다 다른 내용 사용
+            form.add_field('file', os.urandom(args.size_kb * 1024), filename=f"capsule-{index}.bin",
+                           content_type='application/octet-stream')
+            form.add_field('user_id', uploader)
+            # 업로더만 받으면 캡슐이 삭제되므로 다른 수신자를 한 명 추가
+            form.add_field('allowed_users', users[(index + 1) % len(users)])
+            form.add_field('unlock_date', unlock_date)
+            async with session.post(f"{base_url}/api/upload", data=form) as response:
+                body = await response.json()
+                if response.status == 200:
+                    capsules.append((body['file_id'], uploader))
+                return response.status
+        return call
+
+    def list_files(user_id: str):
+        async def call(session):
+            async with session.get(f"{base_url}/api/files",
+                                   params={'user_id': user_id, 'limit': str(args.page_size)}) as response:
+                await response.read()
+                return response.status
+        return call
+
+    def download(file_id: str, user_id: str):
+        async def call(session):
+            async with session.get(f"{base_url}/api/download/{file_id}", params={'user_id': user_id}) as response:
+                async for _ in response.content.iter_chunked(256 * 1024):
+                    pass
+                return response.status
+        return call
+
+    def delete(file_id: str, user_id: str):
+        async def call(session):
+            async with session.delete(f"{base_url}/api/delete/{file_id}", params={'user_id': user_id}) as response:
+                await response.read()
+                return response.status
+        return call
+
+    results = []
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    timeout = aiohttp.ClientTimeout(total=None)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        results.append(await run_phase('upload', [upload(i) for i in range(args.uploads)],
+                                       session, args.concurrency))
+        results.append(await run_phase('files', [list_files(random.choice(users)) for _ in range(args.listings)],
+                                       session, args.concurrency))
+        # 첫 라운드는 Tusky에서 가져오고 이후 라운드는 blob 캐시에서 제공
+        for round_number in range(args.download_rounds):
+            results.append(await run_phase(
+                f"download#{round_number + 1}",
+                [download(file_id, uploader) for file_id, uploader in capsules],
+                session, args.concurrency
+            ))
+        results.append(await run_phase('delete', [delete(file_id, uploader) for file_id, uploader in capsules],
+                                       session, args.concurrency))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--uploads', type=int, default=200)
+    parser.add_argument('--size-kb', type=int, default=256)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--listings', type=int, default=1000)
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--download-rounds', type=int, default=2)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every Tusky call")
+    parser.add_argument('--bandwidth-mb', type=float, default=None, help="per-connection Tusky bandwidth in MB/s")
+    parser.add_argument('--backend', choices=('tusky', 'local'), default='tusky', help="capsule storage backend")
+    parser.add_argument('--json', action='store_true', help="print results as one JSON object")
+    args = parser.parse_args()
+    # Config는 임포트 시점에 읽으므로 앱을 불러오기 전에 설정
+    os.environ['TIMECAPSULE_STORAGE'] = args.backend
+
+    from fake_tusky import start_fake_tusky
+
+    workdir = tempfile.mkdtemp(prefix='timecapsule-bench-')
+    os.chdir(workdir)
+    tusky_server, tusky_url = start_fake_tusky(
+        latency=args.latency,
+        bandwidth=args.bandwidth_mb * 1024 * 1024 if args.bandwidth_mb else None
+    )
+    appmod, server, base_url = start_app(tusky_url)
+
+    try:
+        phases = asyncio.run(drive(base_url, args))
+        appmod.deletion_queue.drain()
+    finally:
+        server.shutdown()
+        tusky_server.shutdown()
+
+    summary = {
+        'phases': phases,
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'db_bytes': file_size(os.path.join(workdir, 'timecapsule.db')),
+        'tusky_calls': tusky_server.state.calls,
+        'workdir': workdir
+    }
+    if args.json:
+        print(json.dumps(summary))
+        return
+
+    print(f"{'phase':<12} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for phase in phases:
+        print(f"{phase['phase']:<12} {phase['requests']:>9} {phase['errors']:>7} {phase['rps']:>9.1f} "
+              f"{phase['p50_ms']:>9.2f} {phase['p99_ms']:>9.2f}")
+    print(f"peak RSS: {summary['peak_rss_kb'] / 1024:.1f} MB")
+    print(f"DB size: {summary['db_bytes'] / 1024:.1f} KB ({workdir})")
+    print(f"Tusky calls: {json.dumps(summary['tusky_calls'], sort_keys=True)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Measure worker start-up: importing app.py and serving the first request.
+
+    python benchmarks/bench_startup.py --runs 5
+
+Each run is a fresh interpreter in a scratch directory, so nothing is
+shared between runs. vault_config.json holds an API key but no vault id,
+and the Tusky URL points at a closed port, so any network call during
+import would show up as a failure or a stall. "cold" starts without a
+database, "warm" reuses the one left by the previous run.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def closed_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def worker():
+    started = time.perf_counter()
+    sys.path.insert(0, ROOT)
+    import threading
+    import app as appmod
+    imported = time.perf_counter()
+    threads_after_import = threading.active_count()
+    db_after_import = os.path.exists('timecapsule.db')
+
+    appmod.tusky.base_url = os.environ['BENCH_TUSKY_URL']
+    response = appmod.app.test_client().get('/api/files', query_string={'user_id': 'bench-user'})
+    served = time.perf_counter()
+
+    print(json.dumps({
+        'import_seconds': imported - started,
+        'first_request_seconds': served - imported,
+        'status': response.status_code,
+        'threads_after_import': threads_after_import,
+        'threads_after_request': threading.active_count(),
+        'db_after_import': db_after_import
+    }))
+    # 백그라운드 스레드 정리를 기다리지 않고 종료
+    os._exit(0)
+
+def run(workdir: str, tusky_url: str) -> dict:
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--worker'],
+        cwd=workdir, capture_output=True, text=True,
+        env=dict(os.environ, BENCH_TUSKY_URL=tusky_url)
+    )
+    elapsed = time.perf_counter() - started
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result['process_seconds'] = elapsed
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker()
+        return
+
+    tusky_url = f"http://127.0.0.1:{closed_port()}"
+    workdir = tempfile.mkdtemp(prefix='timecapsule-startup-')
+    with open(os.path.join(workdir, 'vault_config.json'), 'w') as f:
+        json.dump({'vault_id': None, 'api_key': 'bench-key'}, f)
+
+    results = {'cold': [], 'warm': []}
+    for _ in range(args.runs):
+        for name in ('timecapsule.db', 'timecapsule.db-wal', 'timecapsule.db-shm'):
+            if os.path.exists(os.path.join(workdir, name)):
+                os.remove(os.path.join(workdir, name))
+        results['cold'].append(run(workdir, tusky_url))
+        results['warm'].append(run(workdir, tusky_url))
+
+    print(f"{'start':<6} {'import ms':>10} {'1st req ms':>11} {'process ms':>11} "
+          f"{'threads':>12} {'DB at import':>13}")
+    for start, runs in results.items():
+        median = lambda key: statistics.median(result[key] for result in runs) * 1000
+        threads = f"{runs[-1]['threads_after_import']} -> {runs[-1]['threads_after_request']}"
+        print(f"{start:<6} {median('import_seconds'):>10.1f} {median('first_request_seconds'):>11.1f} "
+              f"{median('process_seconds'):>11.1f} {threads:>12} "
+              f"{'yes' if runs[-1]['db_after_import'] else 'no':>13}")
+    print(f"statuses: {sorted({result['status'] for runs in results.values() for result in runs})} ({workdir})")
+
+if __name__ == '__main__':
+    main()
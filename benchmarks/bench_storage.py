@@ -0,0 +1,126 @@
+"""
+Compare storage backends through the StorageBackend interface.
+
+    python benchmarks/bench_storage.py --objects 50 --size-kb 1024 --concurrency 8
+
+For each backend, uploads ``--objects`` capsules from spooled temp files
+(as werkzeug hands them to the upload view), reads each back in full, then
+deletes them all with one delete_many. "tusky" runs against the local Tusky
+stand-in, optionally with ``--latency`` added to every call; "local" writes
+under a temporary directory. Each phase reports MB/s, operations/sec and
+p50/p99 latency per object.
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Awaitable, Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_load import percentile
+from bench_upload import make_source
+from local_storage import LocalStorage
+from storage import StorageBackend
+from tusky_client import TuskyClient
+
+async def timed_phase(name: str, calls: List[Callable[[], Awaitable[int]]], concurrency: int) -> Dict[str, float]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+
+    async def timed(call):
+        async with semaphore:
+            started = time.perf_counter()
+            size = await call()
+            latencies.append(time.perf_counter() - started)
+            return size
+
+    started = time.perf_counter()
+    sizes = await asyncio.gather(*(timed(call) for call in calls))
+    elapsed = time.perf_counter() - started
+    return {
+        'phase': name,
+        'ops': len(calls) / elapsed,
+        'mb_s': sum(sizes) / elapsed / 1024 ** 2,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000
+    }
+
+async def drive(storage: StorageBackend, objects: int, size: int, concurrency: int) -> List[Dict[str, float]]:
+    sources = [make_source(size) for _ in range(objects)]
+    storage_ids: List[str] = []
+
+    def upload(source):
+        async def call():
+            location = await storage.upload(source, {'filename': 'capsule.bin'}, length=size)
+            storage_ids.append(storage.storage_id(location))
+            return size
+        return call
+
+    def download(storage_id: str):
+        async def call():
+            response = await storage.download(storage_id)
+            received = 0
+            try:
+                while True:
+                    chunk = await response.read(1024 * 1024)
+                    if not chunk:
+                        return received
+                    received += len(chunk)
+            finally:
+                response.close()
+        return call
+
+    async def delete():
+        errors = await storage.delete_many(storage_ids)
+        assert not any(errors.values()), errors
+        return 0
+
+    results = [await timed_phase('upload', [upload(source) for source in sources], concurrency)]
+    for source in sources:
+        source.close()
+    results.append(await timed_phase('download', [download(storage_id) for storage_id in storage_ids], concurrency))
+    # 삭제는 배치 한 번이므로 초당 객체 수로 환산
+    results.append(await timed_phase('delete', [delete], 1))
+    results[-1]['ops'] *= len(storage_ids)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--objects', type=int, default=50)
+    parser.add_argument('--size-kb', type=int, default=1024)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every Tusky call")
+    parser.add_argument('--backends', default='tusky,local', help="comma separated backends to compare")
+    args = parser.parse_args()
+
+    from fake_tusky import start_fake_tusky
+
+    print(f"{'backend':<8} {'phase':<9} {'MB/s':>9} {'ops/s':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for backend in args.backends.split(','):
+        workdir = tempfile.mkdtemp(prefix='timecapsule-storage-')
+        server = None
+        if backend == 'tusky':
+            server, base_url = start_fake_tusky(latency=args.latency)
+            storage = TuskyClient(base_url, None)
+        else:
+            storage = LocalStorage(workdir)
+        try:
+            results = storage.run(drive(storage, args.objects, args.size_kb * 1024, args.concurrency))
+        finally:
+            storage.close()
+            if server:
+                server.shutdown()
+            shutil.rmtree(workdir, ignore_errors=True)
+        for result in results:
+            mb_s = f"{result['mb_s']:.1f}" if result['mb_s'] else '-'
+            print(f"{backend:<8} {result['phase']:<9} {mb_s:>9} {result['ops']:>9.1f} "
+                  f"{result['p50_ms']:>9.2f} {result['p99_ms']:>9.2f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""
+Compare the legacy save-then-reread upload path against the streaming
+tus upload path.
+
+    python benchmarks/bench_upload.py --size-mb 256
+
+Both paths are measured from the raw multipart request body: werkzeug
+parses it and spools the file part to ``--upload-folder`` (as
+app.UploadRequest does), then the part is sent to a local fake tus
+server. The body is generated on the fly, so the only disk writes counted
+are the server's own: the spool copy on both paths, plus the legacy
+path's second copy. Each path runs in its own subprocess so peak RSS is
+measured in isolation. Disk bytes are read from /proc/self/io (Linux
+only).
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+CHUNK_SIZE = 5 * 1024 * 1024
+
+def disk_write_bytes():
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                if line.startswith('write_bytes:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def make_source(size: int):
+    """Stand-in for the spooled part werkzeug hands to the upload view"""
+    source = tempfile.TemporaryFile()
+    block = os.urandom(1024 * 1024)
+    written = 0
+    while written < size:
+        written += source.write(block[:min(len(block), size - written)])
+    source.flush()
+    source.seek(0)
+    return source
+
+class MultipartBody:
+    """A multipart/form-data request body with one ``size`` byte file part, generated while it is read"""
+    boundary = 'bench-upload-boundary'
+
+    def __init__(self, size: int):
+        self.head = (f'--{self.boundary}\r\nContent-Disposition: form-data; name="file"; filename="capsule.bin"\r\n'
+                     'Content-Type: application/octet-stream\r\n\r\n').encode()
+        self.tail = f'\r\n--{self.boundary}--\r\n'.encode()
+        self.block = os.urandom(1024 * 1024)
+        self.length = len(self.head) + size + len(self.tail)
+        self.size = size
+        self.position = 0
+
+    def _byte_range(self, start: int, end: int) -> bytes:
+        out = []
+        payload_end = len(self.head) + self.size
+        if start < len(self.head):
+            out.append(self.head[start:min(end, len(self.head))])
+        if end > len(self.head) and start < payload_end:
+            offset = max(start, len(self.head)) - len(self.head)
+            stop = min(end, payload_end) - len(self.head)
+            while offset < stop:
+                begin = offset % len(self.block)
+                piece = self.block[begin:begin + stop - offset]
+                out.append(piece)
+                offset += len(piece)
+        if end > payload_end:
+            out.append(self.tail[max(start, payload_end) - payload_end:end - payload_end])
+        return b''.join(out)
+
+    def read(self, size: int = -1) -> bytes:
+        end = self.length if size is None or size < 0 else min(self.length, self.position + size)
+        data = self._byte_range(self.position, end)
+        self.position = end
+        return data
+
+def parse_upload(body: MultipartBody, upload_folder: str):
+    """Parse the request like the upload view does and return the spooled file part"""
+    from werkzeug.wrappers import Request
+
+    class SpoolingRequest(Request):
+        def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+            return tempfile.SpooledTemporaryFile(max_size=500 * 1024, mode='rb+', dir=upload_folder)
+
+    request = SpoolingRequest({
+        'REQUEST_METHOD': 'POST',
+        'CONTENT_TYPE': f'multipart/form-data; boundary={body.boundary}',
+        'CONTENT_LENGTH': str(body.length),
+        'wsgi.input': body
+    })
+    request.max_form_memory_size = None
+    return request.files['file'].stream
+
+def run_legacy(endpoint: str, source, upload_folder: str):
+    from tusclient import client
+
+    temp_path = os.path.join(upload_folder, 'capsule.bin')
+    os.makedirs(upload_folder, exist_ok=True)
+    try:
+        with open(temp_path, 'wb') as f:
+            shutil.copyfileobj(source, f)
+        with open(temp_path, 'rb') as file_stream:
+            uploader = client.TusClient(endpoint).uploader(
+                file_stream=file_stream,
+                metadata={'filename': 'capsule.bin'},
+                chunk_size=CHUNK_SIZE
+            )
+            uploader.upload()
+        return uploader.url
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def run_streaming(endpoint: str, source, upload_folder: str):
+    from tusky_client import TuskyClient, stream_length
+
+    client = TuskyClient(endpoint.rsplit('/uploads', 1)[0], None)
+    try:
+        return client.run(client.upload(source, {'filename': 'capsule.bin'},
+                                        length=stream_length(source), chunk_size=CHUNK_SIZE))
+    finally:
+        client.close()
+
+def worker(mode: str, size: int, upload_folder: str):
+    from fake_tusky import start_fake_tusky
+
+    server, base_url = start_fake_tusky(store_data=False)
+    body = MultipartBody(size)
+    os.makedirs(upload_folder, exist_ok=True)
+
+    disk_before = disk_write_bytes()
+    started = time.perf_counter()
+    source = parse_upload(body, upload_folder)
+    runner = run_legacy if mode == 'legacy' else run_streaming
+    runner(f"{base_url}/uploads", source, upload_folder)
+    source.close()
+    elapsed = time.perf_counter() - started
+    disk_after = disk_write_bytes()
+
+    server.shutdown()
+    print(json.dumps({
+        'mode': mode,
+        'size': size,
+        'seconds': elapsed,
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'disk_bytes_written': None if disk_before is None else disk_after - disk_before,
+        'bytes_received': server.state.bytes_received
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size-mb', type=int, default=256)
+    parser.add_argument('--upload-folder', default=os.path.join(tempfile.gettempdir(), 'bench_uploads'))
+    parser.add_argument('--worker', choices=['legacy', 'streaming'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    size = args.size_mb * 1024 * 1024
+
+    if args.worker:
+        worker(args.worker, size, args.upload_folder)
+        return
+
+    print(f"{'path':<10} {'seconds':>8} {'MB/s':>8} {'peak RSS MB':>12} {'disk MB written':>16}")
+    for mode in ('legacy', 'streaming'):
+        proc = subprocess.run(
+            [sys.executable, __file__, '--worker', mode,
+             '--size-mb', str(args.size_mb), '--upload-folder', args.upload_folder],
+            capture_output=True, text=True
+        )
+        if proc.returncode != 0:
+            print(f"{mode:<10} failed: {proc.stderr.strip().splitlines()[-1]}")
+            continue
+        result = json.loads(proc.stdout)
+        disk = result['disk_bytes_written']
+        print(f"{mode:<10} {result['seconds']:>8.2f} "
+              f"{result['size'] / result['seconds'] / 1e6:>8.1f} "
+              f"{result['peak_rss_kb'] / 1024:>12.1f} "
+              f"{'n/a' if disk is None else f'{disk / 1e6:.1f}':>16}")
+
+if __name__ == '__main__':
+    main()
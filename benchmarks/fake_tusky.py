@@ -0,0 +1,232 @@
+"""
+Minimal local stand-in for the Tusky API (tus uploads, file data, trash),
+used by the benchmarks so they can run without network access.
+"""
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Any
+
+class FakeTuskyState:
+    def __init__(self, latency: float = 0.0, store_data: bool = True, bandwidth: Optional[float] = None):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.store_data = store_data
+        self.uploads: Dict[str, Dict[str, Any]] = {}
+        self.trashed = set()
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.calls: Dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def count(self, name: str):
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def pace(self, size: int):
+        # 연결마다 bandwidth 바이트/초로 전송 속도를 제한
+        if self.bandwidth:
+            time.sleep(size / self.bandwidth)
+
+class FakeTuskyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: FakeTuskyState = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, headers: Optional[Dict[str, str]] = None, body: bytes = b''):
+        self.send_response(status)
+        self.send_header('Tus-Resumable', '1.0.0')
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def _parts(self):
+        return [part for part in self.path.split('?')[0].split('/') if part]
+
+    def _read_body(self, keep: bool) -> bytes:
+        # keep=False면 본문을 메모리에 모으지 않고 읽어서 버림
+        remaining = int(self.headers.get('Content-Length', 0))
+        chunks = []
+        received = 0
+        while remaining > 0:
+            data = self.rfile.read(min(remaining, 1024 * 1024))
+            if not data:
+                break
+            received += len(data)
+            remaining -= len(data)
+            self.state.pace(len(data))
+            if keep:
+                chunks.append(data)
+        self.received = received
+        return b''.join(chunks)
+
+    def do_OPTIONS(self):
+        self._reply(204, {
+            'Tus-Version': '1.0.0',
+            'Tus-Extension': 'creation,creation-defer-length,concatenation'
+        })
+
+    def do_POST(self):
+        time.sleep(self.state.latency)
+        parts = self._parts()
+        body = self._read_body(keep=True)
+
+        if parts == ['vaults']:
+            self.state.count('create_vault')
+            name = json.loads(body or b'{}').get('name')
+            payload = json.dumps({'id': uuid.uuid4().hex, 'name': name}).encode()
+            return self._reply(201, {'Content-Type': 'application/json'}, payload)
+
+        if parts != ['uploads']:
+            return self._reply(404)
+
+        self.state.count('create_upload')
+        upload_id = uuid.uuid4().hex
+        length = self.headers.get('Upload-Length')
+        concat = self.headers.get('Upload-Concat', '')
+
+        if concat.startswith('final;'):
+            # 부분 업로드들을 이어 붙여 최종 업로드 생성
+            ids = [url.rstrip('/').split('/')[-1] for url in concat[len('final;'):].split()]
+            if any(part not in self.state.uploads for part in ids):
+                return self._reply(400)
+            total = sum(self.state.uploads[part]['offset'] for part in ids)
+            data = None
+            if self.state.store_data:
+                data = bytearray(b''.join(self.state.uploads[part]['data'] for part in ids))
+            upload = {'offset': total, 'length': total, 'data': data}
+        else:
+            upload = {
+                'offset': 0,
+                'length': int(length) if length is not None else None,
+                'data': bytearray() if self.state.store_data else None
+            }
+
+        with self.state.lock:
+            self.state.uploads[upload_id] = upload
+        self._reply(201, {'Location': f"/uploads/{upload_id}"})
+
+    def do_HEAD(self):
+        parts = self._parts()
+        upload = self.state.uploads.get(parts[-1]) if len(parts) == 2 and parts[0] == 'uploads' else None
+        if not upload:
+            return self._reply(404)
+        headers = {'Upload-Offset': str(upload['offset']), 'Cache-Control': 'no-store'}
+        if upload['length'] is not None:
+            headers['Upload-Length'] = str(upload['length'])
+        self._reply(200, headers)
+
+    def do_PATCH(self):
+        time.sleep(self.state.latency)
+        parts = self._parts()
+
+        if len(parts) == 2 and parts[0] == 'files':
+            self.state.count('trash')
+            body = json.loads(self._read_body(keep=True) or b'{}')
+            if parts[1] not in self.state.uploads:
+                return self._reply(404)
+            if body.get('status') == 'deleted':
+                with self.state.lock:
+                    self.state.trashed.add(parts[1])
+            return self._reply(200, {'Content-Type': 'application/json'}, b'{}')
+
+        upload = self.state.uploads.get(parts[-1]) if len(parts) == 2 and parts[0] == 'uploads' else None
+        if not upload:
+            self._read_body(keep=False)
+            return self._reply(404)
+        if int(self.headers.get('Upload-Offset', -1)) != upload['offset']:
+            self._read_body(keep=False)
+            return self._reply(409)
+
+        self.state.count('upload_chunk')
+        data = self._read_body(keep=self.state.store_data)
+        with self.state.lock:
+            upload['offset'] += self.received
+            if upload['data'] is not None:
+                upload['data'].extend(data)
+            if self.headers.get('Upload-Length') is not None:
+                upload['length'] = int(self.headers['Upload-Length'])
+            self.state.bytes_received += self.received
+        self._reply(204, {'Upload-Offset': str(upload['offset'])})
+
+    def do_GET(self):
+        time.sleep(self.state.latency)
+        parts = self._parts()
+        if len(parts) != 3 or parts[0] != 'files' or parts[2] != 'data':
+            return self._reply(404)
+
+        upload = self.state.uploads.get(parts[1])
+        if not upload or parts[1] in self.state.trashed:
+            return self._reply(404)
+
+        self.state.count('download')
+        size = upload['offset']
+        data = upload['data']
+        etag = f'"{parts[1]}"'
+        start, end = 0, size - 1
+
+        # 단일 바이트 범위만 지원 (bytes=a-b, bytes=a-, bytes=-n)
+        range_header = self.headers.get('Range')
+        if_range = self.headers.get('If-Range')
+        if range_header and (if_range is None or if_range == etag):
+            first, _, last = range_header.replace('bytes=', '', 1).partition('-')
+            if first:
+                start = int(first)
+                end = min(int(last), size - 1) if last else size - 1
+            else:
+                start = max(0, size - int(last))
+            if start >= size or start > end:
+                return self._reply(416, {'Content-Range': f"bytes */{size}"})
+            self.send_response(206)
+            self.send_header('Content-Range', f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', etag)
+        self.end_headers()
+
+        sent = start
+        # 대역폭 제한 시에는 작은 블록으로 나눠 전송 속도를 고르게 유지
+        block = bytes(64 * 1024 if self.state.bandwidth else 1024 * 1024)
+        while sent <= end:
+            stop = min(end + 1, sent + len(block))
+            self.wfile.write(data[sent:stop] if data is not None else block[:stop - sent])
+            self.state.pace(stop - sent)
+            sent = stop
+        with self.state.lock:
+            self.state.bytes_sent += sent - start
+
+    def do_DELETE(self):
+        time.sleep(self.state.latency)
+        if self._parts() != ['trash']:
+            return self._reply(404)
+        self.state.count('empty_trash')
+        with self.state.lock:
+            for file_id in self.state.trashed:
+                self.state.uploads.pop(file_id, None)
+            self.state.trashed.clear()
+        self._reply(204)
+
+def start_fake_tusky(host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, store_data: bool = True,
+                     bandwidth: Optional[float] = None):
+    """
+    Start the fake server on a background thread and return (server, base_url).
+    ``latency`` is added to every call in seconds, ``bandwidth`` caps each
+    connection's body transfer in bytes per second.
+    """
+    state = FakeTuskyState(latency=latency, store_data=store_data, bandwidth=bandwidth)
+    handler = type('Handler', (FakeTuskyHandler,), {'state': state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.state = state
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
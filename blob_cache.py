@@ -0,0 +1,252 @@
+import asyncio
+import concurrent.futures
+import glob
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+BLOB_NAME_PATTERN = re.compile(r'([0-9A-Za-z_-]+)\.([0-9a-f]{64})')
+
+class _HashingWriter:
+    """File writer that hashes and counts everything written to it"""
+    def __init__(self, file):
+        self.file = file
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes):
+        self.file.write(data)
+        self.sha256.update(data)
+        self.size += len(data)
+
+class BlobCache:
+    """
+    Size-bounded on-disk cache of capsule contents.
+
+    Blobs are stored as ``<file_id>.<sha256>`` and evicted least recently
+    used first once ``max_bytes`` is exceeded. Workers may share the
+    directory; a blob missing from this process's index is looked up on
+    disk before it is fetched. Concurrent misses for the
+    same capsule share one fill (single-flight): the first caller fetches
+    the blob and every other caller waits for its result, from whichever
+    thread or event loop it runs on.
+    """
+    def __init__(self, directory: str, max_bytes: int = 2 * 1024 * 1024 * 1024, stale_part_age: float = 3600):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self.stale_part_age = stale_part_age
+        self._blobs: "OrderedDict[str, Tuple[str, int, str]]" = OrderedDict()
+        self._bytes = 0
+        self._inflight: Dict[str, concurrent.futures.Future] = {}
+        self._cancelled = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.fills = 0
+        self.evictions = 0
+
+        os.makedirs(directory, exist_ok=True)
+
+    def load(self):
+        """Index blobs left by a previous run; called once at startup, before serving"""
+        # 재시작 후에도 기존 블롭을 재사용, 마지막 수정 시각 순으로 LRU 복원
+        entries = []
+        now = time.time()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            match = BLOB_NAME_PATTERN.fullmatch(name)
+            if not match:
+                # 다른 워커가 채우는 중인 임시 파일은 계속 쓰이므로, 오래 갱신되지 않은 것만 중단된 채우기로 보고 삭제
+                if name.endswith('.part'):
+                    try:
+                        if now - os.stat(path).st_mtime > self.stale_part_age:
+                            os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                continue
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, match.group(1), path, stat.st_size, match.group(2)))
+
+        with self._lock:
+            for _, file_id, path, size, digest in sorted(entries):
+                if file_id not in self._blobs:
+                    self._blobs[file_id] = (path, size, digest)
+                    self._bytes += size
+            self._evict()
+
+    def _evict(self, keep: Optional[str] = None):
+        while self._bytes > self.max_bytes and self._blobs:
+            file_id = next(iter(self._blobs))
+            if file_id == keep:
+                break
+            path, size, _ = self._blobs.popitem(last=False)[1]
+            self._bytes -= size
+            self.evictions += 1
+            self._remove(path)
+
+    @staticmethod
+    def _remove(path: str):
+        # 전송 중인 파일도 열린 핸들은 유지되므로 바로 삭제 가능
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _paths_on_disk(self, file_id: str) -> List[Tuple[str, str]]:
+        """(path, sha256) of every blob of ``file_id`` in the shared directory"""
+        paths = []
+        for path in glob.glob(os.path.join(self.directory, f"{glob.escape(file_id)}.*")):
+            match = BLOB_NAME_PATTERN.fullmatch(os.path.basename(path))
+            if match and match.group(1) == file_id:
+                paths.append((path, match.group(2)))
+        return paths
+
+    def _find_on_disk(self, file_id: str) -> Optional[Tuple[str, int, str]]:
+        for path, digest in self._paths_on_disk(file_id):
+            try:
+                return path, os.path.getsize(path), digest
+            except FileNotFoundError:
+                continue
+        return None
+
+    def _index(self, file_id: str) -> Optional[Tuple[str, int, str]]:
+        """Indexed entry of a blob, picking up one another worker wrote to the shared directory"""
+        with self._lock:
+            entry = self._blobs.get(file_id)
+            # 같은 디렉터리를 쓰는 다른 워커가 지웠을 수 있음
+            if entry is not None and not os.path.exists(entry[0]):
+                del self._blobs[file_id]
+                self._bytes -= entry[1]
+                entry = None
+            if entry is not None:
+                return entry
+
+        # 다른 워커(예: 미리 가져오기를 맡은 리더)가 채운 블롭은 디렉터리에서 찾아 색인에 추가
+        found = self._find_on_disk(file_id)
+        if found is None:
+            return None
+        with self._lock:
+            if file_id in self._cancelled:
+                return None
+            entry = self._blobs.get(file_id)
+            if entry is None:
+                entry = self._blobs[file_id] = found
+                self._bytes += found[1]
+                self._evict(keep=file_id)
+            return entry
+
+    def lookup(self, file_id: str) -> Optional[Tuple[str, str]]:
+        """Return (path, sha256) of a cached blob, or None"""
+        entry = self._index(file_id)
+        with self._lock:
+            if entry is None or file_id not in self._blobs:
+                self.misses += 1
+                return None
+            self._blobs.move_to_end(file_id)
+            self.hits += 1
+            return entry[0], entry[2]
+
+    def contains(self, file_id: str) -> bool:
+        """Whether a blob is cached, without touching LRU order or hit counters"""
+        return self._index(file_id) is not None
+
+    async def get_or_fill(self, file_id: str,
+                          fill: Callable[[_HashingWriter], Awaitable[None]]) -> Optional[Tuple[str, str]]:
+        """
+        Return the cached blob, filling it with ``fill(writer)`` on a miss.
+        Returns None if the capsule was discarded while it was being fetched.
+        """
+        cached = self.lookup(file_id)
+        if cached is not None:
+            return cached
+
+        with self._lock:
+            future = self._inflight.get(file_id)
+            leader = future is None
+            if leader:
+                future = concurrent.futures.Future()
+                self._inflight[file_id] = future
+
+        if not leader:
+            return await asyncio.wrap_future(future)
+
+        try:
+            result = await self._fill(file_id, fill)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._inflight.pop(file_id, None)
+                self._cancelled.discard(file_id)
+
+    async def _fill(self, file_id: str, fill: Callable[[_HashingWriter], Awaitable[None]]) -> Optional[Tuple[str, str]]:
+        tmp = tempfile.NamedTemporaryFile(dir=self.directory, prefix=f"{file_id}.", suffix='.part', delete=False)
+        try:
+            with tmp:
+                writer = _HashingWriter(tmp)
+                await fill(writer)
+            digest = writer.sha256.hexdigest()
+            path = os.path.join(self.directory, f"{file_id}.{digest}")
+            os.replace(tmp.name, path)
+        except BaseException:
+            self._remove(tmp.name)
+            raise
+
+        with self._lock:
+            self.fills += 1
+            # 채우는 도중 삭제된 캡슐은 캐시에 남기지 않음
+            if file_id in self._cancelled:
+                self._remove(path)
+                return None
+            previous = self._blobs.pop(file_id, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+                if previous[0] != path:
+                    self._remove(previous[0])
+            self._blobs[file_id] = (path, writer.size, digest)
+            self._bytes += writer.size
+            self._evict(keep=file_id)
+        return path, digest
+
+    def discard(self, file_ids: Iterable[str]):
+        """Delete cached blobs of deleted or expired capsules, including those other workers filled"""
+        file_ids = list(file_ids)
+        with self._lock:
+            for file_id in file_ids:
+                if file_id in self._inflight:
+                    self._cancelled.add(file_id)
+                entry = self._blobs.pop(file_id, None)
+                if entry is not None:
+                    self._bytes -= entry[1]
+                    self._remove(entry[0])
+        # 다른 워커의 색인에만 있는 블롭도 공유 디렉터리에서 제거 (그 워커는 lookup에서 파일이 없음을 확인)
+        for file_id in file_ids:
+            for path, _ in self._paths_on_disk(file_id):
+                self._remove(path)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'blobs': len(self._blobs),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'fills': self.fills,
+                'evictions': self.evictions,
+                'inflight': len(self._inflight)
+            }
@@ -0,0 +1,109 @@
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, FrozenSet, Iterable, Optional
+
+from cachetools import TTLCache
+
+from database import Database
+
+class CapsuleMeta:
+    """What the download and delete routes need to know about a capsule"""
+    __slots__ = ('id', 'filename', 'file_size', 'mime_type', 'storage_id', 'uploader_id',
+                 'unlock_ts', 'expiry_ts', 'recipients')
+
+    def __init__(self, id: str, filename: str, file_size: Optional[int], mime_type: Optional[str],
+                 storage_id: str, uploader_id: str, unlock_ts: int, expiry_ts: int,
+                 recipients: FrozenSet[str]):
+        self.id = id
+        self.filename = filename
+        self.file_size = file_size
+        self.mime_type = mime_type
+        self.storage_id = storage_id
+        self.uploader_id = uploader_id
+        self.unlock_ts = unlock_ts
+        self.expiry_ts = expiry_ts
+        self.recipients = recipients
+
+    def is_unlocked(self, now: float) -> bool:
+        return now >= self.unlock_ts
+
+    @property
+    def unlock_date(self) -> str:
+        return datetime.fromtimestamp(self.unlock_ts, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+class CapsuleCache:
+    """
+    In-memory metadata of live capsules, keyed by file id and loaded from
+    the database on first use.
+
+    Only immutable fields are kept (unlock state is derived from
+    ``unlock_ts``), so an entry goes stale only when its capsule is queued
+    for deletion. Callers invalidate on add and delete; other workers'
+    changes arrive through the event log. Fills use the same generation
+    check as ListingCache, so a load racing an invalidation is not cached.
+    """
+    def __init__(self, db: Database, maxsize: int = 100000, ttl: float = 3600,
+                 generation_buckets: int = 4096):
+        self.db = db
+        self._cache: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._generations = [0] * generation_buckets
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _bucket(self, file_id: str) -> int:
+        return hash(file_id) % len(self._generations)
+
+    def get(self, file_id: str) -> Optional[CapsuleMeta]:
+        """Metadata of a live capsule, or None if it does not exist or is being deleted"""
+        with self._lock:
+            meta = self._cache.get(file_id)
+            if meta is not None:
+                self.hits += 1
+                return meta
+            self.misses += 1
+            generation = self._generations[self._bucket(file_id)]
+
+        row = self.db.get_capsule_meta(file_id)
+        if row is None:
+            # 없는 캡슐은 캐시하지 않음 (곧 추가될 수 있음)
+            return None
+        meta = CapsuleMeta(
+            row['id'], row['filename'], row['file_size'], row['mime_type'], row['storage_id'],
+            row['uploader_id'], row['unlock_ts'], row['expiry_ts'], frozenset(row['recipients'])
+        )
+        with self._lock:
+            if self._generations[self._bucket(file_id)] == generation:
+                self._cache[file_id] = meta
+        return meta
+
+    def invalidate(self, file_ids: Iterable[str]):
+        with self._lock:
+            for file_id in set(file_ids):
+                self._generations[self._bucket(file_id)] += 1
+                self._cache.pop(file_id, None)
+                self.invalidations += 1
+
+    def on_events(self, events: Iterable[Dict[str, Any]]):
+        """EventBus listener: drop capsules added or deleted by any worker"""
+        self.invalidate(event['file_id'] for event in events
+                        if event['type'] in ('capsule_added', 'capsule_deleted'))
+
+    def clear(self):
+        with self._lock:
+            self._generations = [generation + 1 for generation in self._generations]
+            self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._cache),
+                'maxsize': self._cache.maxsize,
+                'ttl': self._cache.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'invalidations': self.invalidations
+            }
@@ -0,0 +1,55 @@
+import hashlib
+from typing import BinaryIO, Optional
+
+SEGMENT_SIZE = 1024 * 1024
+
+class ContentHash:
+    """
+    Content digest used to deduplicate uploads: a SHA-256 chain over fixed
+    1 MiB segments, ``h = sha256(h + segment)`` starting from 32 zero bytes.
+
+    Between segments its whole state is the 32-byte chain value, so a
+    resumable upload keeps it on the session row and continues hashing in
+    whichever worker receives the next chunk. Single-shot uploads compute
+    the same digest in one pass, so both paths find each other's capsules.
+    """
+    def __init__(self, state: Optional[str] = None):
+        self.value = bytes.fromhex(state) if state else bytes(32)
+
+    def update(self, data: bytes):
+        """Hash whole segments; only the last piece of the content may be shorter than SEGMENT_SIZE"""
+        view = memoryview(data)
+        for start in range(0, len(view), SEGMENT_SIZE):
+            digest = hashlib.sha256(self.value)
+            digest.update(view[start:start + SEGMENT_SIZE])
+            self.value = digest.digest()
+
+    def hexdigest(self) -> str:
+        return self.value.hex()
+
+def chunk_content_hash(state: Optional[str], offset: int, chunk: bytes, final: bool) -> Optional[str]:
+    """
+    Chain state after a resumable upload chunk, or None once the upload can
+    no longer be hashed (a chunk that does not start and end on a segment
+    boundary, or a session that already lost its state)
+    """
+    if state is None or offset % SEGMENT_SIZE or (not final and len(chunk) % SEGMENT_SIZE):
+        return None
+    content_hash = ContentHash(state)
+    content_hash.update(chunk)
+    return content_hash.hexdigest()
+
+def stream_content_hash(stream: BinaryIO) -> Optional[str]:
+    """ContentHash of the rest of a seekable stream, leaving its position unchanged"""
+    try:
+        position = stream.tell()
+    except (AttributeError, OSError, ValueError):
+        return None
+    content_hash = ContentHash()
+    while True:
+        segment = stream.read(SEGMENT_SIZE)
+        if not segment:
+            break
+        content_hash.update(segment)
+    stream.seek(position)
+    return content_hash.hexdigest()
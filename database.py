@@ -1,99 +1,467 @@
 import sqlite3
 import json
-from datetime import datetime, timezone
-from typing import Optional, List, Dict, Any
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone, timedelta
+from typing import Optional, List, Dict, Any, Callable, Iterator, Tuple
 
+from metrics import Histogram, instrument_methods
+
+logger = logging.getLogger(__name__)
+
+DB_QUERY_SECONDS = Histogram(
+    'timecapsule_db_query_seconds', 'Time spent in Database methods, including waits for a connection',
+    ['method']
+)
+
+class ConnectionPool:
+    """
+    Bounded pool of SQLite connections configured for concurrent access
+    (WAL journaling, busy timeout, foreign keys, statement cache).
+
+    ``initializer`` (e.g. schema DDL) runs once, in its own transaction,
+    before the first connection is handed out; nothing touches the file
+    until then.
+    """
+    def __init__(self, db_path: str, pool_size: int = 8, busy_timeout_ms: int = 5000,
+                 synchronous: str = "NORMAL", cached_statements: int = 256,
+                 initializer: Optional[Callable[[sqlite3.Connection], None]] = None):
+        self.db_path = db_path
+        self.pool_size = pool_size
+        self.busy_timeout_ms = busy_timeout_ms
+        self.synchronous = synchronous
+        self.cached_statements = cached_statements
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=pool_size)
+        self._created = 0
+        self._lock = threading.Lock()
+        self.initializer = initializer
+        self._initialized = initializer is None
+        self._init_lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.wait_time = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False,
+            cached_statements=self.cached_statements
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        conn.execute(f"PRAGMA busy_timeout={self.busy_timeout_ms}")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    def initialize(self):
+        """Run the initializer now if it has not run yet"""
+        with self._init_lock:
+            if self._initialized:
+                return
+            conn = self._connect()
+            try:
+                with conn:
+                    self.initializer(conn)
+            finally:
+                conn.close()
+            self._initialized = True
+
+    def acquire(self) -> sqlite3.Connection:
+        if not self._initialized:
+            self.initialize()
+        try:
+            conn = self._idle.get_nowait()
+            with self._lock:
+                self.hits += 1
+            return conn
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_create = self._created < self.pool_size
+            if can_create:
+                self._created += 1
+                self.misses += 1
+
+        if can_create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        # 풀이 가득 찬 경우 반환될 때까지 대기
+        started = time.perf_counter()
+        conn = self._idle.get()
+        with self._lock:
+            self.waits += 1
+            self.wait_time += time.perf_counter() - started
+        return conn
+
+    def release(self, conn: sqlite3.Connection):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Check out a connection and commit (or roll back) on exit"""
+        conn = self.acquire()
+        try:
+            with conn:
+                yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._created = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'size': self.pool_size,
+                'open': self._created,
+                'idle': self._idle.qsize(),
+                'hits': self.hits,
+                'misses': self.misses,
+                'waits': self.waits,
+                'wait_time': self.wait_time
+            }
+
+@instrument_methods(DB_QUERY_SECONDS, exclude={'get_connection', 'format_date', 'capsule_dates'})
 class Database:
-    def __init__(self, db_path: str = "timecapsule.db"):
+    def __init__(self, db_path: str = "timecapsule.db", pool_size: int = 8,
+                 retention: timedelta = timedelta(days=7)):
         self.db_path = db_path
-        self.init_db()
+        self.retention = retention  # 잠금 해제 후 캡슐 보관 기간
+        # 스키마는 첫 연결 시 생성 (임포트만으로는 파일을 건드리지 않음)
+        self.pool = ConnectionPool(db_path, pool_size=pool_size, initializer=self._create_schema)
 
     def get_connection(self):
-        return sqlite3.connect(self.db_path)
+        return self.pool.connection()
 
     def init_db(self):
-        with self.get_connection() as conn:
+        """Create or migrate the schema now instead of on first use"""
+        self.pool.initialize()
+
+    def _create_schema(self, conn: sqlite3.Connection):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS files (
+                id TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                upload_date TEXT NOT NULL,
+                unlock_date TEXT NOT NULL,
+                expiry_date TEXT NOT NULL,  -- 만료 날짜 필드 추가
+                unlocked INTEGER DEFAULT 0,
+                allowed_users TEXT,
+                file_size INTEGER,
+                mime_type TEXT,
+                uploader_id TEXT NOT NULL
+            )
+        ''')
+        
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS download_tracking (
+                file_id TEXT,
+                user_id TEXT,
+                downloaded INTEGER DEFAULT 0,
+                download_date TEXT,
+                PRIMARY KEY (file_id, user_id),
+                FOREIGN KEY (file_id) REFERENCES files(id) ON DELETE CASCADE
+            )
+        ''')
+
+        # 수신자 인덱스 테이블 - 사용자별 캡슐 목록을 인덱스로 조회
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS capsule_recipients (
+                user_id TEXT NOT NULL,
+                file_id TEXT NOT NULL,
+                upload_date TEXT NOT NULL,
+                PRIMARY KEY (user_id, file_id),
+                FOREIGN KEY (file_id) REFERENCES files(id) ON DELETE CASCADE
+            )
+        ''')
+
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_capsule_recipients_user_date_id
+            ON capsule_recipients (user_id, upload_date DESC, file_id DESC)
+        ''')
+
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_capsule_recipients_file
+            ON capsule_recipients (file_id)
+        ''')
+
+        # 재개 가능한 업로드 세션 - 클라이언트가 보낸 오프셋을 기록
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS upload_sessions (
+                id TEXT PRIMARY KEY,
+                upload_url TEXT NOT NULL,
+                upload_offset INTEGER NOT NULL DEFAULT 0,
+                upload_length INTEGER NOT NULL,
+                file_data TEXT NOT NULL,
+                uploader_id TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+        ''')
+
+        # 원격 삭제 대기열 - Tusky 삭제가 확인된 뒤에만 files 행을 제거
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS deletion_queue (
+                file_id TEXT PRIMARY KEY,
+                reason TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',  -- pending | trashed
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                requested_at TEXT NOT NULL,
+                next_attempt_at TEXT NOT NULL
+            )
+        ''')
+
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_deletion_queue_next_attempt
+            ON deletion_queue (next_attempt_at)
+        ''')
+
+        # 사용자별 목록 버전 - 목록이 바뀔 때마다 증가하며 ETag로 사용
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS listing_versions (
+                user_id TEXT PRIMARY KEY,
+                version INTEGER NOT NULL
+            ) WITHOUT ROWID
+        ''')
+
+        # 사용자별 캡슐 이벤트 로그 - 각 워커가 이어 읽어 SSE 구독자에게 전달
+        # (AUTOINCREMENT: 오래된 이벤트를 지워도 id가 재사용되지 않아 Last-Event-ID로 이어받기 가능)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS capsule_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                type TEXT NOT NULL,
+                file_id TEXT NOT NULL,
+                created_at TEXT NOT NULL
+            )
+        ''')
+
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_capsule_events_user
+            ON capsule_events (user_id, id)
+        ''')
+
+        # 유지보수 작업 리더 임대 - 만료 전에 갱신하지 못하면 다른 프로세스가 인수
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY,
+                holder TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            ) WITHOUT ROWID
+        ''')
+
+        # 잠금 해제/만료 마감 조회용 인덱스
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_files_pending_unlock
+            ON files (unlock_date) WHERE unlocked = 0
+        ''')
+
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_files_expiry
+            ON files (expiry_date)
+        ''')
+
+        self.migrate(conn)
+
+    def migrate(self, conn: sqlite3.Connection):
+        """Bring an existing timecapsule.db up to the current schema version"""
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+
+        if version < 1:
+            # 기존 allowed_users JSON 컬럼에서 수신자 인덱스 테이블 채우기
+            rows = conn.execute("SELECT id, upload_date, allowed_users FROM files").fetchall()
+            for file_id, upload_date, allowed_users in rows:
+                try:
+                    users = json.loads(allowed_users) if allowed_users else []
+                except json.JSONDecodeError:
+                    continue
+                conn.executemany('''
+                    INSERT OR IGNORE INTO capsule_recipients (user_id, file_id, upload_date)
+                    VALUES (?, ?, ?)
+                ''', [(user_id, file_id, upload_date) for user_id in set(users)])
+            conn.execute("PRAGMA user_version = 1")
+
+        if version < 2:
+            # 만료일이 잠금 해제일과 같게 저장되던 캡슐에 보관 기간 적용
             conn.execute('''
-                CREATE TABLE IF NOT EXISTS files (
-                    id TEXT PRIMARY KEY,
-                    filename TEXT NOT NULL,
-                    upload_date TEXT NOT NULL,
-                    unlock_date TEXT NOT NULL,
-                    expiry_date TEXT NOT NULL,  -- 만료 날짜 필드 추가
-                    unlocked INTEGER DEFAULT 0,
-                    allowed_users TEXT,
-                    file_size INTEGER,
-                    mime_type TEXT,
-                    uploader_id TEXT NOT NULL
-                )
+                UPDATE files SET expiry_date = datetime(unlock_date, ?)
+                WHERE expiry_date <= unlock_date
+            ''', (f"+{int(self.retention.total_seconds())} seconds",))
+            conn.execute("PRAGMA user_version = 2")
+
+        if version < 3:
+            # 커서 페이지네이션을 위해 file_id까지 포함한 인덱스로 교체
+            conn.execute("DROP INDEX IF EXISTS idx_capsule_recipients_user_date")
+            conn.execute("PRAGMA user_version = 3")
+
+        if version < 4:
+            # 중복 업로드 제거 - 여러 캡슐이 같은 Tusky 객체(storage_id)를 참조할 수 있음
+            conn.execute("ALTER TABLE files ADD COLUMN storage_id TEXT")
+            conn.execute("ALTER TABLE files ADD COLUMN content_hash TEXT")
+            conn.execute("UPDATE files SET storage_id = id WHERE storage_id IS NULL")
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_files_content_hash
+                ON files (content_hash, file_size) WHERE content_hash IS NOT NULL
             ''')
-            
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_files_storage ON files (storage_id)")
+            conn.execute("PRAGMA user_version = 4")
+
+        if version < 5:
+            # 아직 받지 않은 수신자 수 - 마지막 다운로드 판정 시 download_tracking을 다시 세지 않음
+            conn.execute("ALTER TABLE files ADD COLUMN remaining_downloads INTEGER NOT NULL DEFAULT 0")
             conn.execute('''
-                CREATE TABLE IF NOT EXISTS download_tracking (
-                    file_id TEXT,
-                    user_id TEXT,
-                    downloaded INTEGER DEFAULT 0,
-                    download_date TEXT,
-                    PRIMARY KEY (file_id, user_id),
-                    FOREIGN KEY (file_id) REFERENCES files(id) ON DELETE CASCADE
+                UPDATE files SET remaining_downloads = (
+                    SELECT COUNT(*) FROM download_tracking t
+                    WHERE t.file_id = files.id AND t.downloaded = 0
                 )
             ''')
+            conn.execute("PRAGMA user_version = 5")
+
+        if version < 6:
+            # 잠금 해제/만료 시각을 정수 epoch로도 저장 - 요청마다 날짜 문자열을 파싱하지 않음
+            conn.execute("ALTER TABLE files ADD COLUMN unlock_ts INTEGER")
+            conn.execute("ALTER TABLE files ADD COLUMN expiry_ts INTEGER")
+            conn.execute('''
+                UPDATE files SET unlock_ts = CAST(strftime('%s', unlock_date) AS INTEGER),
+                                 expiry_ts = CAST(strftime('%s', expiry_date) AS INTEGER)
+            ''')
+            conn.execute("PRAGMA user_version = 6")
+
+        if version < 7:
+            # 중복 제거 해시를 1 MiB 구간 SHA-256 체인으로 변경 - 재개 가능한 업로드도 청크마다 이어서 계산
+            # 이전 방식(전체 SHA-256)의 값은 새 해시와 비교할 수 없으므로 제거
+            conn.execute("UPDATE files SET content_hash = NULL")
+            conn.execute("ALTER TABLE upload_sessions ADD COLUMN content_hash_state TEXT")
+            conn.execute("PRAGMA user_version = 7")
 
     def format_date(self, date_str: str) -> str:
         try:
             # 명시적으로 UTC 타임존 설정
             dt = datetime.strptime(date_str, '%Y-%m-%dT%H:%M').replace(tzinfo=timezone.utc)
             
-            print(f"Original datetime: {dt}")
-            print(f"Datetime timezone: {dt.tzinfo}")
-            
             # UTC로 변환
             utc_dt = dt.astimezone(timezone.utc)
-            print(f"UTC datetime: {utc_dt}")
+            logger.debug("Parsed unlock date", extra={'input': date_str, 'utc': utc_dt.isoformat()})
             
             return utc_dt.strftime('%Y-%m-%d %H:%M:%S')
         except ValueError:
             return date_str
             
     def get_user_files(self, user_id: str) -> List[Dict[str, Any]]:
+        files, _ = self.get_user_files_page(user_id)
+        return files
+
+    def get_user_files_page(self, user_id: str, limit: Optional[int] = None,
+                            before: Optional[Tuple[str, str]] = None) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        One page of a user's capsules, newest first.
+        ``before`` is the (upload_date, file_id) of the last item of the previous page.
+        Returns (files, has_more).
+        """
         with self.get_connection() as conn:
-            conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
+
+            conditions = "r.user_id = ?"
+            params: List[Any] = [user_id]
+            if before is not None:
+                conditions += " AND (r.upload_date, r.file_id) < (?, ?)"
+                params.extend(before)
+            limit_clause = ""
+            if limit is not None:
+                limit_clause = "LIMIT ?"
+                params.append(limit + 1)
             
-            cursor.execute("""
-                SELECT id, filename, upload_date, unlock_date, unlocked, allowed_users, file_size, mime_type
-                FROM files 
-                ORDER BY upload_date DESC
-            """)
-            
-            files = []
-            for row in cursor.fetchall():
-                try:
-                    # JSON 문자열을 파싱하여 리스트로 변환
-                    allowed_users = json.loads(row['allowed_users'])
-                    if user_id in allowed_users:
-                        files.append({
-                            'id': row['id'],
-                            'filename': row['filename'],
-                            'upload_date': row['upload_date'],
-                            'unlock_date': row['unlock_date'],
-                            'unlocked': bool(row['unlocked']),
-                            'file_size': row['file_size'],
-                            'mime_type': row['mime_type']
-                        })
-                except json.JSONDecodeError:
-                    continue  # JSON 파싱 오류 시 해당 캡슐 건너뛰기
+            # 수신자 인덱스 (user_id, upload_date DESC, file_id DESC)를 통해 해당 사용자의 캡슐만 조회
+            cursor.execute(f"""
+                SELECT f.id, f.filename, f.upload_date, f.unlock_date, f.unlocked, f.file_size, f.mime_type
+                FROM capsule_recipients r
+                JOIN files f ON f.id = r.file_id
+                WHERE {conditions}
+                AND NOT EXISTS (SELECT 1 FROM deletion_queue q WHERE q.file_id = f.id)
+                ORDER BY r.upload_date DESC, r.file_id DESC
+                {limit_clause}
+            """, params)
+            rows = cursor.fetchall()
+
+            has_more = limit is not None and len(rows) > limit
+            if has_more:
+                rows = rows[:limit]
             
-            return files
+            return [{
+                'id': row['id'],
+                'filename': row['filename'],
+                'upload_date': row['upload_date'],
+                'unlock_date': row['unlock_date'],
+                'unlocked': bool(row['unlocked']),
+                'file_size': row['file_size'],
+                'mime_type': row['mime_type']
+            } for row in rows], has_more
+
+    def get_listing_version(self, user_id: str) -> int:
+        with self.get_connection() as conn:
+            row = conn.execute('''
+                SELECT version FROM listing_versions WHERE user_id = ?
+            ''', (user_id,)).fetchone()
+            return row[0] if row else 0
+
+    def _bump_listing_versions(self, conn: sqlite3.Connection, user_ids: List[str]):
+        conn.executemany('''
+            INSERT INTO listing_versions (user_id, version) VALUES (?, 1)
+            ON CONFLICT (user_id) DO UPDATE SET version = version + 1
+        ''', [(user_id,) for user_id in set(user_ids)])
+
+    def _bump_listing_versions_for_files(self, conn: sqlite3.Connection, file_ids: List[str]):
+        for i in range(0, len(file_ids), 500):
+            batch = file_ids[i:i + 500]
+            placeholders = ','.join('?' * len(batch))
+            conn.execute(f'''
+                INSERT INTO listing_versions (user_id, version)
+                SELECT DISTINCT user_id, 1 FROM capsule_recipients WHERE file_id IN ({placeholders})
+                ON CONFLICT (user_id) DO UPDATE SET version = version + 1
+            ''', batch)
+
+    def _record_events(self, conn: sqlite3.Connection, event_type: str, file_ids: List[str]):
+        """Log an event for every recipient of the given capsules, in the caller's transaction"""
+        created_at = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        for i in range(0, len(file_ids), 500):
+            batch = file_ids[i:i + 500]
+            placeholders = ','.join('?' * len(batch))
+            conn.execute(f'''
+                INSERT INTO capsule_events (user_id, type, file_id, created_at)
+                SELECT user_id, ?, file_id, ? FROM capsule_recipients WHERE file_id IN ({placeholders})
+            ''', [event_type, created_at, *batch])
 
     def get_file(self, file_id: str) -> Optional[Dict[str, Any]]:
         with self.get_connection() as conn:
-            conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
             cursor.execute("""
-                SELECT * FROM files 
-                WHERE id = ?
+                SELECT f.*, q.file_id IS NOT NULL AS pending_deletion
+                FROM files f
+                LEFT JOIN deletion_queue q ON q.file_id = f.id
+                WHERE f.id = ?
             """, (file_id,))
             
             row = cursor.fetchone()
@@ -105,79 +473,172 @@ class Database:
                 'filename': row['filename'],
                 'upload_date': row['upload_date'],
                 'unlock_date': row['unlock_date'],
+                'expiry_date': row['expiry_date'],
                 'unlocked': bool(row['unlocked']),
                 'allowed_users': json.loads(row['allowed_users']) if row['allowed_users'] else [],
                 'file_size': row['file_size'],
                 'mime_type': row['mime_type'],
-                'uploader_id': row['uploader_id']  # uploader_id 필드 추가
+                'uploader_id': row['uploader_id'],  # uploader_id 필드 추가
+                'storage_id': row['storage_id'] or row['id'],
+                'content_hash': row['content_hash'],
+                'pending_deletion': bool(row['pending_deletion'])
             }
 
-    def add_file(self, file_id: str, file_data: Dict[str, Any]) -> str:
+    def find_duplicate(self, content_hash: str, file_size: int) -> Optional[str]:
+        """Storage id of a live capsule with the same content (see content_hash.ContentHash), if any"""
+        with self.get_connection() as conn:
+            row = conn.execute('''
+                SELECT f.storage_id FROM files f
+                WHERE f.content_hash = ? AND f.file_size = ?
+                AND NOT EXISTS (SELECT 1 FROM deletion_queue q WHERE q.file_id = f.id)
+                LIMIT 1
+            ''', (content_hash, file_size)).fetchone()
+            return row[0] if row else None
+
+    def capsule_dates(self, unlock_date: str) -> Tuple[str, str]:
+        """Stored (unlock_date, expiry_date) for a submitted ``YYYY-MM-DDTHH:MM`` unlock date"""
+        expiry_date = datetime.strptime(unlock_date, "%Y-%m-%dT%H:%M") + self.retention
+        return self.format_date(unlock_date), expiry_date.strftime('%Y-%m-%d %H:%M:%S')
+
+    def add_file(self, file_id: str, file_data: Dict[str, Any]) -> Optional[str]:
+        """
+        Add a capsule. ``file_data`` may carry ``storage_id`` to share an
+        existing Tusky object; returns None if that object is no longer
+        referenced by a live capsule (it may already be trashed).
+        """
+        return file_id if self.add_files([(file_id, file_data)]) else None
+
+    def add_files(self, entries: List[Tuple[str, Dict[str, Any]]]) -> List[str]:
+        """
+        Add several capsules in one transaction and return the ids that were
+        added (entries sharing a storage object that is no longer live are skipped)
+        """
+        if not entries:
+            return []
+
         with self.get_connection() as conn:
-            cursor = conn.cursor()
             current_time = datetime.now(timezone.utc)
-            unlock_date = datetime.strptime(file_data['unlock_date'], "%Y-%m-%dT%H:%M")
-            expiry_date = unlock_date.strftime('%Y-%m-%d %H:%M:%S')
+            upload_date = current_time.strftime('%Y-%m-%d %H:%M:%S')
+
+            rows = []
+            for file_id, file_data in entries:
+                storage_id = file_data.get('storage_id') or file_id
+                unlock_date, expiry_date = self.capsule_dates(file_data['unlock_date'])
+                unlock_ts, expiry_ts = (
+                    int(datetime.strptime(value, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc).timestamp())
+                    for value in (unlock_date, expiry_date)
+                )
+                rows.append((
+                    file_id,
+                    file_data['filename'],
+                    upload_date,
+                    unlock_date,
+                    expiry_date,  # 만료 날짜 추가
+                    json.dumps(file_data['allowed_users']),
+                    file_data['file_size'],
+                    file_data['mime_type'],
+                    file_data['uploader_id'],
+                    storage_id,
+                    file_data.get('content_hash'),
+                    len(set(file_data['allowed_users'])),
+                    unlock_ts,
+                    expiry_ts,
+                    storage_id, file_id, storage_id
+                ))
             
-            cursor.execute('''
+            # 공유 객체는 삭제 대기열 밖의 참조가 남아 있을 때만 연결 (확인과 삽입을 한 문장으로)
+            conn.executemany('''
                 INSERT INTO files 
-                (id, filename, upload_date, unlock_date, expiry_date, allowed_users, file_size, mime_type, uploader_id)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                file_id,
-                file_data['filename'],
-                current_time.strftime('%Y-%m-%d %H:%M:%S'),
-                self.format_date(file_data['unlock_date']),
-                expiry_date,  # 만료 날짜 추가
-                json.dumps(file_data['allowed_users']),
-                file_data['file_size'],
-                file_data['mime_type'],
-                file_data['uploader_id']
-            ))
+                (id, filename, upload_date, unlock_date, expiry_date, allowed_users, file_size, mime_type,
+                 uploader_id, storage_id, content_hash, remaining_downloads, unlock_ts, expiry_ts)
+                SELECT ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?
+                WHERE ? = ? OR EXISTS (
+                    SELECT 1 FROM files g WHERE g.storage_id = ?
+                    AND NOT EXISTS (SELECT 1 FROM deletion_queue q WHERE q.file_id = g.id)
+                )
+            ''', rows)
+
+            added = set()
+            file_ids = [file_id for file_id, _ in entries]
+            for i in range(0, len(file_ids), 500):
+                batch = file_ids[i:i + 500]
+                placeholders = ','.join('?' * len(batch))
+                added.update(row[0] for row in conn.execute(
+                    f"SELECT id FROM files WHERE id IN ({placeholders})", batch
+                ))
+            entries = [(file_id, file_data) for file_id, file_data in entries if file_id in added]
             
-            for user_id in file_data['allowed_users']:
-                cursor.execute('''
-                    INSERT INTO download_tracking (file_id, user_id, downloaded)
-                    VALUES (?, ?, 0)
-                ''', (file_id, user_id))
+            conn.executemany('''
+                INSERT INTO download_tracking (file_id, user_id, downloaded)
+                VALUES (?, ?, 0)
+            ''', [(file_id, user_id) for file_id, file_data in entries for user_id in set(file_data['allowed_users'])])
+
+            conn.executemany('''
+                INSERT OR IGNORE INTO capsule_recipients (user_id, file_id, upload_date)
+                VALUES (?, ?, ?)
+            ''', [(user_id, file_id, upload_date) for file_id, file_data in entries
+                  for user_id in file_data['allowed_users']])
+
+            self._bump_listing_versions(
+                conn, [user_id for _, file_data in entries for user_id in file_data['allowed_users']]
+            )
+            self._record_events(conn, 'capsule_added', [file_id for file_id, _ in entries])
             
-            return file_id
+            return [file_id for file_id, _ in entries]
 
     def delete_file(self, file_id: str) -> bool:
         with self.get_connection() as conn:
             cursor = conn.cursor()
+            cursor.execute("DELETE FROM capsule_recipients WHERE file_id = ?", (file_id,))
+            cursor.execute("DELETE FROM download_tracking WHERE file_id = ?", (file_id,))
             cursor.execute("DELETE FROM files WHERE id = ?", (file_id,))
             return cursor.rowcount > 0
 
-    def check_and_update_download(self, file_id: str, user_id: str) -> bool:
+    def get_capsule_meta(self, file_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Immutable metadata and recipients of a live capsule, or None if it is
+        missing or queued for deletion
+        """
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # 다운로드 상태 확인
-            cursor.execute('''
-                SELECT downloaded FROM download_tracking
-                WHERE file_id = ? AND user_id = ?
-            ''', (file_id, user_id))
-            
-            result = cursor.fetchone()
-            if not result or result[0] == 1:
-                return False
-            
-            # 다운로드 상태 업데이트
-            cursor.execute('''
+            row = conn.execute('''
+                SELECT f.id, f.filename, f.file_size, f.mime_type, COALESCE(f.storage_id, f.id) AS storage_id,
+                       f.uploader_id, f.unlock_ts, f.expiry_ts, f.allowed_users
+                FROM files f
+                WHERE f.id = ?
+                AND NOT EXISTS (SELECT 1 FROM deletion_queue q WHERE q.file_id = f.id)
+            ''', (file_id,)).fetchone()
+            if not row:
+                return None
+            meta = dict(row)
+            # 수신자 목록은 행 하나의 JSON으로 읽음 (수신자 인덱스를 행마다 조회하는 것보다 빠름)
+            meta['recipients'] = json.loads(meta.pop('allowed_users') or '[]')
+            return meta
+
+    def record_download(self, file_id: str, user_id: str) -> bool:
+        """
+        Mark ``user_id``'s download of ``file_id`` and, if they were the last
+        recipient still to download it, queue the capsule for deletion in the
+        same transaction. Returns True only for the call that queued it.
+        """
+        with self.get_connection() as conn:
+            # 첫 문장이 쓰기이므로 트랜잭션 시작부터 쓰기 잠금을 잡아 동시 호출이 직렬화됨
+            marked = conn.execute('''
                 UPDATE download_tracking
                 SET downloaded = 1, download_date = ?
-                WHERE file_id = ? AND user_id = ?
-            ''', (datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'), file_id, user_id))
-            
-            # 모든 수신자가 다운로드했는지 확인
-            cursor.execute('''
-                SELECT COUNT(*) FROM download_tracking
-                WHERE file_id = ? AND downloaded = 0
-            ''', (file_id,))
-            
-            remaining_downloads = cursor.fetchone()[0]
-            return remaining_downloads == 0  # 모든 수신자가 다운로드했으면 True 반환
+                WHERE file_id = ? AND user_id = ? AND downloaded = 0
+            ''', (datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'), file_id, user_id)).rowcount
+            if not marked:
+                return False
+
+            row = conn.execute('''
+                UPDATE files SET remaining_downloads = remaining_downloads - 1
+                WHERE id = ?
+                RETURNING remaining_downloads
+            ''', (file_id,)).fetchone()
+            # 모든 수신자가 다운로드했으면 삭제 대기열에 추가
+            if not row or row[0] > 0:
+                return False
+            return bool(self._enqueue_deletions(conn, [file_id], 'downloaded'))
 
     def check_expired_files(self) -> List[str]:
         with self.get_connection() as conn:
@@ -196,4 +657,255 @@ class Database:
             cursor = conn.cursor()
             for file_id in file_ids:
                 cursor.execute('DELETE FROM files WHERE id = ?', (file_id,))
-                cursor.execute('DELETE FROM download_tracking WHERE file_id = ?', (file_id,))
\ No newline at end of file
+                cursor.execute('DELETE FROM download_tracking WHERE file_id = ?', (file_id,))
+                cursor.execute('DELETE FROM capsule_recipients WHERE file_id = ?', (file_id,))
+
+    def create_upload_session(self, session_id: str, upload_url: str, upload_length: int,
+                              file_data: Dict[str, Any], content_hash_state: Optional[str] = None) -> str:
+        with self.get_connection() as conn:
+            current_time = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+            conn.execute('''
+                INSERT INTO upload_sessions
+                (id, upload_url, upload_offset, upload_length, file_data, uploader_id, created_at, updated_at,
+                 content_hash_state)
+                VALUES (?, ?, 0, ?, ?, ?, ?, ?, ?)
+            ''', (
+                session_id,
+                upload_url,
+                upload_length,
+                json.dumps(file_data),
+                file_data['uploader_id'],
+                current_time,
+                current_time,
+                content_hash_state
+            ))
+            return session_id
+
+    def get_upload_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self.get_connection() as conn:
+            row = conn.execute('''
+                SELECT * FROM upload_sessions WHERE id = ?
+            ''', (session_id,)).fetchone()
+            if not row:
+                return None
+
+            return {
+                'id': row['id'],
+                'upload_url': row['upload_url'],
+                'upload_offset': row['upload_offset'],
+                'upload_length': row['upload_length'],
+                'file_data': json.loads(row['file_data']),
+                'uploader_id': row['uploader_id'],
+                'created_at': row['created_at'],
+                'updated_at': row['updated_at'],
+                'content_hash_state': row['content_hash_state']
+            }
+
+    def update_upload_offset(self, session_id: str, expected_offset: int, new_offset: int,
+                             content_hash_state: Optional[str] = None) -> bool:
+        """Advance a session's offset (and its content hash state) only if nobody else has moved it"""
+        with self.get_connection() as conn:
+            cursor = conn.execute('''
+                UPDATE upload_sessions
+                SET upload_offset = ?, content_hash_state = ?, updated_at = ?
+                WHERE id = ? AND upload_offset = ?
+            ''', (
+                new_offset,
+                content_hash_state,
+                datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+                session_id,
+                expected_offset
+            ))
+            return cursor.rowcount > 0
+
+    def delete_upload_session(self, session_id: str) -> bool:
+        with self.get_connection() as conn:
+            cursor = conn.execute("DELETE FROM upload_sessions WHERE id = ?", (session_id,))
+            return cursor.rowcount > 0
+
+    def delete_stale_upload_sessions(self, older_than: datetime) -> int:
+        with self.get_connection() as conn:
+            cursor = conn.execute('''
+                DELETE FROM upload_sessions WHERE updated_at < ?
+            ''', (older_than.strftime('%Y-%m-%d %H:%M:%S'),))
+            return cursor.rowcount
+
+    def get_expired_file_ids(self, now: datetime) -> List[str]:
+        """Expired capsules that are not already waiting for deletion"""
+        with self.get_connection() as conn:
+            rows = conn.execute('''
+                SELECT id FROM files
+                WHERE expiry_date < ?
+                AND NOT EXISTS (SELECT 1 FROM deletion_queue q WHERE q.file_id = files.id)
+            ''', (now.strftime('%Y-%m-%d %H:%M:%S'),)).fetchall()
+            return [row[0] for row in rows]
+
+    def enqueue_deletions(self, file_ids: List[str], reason: str) -> int:
+        with self.get_connection() as conn:
+            return self._enqueue_deletions(conn, file_ids, reason)
+
+    def _enqueue_deletions(self, conn: sqlite3.Connection, file_ids: List[str], reason: str) -> int:
+        current_time = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        added = [file_id for file_id in file_ids if conn.execute('''
+            INSERT OR IGNORE INTO deletion_queue (file_id, reason, requested_at, next_attempt_at)
+            VALUES (?, ?, ?, ?)
+        ''', (file_id, reason, current_time, current_time)).rowcount]
+        # 대기 중인 캡슐은 목록에서 빠지므로 수신자 목록 버전 증가
+        self._bump_listing_versions_for_files(conn, file_ids)
+        # 이미 대기 중이던 캡슐은 다시 알리지 않음
+        self._record_events(conn, 'capsule_deleted', added)
+        return len(added)
+
+    def get_due_deletions(self, now: datetime, limit: int) -> List[Dict[str, Any]]:
+        with self.get_connection() as conn:
+            rows = conn.execute('''
+                SELECT q.file_id, q.reason, q.status, q.attempts,
+                       COALESCE(f.storage_id, q.file_id) AS storage_id
+                FROM deletion_queue q
+                LEFT JOIN files f ON f.id = q.file_id
+                WHERE q.next_attempt_at <= ?
+                ORDER BY q.next_attempt_at
+                LIMIT ?
+            ''', (now.strftime('%Y-%m-%d %H:%M:%S'), limit)).fetchall()
+            return [dict(row) for row in rows]
+
+    def get_live_storage_ids(self, storage_ids: List[str]) -> set:
+        """Storage ids still referenced by a capsule that is not queued for deletion"""
+        live = set()
+        with self.get_connection() as conn:
+            for i in range(0, len(storage_ids), 500):
+                batch = storage_ids[i:i + 500]
+                placeholders = ','.join('?' * len(batch))
+                rows = conn.execute(f'''
+                    SELECT DISTINCT f.storage_id FROM files f
+                    WHERE f.storage_id IN ({placeholders})
+                    AND NOT EXISTS (SELECT 1 FROM deletion_queue q WHERE q.file_id = f.id)
+                ''', batch).fetchall()
+                live.update(row[0] for row in rows)
+        return live
+
+    def reschedule_deletion(self, file_id: str, error: str, next_attempt: datetime):
+        with self.get_connection() as conn:
+            conn.execute('''
+                UPDATE deletion_queue
+                SET attempts = attempts + 1, last_error = ?, next_attempt_at = ?
+                WHERE file_id = ?
+            ''', (error, next_attempt.strftime('%Y-%m-%d %H:%M:%S'), file_id))
+
+    def complete_deletions(self, file_ids: List[str]):
+        """Remove confirmed remote deletions from the queue and the capsule tables"""
+        with self.get_connection() as conn:
+            params = [(file_id,) for file_id in file_ids]
+            conn.executemany("DELETE FROM capsule_recipients WHERE file_id = ?", params)
+            conn.executemany("DELETE FROM download_tracking WHERE file_id = ?", params)
+            conn.executemany("DELETE FROM files WHERE id = ?", params)
+            conn.executemany("DELETE FROM deletion_queue WHERE file_id = ?", params)
+
+    def get_deadlines(self, until: datetime) -> List[Tuple[str, str, str]]:
+        """Unlock and expiry deadlines up to ``until`` as (file_id, kind, date) tuples"""
+        until_str = until.strftime('%Y-%m-%d %H:%M:%S')
+        with self.get_connection() as conn:
+            unlocks = conn.execute('''
+                SELECT id, 'unlock', unlock_date FROM files
+                WHERE unlocked = 0 AND unlock_date <= ?
+            ''', (until_str,)).fetchall()
+            expiries = conn.execute('''
+                SELECT id, 'expiry', expiry_date FROM files
+                WHERE expiry_date <= ?
+            ''', (until_str,)).fetchall()
+            return [tuple(row) for row in unlocks] + [tuple(row) for row in expiries]
+
+    def mark_unlocked(self, now: datetime) -> List[str]:
+        """Flip ``unlocked`` for capsules whose unlock date has passed"""
+        with self.get_connection() as conn:
+            rows = conn.execute('''
+                UPDATE files SET unlocked = 1
+                WHERE unlocked = 0 AND unlock_date <= ?
+                RETURNING id
+            ''', (now.strftime('%Y-%m-%d %H:%M:%S'),)).fetchall()
+            file_ids = [row[0] for row in rows]
+            self._bump_listing_versions_for_files(conn, file_ids)
+            self._record_events(conn, 'capsule_unlocked', file_ids)
+            return file_ids
+
+    def get_prefetch_candidates(self, file_ids: List[str], max_size: int) -> List[Tuple[str, int, int]]:
+        """(storage_id, file_size, recipient_count) of live capsules no larger than ``max_size``"""
+        candidates = []
+        with self.get_connection() as conn:
+            for i in range(0, len(file_ids), 500):
+                batch = file_ids[i:i + 500]
+                placeholders = ','.join('?' * len(batch))
+                rows = conn.execute(f'''
+                    SELECT f.storage_id, f.file_size, COUNT(r.user_id)
+                    FROM files f
+                    JOIN capsule_recipients r ON r.file_id = f.id
+                    WHERE f.id IN ({placeholders}) AND f.file_size <= ?
+                    AND NOT EXISTS (SELECT 1 FROM deletion_queue q WHERE q.file_id = f.id)
+                    GROUP BY f.id
+                ''', batch + [max_size]).fetchall()
+                candidates.extend(tuple(row) for row in rows)
+        return candidates
+
+    def get_recipients(self, file_ids: List[str]) -> List[str]:
+        """Distinct recipients of the given capsules"""
+        recipients = set()
+        with self.get_connection() as conn:
+            # SQLite 변수 개수 제한을 넘지 않도록 나눠서 조회
+            for i in range(0, len(file_ids), 500):
+                batch = file_ids[i:i + 500]
+                placeholders = ','.join('?' * len(batch))
+                rows = conn.execute(f'''
+                    SELECT DISTINCT user_id FROM capsule_recipients
+                    WHERE file_id IN ({placeholders})
+                ''', batch).fetchall()
+                recipients.update(row[0] for row in rows)
+        return list(recipients)
+
+    def acquire_lease(self, name: str, holder: str, ttl: float, now: float) -> bool:
+        """Take or renew the named lease; succeeds if it is free, expired or already ours"""
+        with self.get_connection() as conn:
+            row = conn.execute('''
+                INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at
+                WHERE leases.holder = excluded.holder OR leases.expires_at <= ?
+                RETURNING holder
+            ''', (name, holder, now + ttl, now)).fetchone()
+            return row is not None
+
+    def release_lease(self, name: str, holder: str) -> bool:
+        with self.get_connection() as conn:
+            cursor = conn.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (name, holder))
+            return cursor.rowcount > 0
+
+    def get_lease(self, name: str) -> Optional[Dict[str, Any]]:
+        with self.get_connection() as conn:
+            row = conn.execute("SELECT holder, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+            return {'holder': row['holder'], 'expires_at': row['expires_at']} if row else None
+
+    def get_last_event_id(self) -> int:
+        with self.get_connection() as conn:
+            return conn.execute("SELECT COALESCE(MAX(id), 0) FROM capsule_events").fetchone()[0]
+
+    def get_events_after(self, last_id: int, limit: int = 1000,
+                         user_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Events with id > ``last_id`` in id order, for every user or just ``user_id``"""
+        with self.get_connection() as conn:
+            if user_id is None:
+                rows = conn.execute('''
+                    SELECT id, user_id, type, file_id FROM capsule_events
+                    WHERE id > ? ORDER BY id LIMIT ?
+                ''', (last_id, limit)).fetchall()
+            else:
+                rows = conn.execute('''
+                    SELECT id, user_id, type, file_id FROM capsule_events
+                    WHERE user_id = ? AND id > ? ORDER BY id LIMIT ?
+                ''', (user_id, last_id, limit)).fetchall()
+            return [dict(row) for row in rows]
+
+    def prune_events(self, older_than: datetime) -> int:
+        with self.get_connection() as conn:
+            cursor = conn.execute(
+                "DELETE FROM capsule_events WHERE created_at < ?",
+                (older_than.strftime('%Y-%m-%d %H:%M:%S'),)
+            )
+            return cursor.rowcount
@@ -0,0 +1,182 @@
+import heapq
+import itertools
+import logging
+import threading
+from datetime import datetime, timezone, timedelta
+from typing import Callable, Dict, List, Optional
+
+from database import Database
+from metrics import SCHEDULER_RUN_SECONDS
+
+logger = logging.getLogger(__name__)
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+def parse_timestamp(value: str) -> float:
+    return datetime.strptime(value, DATE_FORMAT).replace(tzinfo=timezone.utc).timestamp()
+
+class DeadlineScheduler:
+    """
+    Fires capsule unlock and expiry events at their exact deadlines, and
+    optionally a prewarm event ``prewarm_lead`` before each unlock.
+
+    Upcoming deadlines within ``horizon`` are kept in a min-heap and the
+    worker thread sleeps until the earliest one. New capsules are pushed as
+    they are added and deleted capsules are discarded lazily, so the table
+    is only re-read (through the unlock/expiry indexes) when the horizon
+    rolls over.
+
+    Every worker keeps the heap, but events fire only while ``is_leader``
+    returns True, so the writes they trigger happen in one process. A
+    process that becomes leader calls ``catch_up`` for deadlines that
+    passed in between.
+    """
+    def __init__(self, db: Database, on_unlocked: Optional[Callable[[List[str]], None]] = None,
+                 on_expired: Optional[Callable[[], None]] = None,
+                 horizon: timedelta = timedelta(hours=24),
+                 on_prewarm: Optional[Callable[[List[str]], None]] = None,
+                 prewarm_lead: timedelta = timedelta(0),
+                 is_leader: Optional[Callable[[], bool]] = None):
+        self.db = db
+        self.is_leader = is_leader
+        self.on_unlocked = on_unlocked
+        self.on_expired = on_expired
+        self.horizon = horizon
+        self.on_prewarm = on_prewarm
+        self.prewarm_lead = prewarm_lead.total_seconds() if on_prewarm else 0.0
+
+        self._heap: List[list] = []
+        self._entries: Dict[str, List[list]] = {}
+        self._counter = itertools.count()
+        self._loaded_until = 0.0
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+
+    def _push(self, timestamp: float, kind: str, file_id: str):
+        entry = [timestamp, next(self._counter), kind, file_id, True]
+        heapq.heappush(self._heap, entry)
+        self._entries.setdefault(file_id, []).append(entry)
+
+    def _schedule(self, timestamp: float, kind: str, file_id: str, until: float):
+        # 로드 범위 밖의 마감은 다음 재로드 때 읽어옴
+        if timestamp <= until:
+            self._push(timestamp, kind, file_id)
+        # 이미 잠금 해제된 캡슐은 미리 받을 필요 없음
+        if (kind == 'unlock' and self.prewarm_lead and timestamp - self.prewarm_lead <= until
+                and timestamp > datetime.now(timezone.utc).timestamp()):
+            self._push(timestamp - self.prewarm_lead, 'prewarm', file_id)
+
+    def _reload(self, now: float):
+        until = now + self.horizon.total_seconds()
+        # 범위 직후에 잠금 해제되는 캡슐도 미리 받아둘 수 있도록 리드 타임만큼 더 읽음
+        deadlines = self.db.get_deadlines(datetime.fromtimestamp(until + self.prewarm_lead, timezone.utc))
+
+        self._heap = []
+        self._entries = {}
+        for file_id, kind, value in deadlines:
+            self._schedule(parse_timestamp(value), kind, file_id, until)
+        self._loaded_until = until
+
+    def add(self, file_id: str, unlock_date: str, expiry_date: str):
+        """Track a newly added capsule"""
+        with self._condition:
+            for kind, value in (('unlock', unlock_date), ('expiry', expiry_date)):
+                self._schedule(parse_timestamp(value), kind, file_id, self._loaded_until)
+            self._condition.notify()
+
+    def discard(self, file_ids: List[str]):
+        """Forget deadlines of deleted capsules"""
+        with self._condition:
+            for file_id in file_ids:
+                for entry in self._entries.pop(file_id, []):
+                    entry[4] = False
+
+    def _pop_due(self, now: float) -> Dict[str, List[str]]:
+        due: Dict[str, List[str]] = {'prewarm': [], 'unlock': [], 'expiry': []}
+        while self._heap and self._heap[0][0] <= now:
+            timestamp, _, kind, file_id, active = heapq.heappop(self._heap)
+            if not active:
+                continue
+            entries = self._entries.get(file_id, [])
+            self._entries[file_id] = [e for e in entries if e[2] != kind]
+            if not self._entries[file_id]:
+                del self._entries[file_id]
+            due[kind].append(file_id)
+        return due
+
+    def _leading(self) -> bool:
+        return self.is_leader is None or self.is_leader()
+
+    def _fire(self, due: Dict[str, List[str]]):
+        # 리더가 아닌 워커는 마감만 소비 (잠금 해제/만료 이벤트는 다른 워커에 이벤트 로그로 전달됨)
+        if not self._leading():
+            return
+        now = datetime.now(timezone.utc)
+        if due['prewarm'] and self.on_prewarm:
+            self.on_prewarm(due['prewarm'])
+        if due['unlock']:
+            unlocked = self.db.mark_unlocked(now)
+            if unlocked and self.on_unlocked:
+                self.on_unlocked(unlocked)
+        if due['expiry'] and self.on_expired:
+            self.on_expired()
+
+    def _next_wakeup(self, now: float) -> float:
+        while self._heap and not self._heap[0][4]:
+            heapq.heappop(self._heap)
+        next_deadline = self._heap[0][0] if self._heap else self._loaded_until
+        return max(0.0, min(next_deadline, self._loaded_until) - now)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if self._stopped:
+                    return
+                now = datetime.now(timezone.utc).timestamp()
+                if now >= self._loaded_until:
+                    self._reload(now)
+                due = self._pop_due(now)
+                if not any(due.values()):
+                    self._condition.wait(self._next_wakeup(now))
+                    continue
+
+            try:
+                with SCHEDULER_RUN_SECONDS.time(job='deadlines'):
+                    self._fire(due)
+            except Exception:
+                logger.exception("Deadline scheduler error")
+
+    def catch_up(self):
+        """Handle unlock and expiry deadlines that passed while no process was firing them"""
+        if not self._leading():
+            return
+        unlocked = self.db.mark_unlocked(datetime.now(timezone.utc))
+        if unlocked and self.on_unlocked:
+            self.on_unlocked(unlocked)
+        if self.on_expired:
+            self.on_expired()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        # 재시작 사이에 지난 마감 처리
+        self.catch_up()
+
+        self._thread = threading.Thread(target=self._run, name="deadline-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def stats(self) -> Dict[str, int]:
+        with self._condition:
+            return {
+                'heap_size': len(self._heap),
+                'tracked_capsules': len(self._entries)
+            }
@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import threading
+from datetime import datetime, timezone, timedelta
+from typing import Callable, List, Optional
+
+from database import Database
+from metrics import SCHEDULER_RUN_SECONDS
+from storage import StorageBackend, StorageError
+
+logger = logging.getLogger(__name__)
+
+class DeletionQueue:
+    """
+    Persistent queue of remote capsule deletions.
+
+    Each batch goes to the backend's ``delete_many``, which trashes the
+    files and empties the trash once. A capsule's DB rows are removed only
+    after its object is confirmed deleted, and failures are retried with
+    backoff. Retries are idempotent: trashing a file again is harmless, and
+    an object that is already gone counts as deleted.
+
+    Deduplicated capsules share one storage object (``storage_id``). The
+    object is trashed only once every capsule referencing it is queued;
+    until then a deletion just drops the capsule's reference.
+    """
+    def __init__(self, db: Database, client: StorageBackend, batch_size: int = 100,
+                 poll_interval: float = 30, max_backoff: float = 3600,
+                 on_deleted: Optional[Callable[[List[str]], None]] = None,
+                 on_released: Optional[Callable[[List[str]], None]] = None):
+        self.db = db
+        self.client = client
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_backoff = max_backoff
+        self.on_deleted = on_deleted
+        self.on_released = on_released
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._drain_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def enqueue(self, file_ids: List[str], reason: str) -> int:
+        if not file_ids:
+            return 0
+        added = self.db.enqueue_deletions(file_ids, reason)
+        self.wake()
+        return added
+
+    def wake(self):
+        """Process due deletions now instead of at the next poll (e.g. after queueing them directly in the database)"""
+        self._wakeup.set()
+
+    def _reschedule(self, file_id: str, attempts: int, error: str):
+        delay = min(self.max_backoff, 30 * (2 ** attempts))
+        next_attempt = datetime.now(timezone.utc) + timedelta(seconds=delay)
+        self.db.reschedule_deletion(file_id, error, next_attempt)
+        logger.warning("Deletion failed", extra={'file_id': file_id, 'attempt': attempts + 1, 'error': error})
+
+    def _complete(self, file_ids: List[str], storage_ids: List[str]) -> int:
+        if not file_ids:
+            return 0
+        self.db.complete_deletions(file_ids)
+        if storage_ids and self.on_released:
+            self.on_released(storage_ids)
+        if self.on_deleted:
+            self.on_deleted(file_ids)
+        return len(file_ids)
+
+    async def process_batch(self) -> int:
+        """Process one batch of due deletions and return how many were confirmed"""
+        due = self.db.get_due_deletions(datetime.now(timezone.utc), self.batch_size)
+        if not due:
+            return 0
+
+        # 다른 캡슐이 아직 참조하는 객체는 원격 삭제 없이 참조만 해제
+        live = self.db.get_live_storage_ids(list({item['storage_id'] for item in due}))
+        released = [item['file_id'] for item in due if item['storage_id'] in live]
+        due = [item for item in due if item['storage_id'] not in live]
+        completed = self._complete(released, [])
+
+        if not due:
+            return completed
+
+        try:
+            errors = await self.client.delete_many(item['storage_id'] for item in due)
+        except StorageError as e:
+            errors = {item['storage_id']: e for item in due}
+
+        deleted = []
+        for item in due:
+            error = errors.get(item['storage_id'])
+            if error is not None:
+                self._reschedule(item['file_id'], item['attempts'], error.message)
+            else:
+                deleted.append(item)
+
+        return completed + self._complete(
+            [item['file_id'] for item in deleted],
+            list({item['storage_id'] for item in deleted})
+        )
+
+    def drain(self) -> int:
+        """Process due deletions until none are left; safe to call from any non-client thread"""
+        total = 0
+        with self._drain_lock:
+            while True:
+                with SCHEDULER_RUN_SECONDS.time(job='deletion_batch'):
+                    processed = self.client.run(self.process_batch())
+                total += processed
+                if not processed:
+                    return total
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self.drain()
+            except Exception:
+                logger.exception("Deletion queue error")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def start(self):
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="deletion-queue", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
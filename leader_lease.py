@@ -0,0 +1,98 @@
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Callable, Optional
+
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+class LeaderLease:
+    """
+    Elects one process to run maintenance jobs through a lease row in the
+    capsule database.
+
+    Every participating process tries to take or renew the lease every
+    ``ttl / 3`` seconds. The holder keeps it while it keeps renewing; if it
+    dies, another process takes over once the lease expires. A holder that
+    cannot renew steps down before its lease runs out, so two processes
+    never believe they are leader at the same time.
+    """
+    def __init__(self, db: Database, name: str, ttl: float = 30,
+                 on_elected: Optional[Callable[[], None]] = None,
+                 on_demoted: Optional[Callable[[], None]] = None):
+        self.db = db
+        self.name = name
+        self.ttl = ttl
+        self.renew_interval = ttl / 3
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self._valid_until = 0.0
+        self._leader = False
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def is_leader(self) -> bool:
+        # 갱신이 늦어진 경우에도 임대가 남아 있는 동안만 리더로 간주
+        return self._leader and time.monotonic() < self._valid_until
+
+    def _set_leader(self, leader: bool):
+        if leader == self._leader:
+            return
+        self._leader = leader
+        logger.info("Maintenance leadership " + ("acquired" if leader else "lost"),
+                    extra={'lease': self.name, 'holder': self.holder})
+        callback = self.on_elected if leader else self.on_demoted
+        if callback:
+            try:
+                callback()
+            except Exception:
+                logger.exception("Leadership callback failed", extra={'lease': self.name})
+
+    def renew(self) -> bool:
+        """Try to take or renew the lease once; returns whether this process is leader"""
+        with self._lock:
+            started = time.monotonic()
+            try:
+                acquired = self.db.acquire_lease(self.name, self.holder, self.ttl, time.time())
+            except Exception:
+                logger.exception("Lease renewal failed", extra={'lease': self.name})
+                acquired = False
+            if acquired:
+                # 요청을 보낸 시점부터 계산하고 한 주기만큼 여유를 두어 만료 전에 물러남
+                self._valid_until = started + self.ttl - self.renew_interval
+            self._set_leader(acquired or self.is_leader)
+            return self._leader
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self.renew()
+            self._stopped.wait(self.renew_interval)
+
+    def start(self):
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name=f"lease-{self.name}", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop renewing and hand the lease over immediately if held"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        with self._lock:
+            if not self._leader:
+                return
+            self._valid_until = 0.0
+            self._set_leader(False)
+            try:
+                self.db.release_lease(self.name, self.holder)
+            except Exception:
+                logger.exception("Lease release failed", extra={'lease': self.name})
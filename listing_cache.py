@@ -0,0 +1,102 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional, Tuple
+
+from cachetools import TTLCache
+
+class _CountingTTLCache(TTLCache):
+    """TTLCache that counts entries dropped to make room (LRU evictions)"""
+    def __init__(self, maxsize: int, ttl: float):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self.evictions = 0
+
+    def popitem(self):
+        item = super().popitem()
+        self.evictions += 1
+        return item
+
+class _UserListing:
+    __slots__ = ('version', 'pages')
+
+    def __init__(self, version: int):
+        self.version = version
+        self.pages: "OrderedDict[Hashable, Any]" = OrderedDict()
+
+class ListingCache:
+    """
+    Per-user cache of /api/files listing pages, tagged with the user's
+    listing version (used as the ETag).
+
+    Entries are invalidated only for the recipients of a capsule that
+    changed, so TTLs can be long; changes made by other workers arrive
+    through the event log (on_events). Each fill is tagged with a generation
+    read before the database query; an invalidation that lands while the
+    query is running bumps the generation and the stale result is dropped
+    instead of being cached.
+    """
+    def __init__(self, maxsize: int = 10000, ttl: float = 300, generation_buckets: int = 4096,
+                 pages_per_user: int = 16):
+        self._cache = _CountingTTLCache(maxsize, ttl)
+        self.pages_per_user = pages_per_user
+        self._generations = [0] * generation_buckets
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _bucket(self, user_id: str) -> int:
+        return hash(user_id) % len(self._generations)
+
+    def lookup(self, user_id: str, page_key: Hashable) -> Tuple[Any, Optional[int], int]:
+        """Return (cached page or None, cached version or None, generation token for store())"""
+        with self._lock:
+            entry = self._cache.get(user_id)
+            page = entry.pages.get(page_key) if entry is not None else None
+            if page is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            version = entry.version if entry is not None else None
+            return page, version, self._generations[self._bucket(user_id)]
+
+    def store(self, user_id: str, page_key: Hashable, page: Any, version: int, generation: int):
+        with self._lock:
+            if self._generations[self._bucket(user_id)] != generation:
+                return
+            entry = self._cache.get(user_id)
+            if entry is None or entry.version != version:
+                entry = _UserListing(version)
+                self._cache[user_id] = entry
+            entry.pages[page_key] = page
+            if len(entry.pages) > self.pages_per_user:
+                entry.pages.popitem(last=False)
+
+    def invalidate(self, user_ids: Iterable[str]):
+        with self._lock:
+            for user_id in set(user_ids):
+                self._generations[self._bucket(user_id)] += 1
+                self._cache.pop(user_id, None)
+                self.invalidations += 1
+
+    def on_events(self, events: Iterable[Dict[str, Any]]):
+        """EventBus listener: drop listings changed by any worker (every event is for one recipient)"""
+        self.invalidate(event['user_id'] for event in events)
+
+    def clear(self):
+        with self._lock:
+            self._generations = [generation + 1 for generation in self._generations]
+            self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._cache),
+                'maxsize': self._cache.maxsize,
+                'ttl': self._cache.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self._cache.evictions,
+                'invalidations': self.invalidations
+            }
@@ -0,0 +1,310 @@
+import asyncio
+import io
+import os
+import re
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from typing import Any, BinaryIO, Coroutine, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from storage import StorageBackend, StorageDownload, StorageError
+
+STORAGE_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+RANGE_PATTERN = re.compile(r'bytes=(\d*)-(\d*)')
+COPY_CHUNK_SIZE = 1024 * 1024
+
+class LocalDownload(StorageDownload):
+    """A ranged read of one stored object"""
+    def __init__(self, storage: "LocalStorage", file: Optional[BinaryIO], status: int,
+                 headers: Dict[str, str], remaining: int):
+        self.storage = storage
+        self.file = file
+        self.status = status
+        self.headers = headers
+        self.remaining = remaining
+
+    def _read(self, chunk_size: int) -> bytes:
+        if self.file is None or self.remaining <= 0:
+            return b''
+        chunk = self.file.read(min(chunk_size, self.remaining))
+        self.remaining -= len(chunk)
+        return chunk
+
+    def iter_chunks(self, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        try:
+            while True:
+                chunk = self._read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            self.close()
+
+    async def read(self, chunk_size: int = 64 * 1024) -> bytes:
+        return await self.storage._io(self._read, chunk_size)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+class LocalStorage(StorageBackend):
+    """
+    Capsule contents as files under ``root``, for running without network
+    access and for keeping hot data on local disk.
+
+    Objects live in ``objects/ab/cd/<id>`` so no directory grows past a few
+    thousand entries. Writes go to ``uploads/`` and are renamed into place
+    after fsync, so a reader never sees a partial object. Uploads spooled
+    to disk are copied with os.sendfile, and reads are served by the
+    caller through ``local_path`` (send_file, i.e. the server's sendfile
+    path). Blocking file work runs on a small thread pool, so the
+    coroutines can be awaited from any event loop.
+    """
+    name = "local"
+
+    def __init__(self, root: str, threads: int = 8, fsync: bool = True):
+        # send_file은 상대 경로를 앱 디렉터리 기준으로 해석하므로 절대 경로로 보관
+        self.root = os.path.abspath(root)
+        self.objects_dir = os.path.join(self.root, 'objects')
+        self.uploads_dir = os.path.join(self.root, 'uploads')
+        self.trash_dir = os.path.join(self.root, 'trash')
+        self.threads = threads
+        self.fsync = fsync
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    # --- plumbing ---
+
+    async def _io(self, fn, *args):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="local-storage")
+            executor = self._executor
+        return await asyncio.wrap_future(executor.submit(fn, *args))
+
+    def run(self, coro: Coroutine):
+        return asyncio.run(coro)
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+    def _object_path(self, storage_id: str) -> str:
+        # 경로 조작을 막기 위해 이 저장소가 만든 형식의 ID만 허용
+        if not STORAGE_ID_PATTERN.fullmatch(storage_id):
+            raise StorageError("Capsule data not found", 404)
+        return os.path.join(self.objects_dir, storage_id[:2], storage_id[2:4], storage_id)
+
+    def local_path(self, storage_id: str) -> Optional[str]:
+        try:
+            path = self._object_path(storage_id)
+        except StorageError:
+            return None
+        return path if os.path.exists(path) else None
+
+    # --- writes ---
+
+    def _commit(self, fd: int, temp_path: str, storage_id: str):
+        if self.fsync:
+            os.fsync(fd)
+        path = self._object_path(storage_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_path, path)
+
+    def _copy(self, stream: BinaryIO, fd: int, length: Optional[int]) -> int:
+        # 디스크에 있는 스트림(스풀된 업로드)은 커널 안에서 복사, 메모리에 있는 것은 read/write
+        in_fd = None
+        if not isinstance(getattr(stream, '_file', stream), io.BytesIO):
+            try:
+                stream.flush()
+                in_fd = stream.fileno()
+            except (AttributeError, OSError, io.UnsupportedOperation):
+                in_fd = None
+
+        copied = 0
+        if in_fd is not None:
+            start = stream.tell()
+            try:
+                while length is None or copied < length:
+                    count = COPY_CHUNK_SIZE if length is None else min(COPY_CHUNK_SIZE, length - copied)
+                    sent = os.sendfile(fd, in_fd, start + copied, count)
+                    if not sent:
+                        break
+                    copied += sent
+                stream.seek(start + copied)
+            except OSError:
+                # sendfile을 지원하지 않는 파일 시스템이면 일반 복사로 처리
+                stream.seek(start + copied)
+                in_fd = None
+        if in_fd is None:
+            while length is None or copied < length:
+                chunk = stream.read(COPY_CHUNK_SIZE if length is None else min(COPY_CHUNK_SIZE, length - copied))
+                if not chunk:
+                    break
+                os.write(fd, chunk)
+                copied += len(chunk)
+
+        if length is not None and copied < length:
+            raise StorageError("Upload stream ended before the declared length", 400)
+        return copied
+
+    def _write(self, stream: BinaryIO, length: Optional[int]) -> str:
+        storage_id = uuid.uuid4().hex
+        os.makedirs(self.uploads_dir, exist_ok=True)
+        temp_path = os.path.join(self.uploads_dir, f"{storage_id}.tmp")
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            self._copy(stream, fd, length)
+            self._commit(fd, temp_path, storage_id)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        finally:
+            os.close(fd)
+        return storage_id
+
+    async def upload(self, stream: BinaryIO, metadata: Dict[str, Any], length: Optional[int] = None,
+                     chunk_size: int = 5 * 1024 * 1024, parallelism: int = 4) -> str:
+        return await self._io(self._write, stream, length)
+
+    # --- resumable uploads: location is "uploads/<length>/<id>" ---
+
+    def _parse_location(self, location: str) -> Tuple[int, str]:
+        try:
+            _, length, storage_id = location.split('/')
+            self._object_path(storage_id)
+            return int(length), storage_id
+        except ValueError:
+            raise StorageError("Upload not found", 404)
+
+    def _create_upload(self, length: int) -> str:
+        storage_id = uuid.uuid4().hex
+        os.makedirs(self.uploads_dir, exist_ok=True)
+        open(os.path.join(self.uploads_dir, f"{storage_id}.part"), 'xb').close()
+        location = f"uploads/{length}/{storage_id}"
+        if length == 0:
+            self._upload_chunk(location, 0, b'')
+        return location
+
+    async def create_upload(self, length: Optional[int], metadata: Dict[str, Any]) -> str:
+        if length is None:
+            raise StorageError("Resumable uploads need a declared length", 400)
+        return await self._io(self._create_upload, length)
+
+    def _upload_chunk(self, location: str, offset: int, chunk: bytes) -> int:
+        length, storage_id = self._parse_location(location)
+        temp_path = os.path.join(self.uploads_dir, f"{storage_id}.part")
+        try:
+            fd = os.open(temp_path, os.O_WRONLY)
+        except FileNotFoundError:
+            # 마지막 청크를 재전송한 경우 이미 완료된 업로드
+            if offset + len(chunk) == length and os.path.exists(self._object_path(storage_id)):
+                return length
+            raise StorageError("Upload not found", 404)
+        try:
+            size = os.fstat(fd).st_size
+            if size != offset:
+                raise StorageError(f"Upload offset mismatch: expected {size}", 409)
+            if offset + len(chunk) > length:
+                raise StorageError("Chunk exceeds the declared length", 413)
+            os.pwrite(fd, chunk, offset)
+            new_offset = offset + len(chunk)
+            if new_offset == length:
+                self._commit(fd, temp_path, storage_id)
+            return new_offset
+        finally:
+            os.close(fd)
+
+    async def upload_chunk(self, location: str, offset: int, chunk: bytes) -> int:
+        return await self._io(self._upload_chunk, location, offset, chunk)
+
+    # --- reads ---
+
+    def _open(self, storage_id: str, headers: Dict[str, str]) -> LocalDownload:
+        try:
+            file = open(self._object_path(storage_id), 'rb')
+        except FileNotFoundError:
+            raise StorageError("Capsule data not found", 404)
+        stat = os.fstat(file.fileno())
+        size = stat.st_size
+        response_headers = {
+            'Accept-Ranges': 'bytes',
+            'ETag': f'"{storage_id}"',
+            'Last-Modified': formatdate(stat.st_mtime, usegmt=True)
+        }
+
+        # If-Range가 현재 객체와 다르면 전체 본문 전송 (객체는 바뀌지 않으므로 ETag만 비교)
+        range_header = headers.get('Range')
+        if_range = headers.get('If-Range')
+        if range_header and if_range and if_range.strip() != response_headers['ETag']:
+            range_header = None
+
+        match = RANGE_PATTERN.fullmatch(range_header.strip()) if range_header else None
+        if not match or not (match.group(1) or match.group(2)):
+            response_headers['Content-Length'] = str(size)
+            return LocalDownload(self, file, 200, response_headers, size)
+
+        if match.group(1):
+            start = int(match.group(1))
+            end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+        else:
+            start = max(0, size - int(match.group(2)))
+            end = size - 1
+        if start >= size or start > end:
+            file.close()
+            response_headers['Content-Range'] = f"bytes */{size}"
+            return LocalDownload(self, None, 416, response_headers, 0)
+
+        file.seek(start)
+        response_headers['Content-Length'] = str(end - start + 1)
+        response_headers['Content-Range'] = f"bytes {start}-{end}/{size}"
+        return LocalDownload(self, file, 206, response_headers, end - start + 1)
+
+    async def download(self, storage_id: str, headers: Optional[Dict[str, str]] = None) -> LocalDownload:
+        return await self._io(self._open, storage_id, headers or {})
+
+    # --- deletion ---
+
+    def _trash(self, storage_id: str):
+        os.makedirs(self.trash_dir, exist_ok=True)
+        try:
+            os.replace(self._object_path(storage_id), os.path.join(self.trash_dir, storage_id))
+        except FileNotFoundError:
+            raise StorageError("Capsule data not found", 404)
+
+    async def trash(self, storage_id: str):
+        await self._io(self._trash, storage_id)
+
+    def _empty_trash(self):
+        try:
+            entries = list(os.scandir(self.trash_dir))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    async def empty_trash(self):
+        await self._io(self._empty_trash)
+
+    def _delete_many(self, storage_ids: List[str]) -> Dict[str, Optional[StorageError]]:
+        errors: Dict[str, Optional[StorageError]] = {}
+        for storage_id in storage_ids:
+            try:
+                self._trash(storage_id)
+                errors[storage_id] = None
+            except StorageError as e:
+                # 이미 없는 객체는 삭제된 것으로 간주
+                errors[storage_id] = e if e.status_code != 404 else None
+        self._empty_trash()
+        return errors
+
+    async def delete_many(self, storage_ids: Iterable[str]) -> Dict[str, Optional[StorageError]]:
+        return await self._io(self._delete_many, list(dict.fromkeys(storage_ids)))
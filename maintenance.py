@@ -0,0 +1,86 @@
+"""
+Run the maintenance jobs (remote deletions, expiry sweep) in their own process:
+
+    python maintenance.py            # run until stopped, taking the lease whenever it is free
+    python maintenance.py --once     # one sweep and deletion drain if the lease is free, then exit
+    python maintenance.py --status   # show which process holds the lease
+
+Web workers can then be started with TIMECAPSULE_MAINTENANCE=off. Several
+copies may run at once; only the lease holder does any work.
+"""
+import argparse
+import os
+import signal
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+os.environ.setdefault("TIMECAPSULE_SERVER", "worker")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--once', action='store_true', help="run one sweep and exit")
+    mode.add_argument('--status', action='store_true', help="print the current lease holder and exit")
+    return parser.parse_args()
+
+def run_forever(app):
+    stopped = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stopped.set())
+
+    app.start_services()
+    lease = app.maintenance_lease
+    interval = app.Config.EXPIRY_SWEEP_INTERVAL.total_seconds()
+    next_sweep = 0.0
+    try:
+        while not stopped.is_set():
+            # 리더가 되면 바로 한 번 정리하고 이후 주기적으로 실행
+            if lease.is_leader and time.monotonic() >= next_sweep:
+                try:
+                    app.check_expired_files()
+                except Exception:
+                    app.logger.exception("Expiry sweep failed")
+                next_sweep = time.monotonic() + interval
+            stopped.wait(lease.renew_interval)
+    finally:
+        app.stop_services()
+    return 0
+
+def run_once(app) -> int:
+    lease = app.maintenance_lease
+    if not lease.renew():
+        holder = app.db.get_lease(lease.name)
+        print(f"Maintenance lease is held by {holder['holder'] if holder else 'another process'}; nothing done")
+        return 1
+    try:
+        app.check_expired_files()
+    finally:
+        lease.stop()
+    return 0
+
+def show_status(app) -> int:
+    lease = app.db.get_lease(app.maintenance_lease.name)
+    if lease is None:
+        print("Maintenance lease is free")
+        return 1
+    expires = datetime.fromtimestamp(lease['expires_at'], timezone.utc)
+    state = "expired" if lease['expires_at'] <= time.time() else "held"
+    print(f"Maintenance lease {state} by {lease['holder']} until {expires:%Y-%m-%d %H:%M:%S} UTC")
+    return 0 if state == "held" else 1
+
+def main() -> int:
+    args = parse_args()
+    # 일회성 명령은 임대 갱신 스레드 없이 직접 처리
+    os.environ["TIMECAPSULE_MAINTENANCE"] = "off" if args.once or args.status else "elect"
+    import app
+
+    if args.status:
+        return show_status(app)
+    if args.once:
+        return run_once(app)
+    return run_forever(app)
+
+if __name__ == '__main__':
+    sys.exit(main())
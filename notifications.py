@@ -0,0 +1,162 @@
+import asyncio
+import collections
+import logging
+import threading
+from typing import Any, Callable, Deque, Dict, List, Optional, Set
+
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+class Subscription:
+    """
+    Events for one connected client. Can be waited on from a plain thread
+    (WSGI) or from an event loop (ASGI) without holding a thread.
+    """
+    def __init__(self, bus: "EventBus", user_id: str, max_queued: int):
+        self.bus = bus
+        self.user_id = user_id
+        self.max_queued = max_queued
+        self.overflowed = False
+        self._events: Deque[Dict[str, Any]] = collections.deque()
+        self._condition = threading.Condition()
+        self._waiters: List[tuple] = []
+
+    def put(self, event: Dict[str, Any]):
+        with self._condition:
+            if len(self._events) >= self.max_queued:
+                # 너무 느린 클라이언트는 끊고 Last-Event-ID로 다시 받게 함
+                self.overflowed = True
+            else:
+                self._events.append(event)
+            self._condition.notify()
+            waiters, self._waiters = self._waiters, []
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(waiter.set)
+
+    def _drain(self) -> List[Dict[str, Any]]:
+        events = list(self._events)
+        self._events.clear()
+        return events
+
+    def get(self, timeout: float) -> List[Dict[str, Any]]:
+        """Block until events arrive or ``timeout`` passes; returns [] on timeout"""
+        with self._condition:
+            if not self._events and not self.overflowed:
+                self._condition.wait(timeout)
+            return self._drain()
+
+    async def get_async(self, timeout: float) -> List[Dict[str, Any]]:
+        waiter = asyncio.Event()
+        with self._condition:
+            if self._events or self.overflowed:
+                return self._drain()
+            self._waiters.append((asyncio.get_running_loop(), waiter))
+        try:
+            await asyncio.wait_for(waiter.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        with self._condition:
+            return self._drain()
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+class EventBus:
+    """
+    Fans capsule events out to subscribed clients.
+
+    Events are written to the capsule_events table in the same transaction
+    as the change they describe, by whichever worker made it. Each process
+    tails that table from one thread, so delivery works across workers for
+    the cost of one indexed query per ``poll_interval``, however many
+    clients are connected. notify() makes the tailer poll right away
+    after a local write. ``listeners`` receive every batch read, whoever
+    it is for (e.g. to invalidate per-process caches).
+    """
+    def __init__(self, db: Database, poll_interval: float = 0.25, max_queued: int = 256,
+                 batch_size: int = 1000,
+                 listeners: Optional[List[Callable[[List[Dict[str, Any]]], None]]] = None):
+        self.db = db
+        self.listeners = listeners or []
+        self.poll_interval = poll_interval
+        self.max_queued = max_queued
+        self.batch_size = batch_size
+        self.last_id = 0
+        self.delivered = 0
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def subscribe(self, user_id: str) -> Subscription:
+        subscription = Subscription(self, user_id, self.max_queued)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def notify(self):
+        self._wakeup.set()
+
+    def poll(self) -> int:
+        """Deliver events written since the last poll; returns how many were read"""
+        events = self.db.get_events_after(self.last_id, self.batch_size)
+        if not events:
+            return 0
+        self.last_id = events[-1]['id']
+        for listener in self.listeners:
+            try:
+                listener(events)
+            except Exception:
+                logger.exception("Event listener failed")
+        with self._lock:
+            targets = [(event, list(self._subscribers.get(event['user_id'], ()))) for event in events]
+        for event, subscribers in targets:
+            for subscription in subscribers:
+                subscription.put(event)
+                self.delivered += 1
+        return len(events)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                # 한 번에 다 읽지 못했으면 기다리지 않고 이어서 읽음
+                if self.poll() == self.batch_size:
+                    continue
+            except Exception:
+                logger.exception("Event poll failed")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def start(self):
+        if self._thread is None:
+            # 시작 이전의 이벤트는 클라이언트가 Last-Event-ID로 직접 조회
+            self.last_id = self.db.get_last_event_id()
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="event-bus", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'users': len(self._subscribers),
+                'subscriptions': sum(len(subscribers) for subscribers in self._subscribers.values()),
+                'last_event_id': self.last_id,
+                'delivered': self.delivered
+            }
@@ -0,0 +1,133 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from blob_cache import BlobCache
+from database import Database
+from metrics import SCHEDULER_RUN_SECONDS
+
+logger = logging.getLogger(__name__)
+
+class _Throttle:
+    """Paces writes to a shared byte rate across all prefetch workers"""
+    def __init__(self, bytes_per_second: float):
+        self.bytes_per_second = bytes_per_second
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, size: int) -> float:
+        """Reserve ``size`` bytes of bandwidth and return how long to wait"""
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + size / self.bytes_per_second
+            return start - now
+
+class _ThrottledWriter:
+    def __init__(self, writer, throttle: _Throttle):
+        self.writer = writer
+        self.throttle = throttle
+
+    def write(self, data: bytes):
+        # 작업자 스레드의 자체 루프에서만 실행되므로 블로킹 대기로 충분
+        time.sleep(self.throttle.reserve(len(data)))
+        self.writer.write(data)
+
+class Prefetcher:
+    """
+    Pulls capsules into the blob cache shortly before they unlock, so the
+    burst of recipient downloads at unlock time is served locally.
+
+    Queued capsules are fetched by ``concurrency`` worker threads, those
+    with the most recipients first, at no more than ``bandwidth`` bytes
+    per second in total.
+    """
+    def __init__(self, db: Database, blob_cache: BlobCache,
+                 fill: Callable[[str, Any], Awaitable[None]], max_size: int,
+                 concurrency: int = 2, bandwidth: Optional[float] = None):
+        self.db = db
+        self.blob_cache = blob_cache
+        self.fill = fill
+        self.max_size = max_size
+        self.concurrency = concurrency
+        self.throttle = _Throttle(bandwidth) if bandwidth else None
+
+        self._heap: List[tuple] = []
+        self._queued = set()
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._threads: List[threading.Thread] = []
+        self.prefetched = 0
+        self.failed = 0
+
+    def enqueue(self, file_ids: List[str]) -> int:
+        """Queue capsules for prefetching; returns how many were added"""
+        candidates = self.db.get_prefetch_candidates(file_ids, self.max_size)
+        added = 0
+        with self._condition:
+            for file_id, _, recipients in candidates:
+                if file_id in self._queued or self.blob_cache.contains(file_id):
+                    continue
+                # 수신자가 많은 캡슐부터 가져옴
+                heapq.heappush(self._heap, (-recipients, next(self._counter), file_id))
+                self._queued.add(file_id)
+                added += 1
+            self._condition.notify(added)
+        return added
+
+    def _writer(self, writer):
+        return _ThrottledWriter(writer, self.throttle) if self.throttle else writer
+
+    def _prefetch(self, file_id: str):
+        asyncio.run(self.blob_cache.get_or_fill(
+            file_id, lambda writer: self.fill(file_id, self._writer(writer))
+        ))
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._heap and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                _, _, file_id = heapq.heappop(self._heap)
+
+            try:
+                with SCHEDULER_RUN_SECONDS.time(job='prefetch'):
+                    self._prefetch(file_id)
+                self.prefetched += 1
+            except Exception:
+                self.failed += 1
+                logger.exception("Prefetch failed", extra={'storage_id': file_id})
+            finally:
+                with self._condition:
+                    self._queued.discard(file_id)
+
+    def start(self):
+        if self._threads:
+            return
+        for i in range(self.concurrency):
+            thread = threading.Thread(target=self._run, name=f"prefetcher-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+
+    def stats(self) -> Dict[str, int]:
+        with self._condition:
+            return {
+                'queued': len(self._heap),
+                'prefetched': self.prefetched,
+                'failed': self.failed
+            }
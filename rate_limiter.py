@@ -1,24 +1,190 @@
 from functools import wraps
-from datetime import datetime, timedelta
-from collections import defaultdict
-from flask import request, jsonify
-from typing import Dict, List, Tuple
+from collections import OrderedDict
+from flask import request, jsonify, make_response
+from typing import Dict, List, Tuple, Optional
+import math
+import threading
 import time
 
+from database import ConnectionPool
+from metrics import Counter
+
+RATE_LIMIT_REJECTIONS = Counter(
+    'timecapsule_rate_limit_rejections_total', 'Requests rejected by the rate limiter', ['window']
+)
+
+class RateLimitResult:
+    __slots__ = ('allowed', 'limit', 'remaining', 'reset', 'retry_after', 'message')
+
+    def __init__(self, allowed: bool, limit: int, remaining: int, reset: float,
+                 retry_after: int = 0, message: str = ""):
+        self.allowed = allowed
+        self.limit = limit
+        self.remaining = remaining
+        self.reset = reset
+        self.retry_after = retry_after
+        self.message = message
+
+    def headers(self) -> Dict[str, str]:
+        headers = {
+            'X-RateLimit-Limit': str(self.limit),
+            'X-RateLimit-Remaining': str(self.remaining),
+            'X-RateLimit-Reset': str(int(math.ceil(self.reset)))
+        }
+        if not self.allowed:
+            headers['Retry-After'] = str(self.retry_after)
+        return headers
+
+class MemoryBackend:
+    """
+    In-process counter storage. Keeps one (window_start, current, previous)
+    triple per key and window, and evicts keys that have been idle for
+    longer than two of their windows.
+    """
+    def __init__(self, sweep_every: int = 1000):
+        self.counters: "OrderedDict[Tuple[str, int], List[int]]" = OrderedDict()
+        self.sweep_every = sweep_every
+        self._calls = 0
+        self._lock = threading.Lock()
+
+    def _evict_idle(self, now: float):
+        # 가장 오래 사용되지 않은 키부터 확인하므로 만료되지 않은 키에서 멈춤
+        while self.counters:
+            (key, window_size), (window_start, _, _) = next(iter(self.counters.items()))
+            if window_start + 2 * window_size > now:
+                break
+            self.counters.popitem(last=False)
+
+    def increment(self, key: str, window_size: int, now: float) -> Tuple[int, int, int]:
+        """Count one hit and return (window_start, current, previous)"""
+        window_start = int(now // window_size) * window_size
+        with self._lock:
+            counter = self.counters.get((key, window_size))
+            if counter is None:
+                counter = [window_start, 0, 0]
+                self.counters[(key, window_size)] = counter
+            else:
+                self.counters.move_to_end((key, window_size))
+
+            if counter[0] != window_start:
+                counter[2] = counter[1] if counter[0] + window_size == window_start else 0
+                counter[1] = 0
+                counter[0] = window_start
+            counter[1] += 1
+            result = (counter[0], counter[1], counter[2])
+
+            self._calls += 1
+            if self._calls % self.sweep_every == 0:
+                self._evict_idle(now)
+            return result
+
+    def __len__(self) -> int:
+        return len(self.counters)
+
+class SQLiteBackend:
+    """
+    Counter storage shared by every worker process through one SQLite file.
+    Each hit is a single atomic UPSERT ... RETURNING.
+    """
+    def __init__(self, db_path: str = "ratelimit.db", sweep_every: int = 1000):
+        self.pool = ConnectionPool(db_path, pool_size=4, synchronous="OFF", initializer=self._create_table)
+        self.sweep_every = sweep_every
+        self._calls = 0
+
+    @staticmethod
+    def _create_table(conn):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS rate_limits (
+                key TEXT NOT NULL,
+                window_size INTEGER NOT NULL,
+                window_start INTEGER NOT NULL,
+                current INTEGER NOT NULL,
+                previous INTEGER NOT NULL,
+                PRIMARY KEY (key, window_size)
+            ) WITHOUT ROWID
+        ''')
+
+    def increment(self, key: str, window_size: int, now: float) -> Tuple[int, int, int]:
+        window_start = int(now // window_size) * window_size
+        with self.pool.connection() as conn:
+            # SET 절의 컬럼 참조는 모두 갱신 전 값을 사용
+            row = conn.execute('''
+                INSERT INTO rate_limits (key, window_size, window_start, current, previous)
+                VALUES (?, ?, ?, 1, 0)
+                ON CONFLICT (key, window_size) DO UPDATE SET
+                    previous = CASE
+                        WHEN excluded.window_start = window_start THEN previous
+                        WHEN excluded.window_start = window_start + window_size THEN current
+                        ELSE 0 END,
+                    current = CASE
+                        WHEN excluded.window_start = window_start THEN current + 1
+                        ELSE 1 END,
+                    window_start = excluded.window_start
+                RETURNING window_start, current, previous
+            ''', (key, window_size, window_start)).fetchone()
+
+            self._calls += 1
+            if self._calls % self.sweep_every == 0:
+                conn.execute('''
+                    DELETE FROM rate_limits WHERE window_start + 2 * window_size <= ?
+                ''', (int(now),))
+            return row[0], row[1], row[2]
+
 class RateLimiter:
-    def __init__(self, requests_per_minute: int = 60, requests_per_hour: int = 1000):
+    """
+    Sliding-window-counter rate limiter. Each window keeps only the current
+    and previous counts; the previous count is weighted by how much of it
+    still overlaps the sliding window.
+    """
+    def __init__(self, requests_per_minute: int = 60, requests_per_hour: int = 1000, backend=None):
         self.requests_per_minute = requests_per_minute
         self.requests_per_hour = requests_per_hour
-        self.requests: Dict[str, List[float]] = defaultdict(list)
-        
-    def _clean_old_requests(self, user_id: str):
-        """Remove requests older than 1 hour"""
-        current_time = time.time()
-        self.requests[user_id] = [
-            req_time for req_time in self.requests[user_id]
-            if current_time - req_time < 3600  # 1 hour in seconds
-        ]
-        
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.rejected = 0
+
+    @staticmethod
+    def _estimate(window_size: int, window_start: int, current: int, previous: int, now: float) -> float:
+        elapsed = now - window_start
+        return previous * (1 - elapsed / window_size) + current
+
+    @staticmethod
+    def _retry_after(limit: int, window_size: int, window_start: int, current: int,
+                     previous: int, now: float) -> int:
+        elapsed = now - window_start
+        if current >= limit:
+            # 다음 윈도우에서 현재 카운트의 가중치가 충분히 줄어들 때까지 대기
+            wait = (window_size - elapsed) + window_size * max(0.0, 1 - (limit - 1) / current)
+        else:
+            wait = window_size * (1 - (limit - 1 - current) / previous) - elapsed if previous else 0
+        return max(1, int(math.ceil(wait)))
+
+    def hit(self, user_id: str, now: Optional[float] = None) -> RateLimitResult:
+        if now is None:
+            now = time.time()
+
+        result = None
+        for limit, window_size, label in (
+            (self.requests_per_minute, 60, 'minute'),
+            (self.requests_per_hour, 3600, 'hour')
+        ):
+            window_start, current, previous = self.backend.increment(user_id, window_size, now)
+            estimate = self._estimate(window_size, window_start, current, previous, now)
+            remaining = max(0, int(limit - estimate))
+
+            if estimate > limit:
+                self.rejected += 1
+                RATE_LIMIT_REJECTIONS.inc(window=label)
+                return RateLimitResult(
+                    False, limit, 0, window_start + window_size,
+                    self._retry_after(limit, window_size, window_start, current, previous, now),
+                    f"Rate limit exceeded. Maximum {limit} requests per {label} allowed."
+                )
+
+            # 헤더에는 가장 먼저 소진되는 한도를 표시
+            if result is None or remaining < result.remaining:
+                result = RateLimitResult(True, limit, remaining, window_start + window_size)
+        return result
+
     def check_rate_limit(self, user_id: str) -> Tuple[bool, str]:
         """
         Check if the request should be rate limited
@@ -26,29 +192,9 @@ class RateLimiter:
         """
         if not user_id:
             return False, "User ID is required"
-            
-        current_time = time.time()
-        self._clean_old_requests(user_id)
-        
-        # Add current request
-        self.requests[user_id].append(current_time)
-        
-        # Check minute limit
-        minute_ago = current_time - 60
-        requests_last_minute = sum(
-            1 for req_time in self.requests[user_id]
-            if req_time > minute_ago
-        )
-        
-        if requests_last_minute > self.requests_per_minute:
-            return False, f"Rate limit exceeded. Maximum {self.requests_per_minute} requests per minute allowed."
-            
-        # Check hour limit
-        requests_last_hour = len(self.requests[user_id])
-        if requests_last_hour > self.requests_per_hour:
-            return False, f"Rate limit exceeded. Maximum {self.requests_per_hour} requests per hour allowed."
-            
-        return True, ""
+
+        result = self.hit(user_id)
+        return result.allowed, result.message
 
 def rate_limit(limiter: RateLimiter):
     """
@@ -58,18 +204,22 @@ def rate_limit(limiter: RateLimiter):
         @wraps(f)
         async def decorated_function(*args, **kwargs):
             user_id = request.args.get('user_id') or request.form.get('user_id')
-            
+
             if not user_id:
                 return jsonify({'error': 'User ID is required'}), 401
-                
-            is_allowed, error_message = limiter.check_rate_limit(user_id)
-            
-            if not is_allowed:
-                return jsonify({
+
+            result = limiter.hit(user_id)
+
+            if not result.allowed:
+                response = make_response(jsonify({
                     'error': 'Rate limit exceeded',
-                    'message': error_message
-                }), 429
-                
-            return await f(*args, **kwargs)
+                    'message': result.message
+                }), 429)
+                response.headers.update(result.headers())
+                return response
+
+            response = make_response(await f(*args, **kwargs))
+            response.headers.update(result.headers())
+            return response
         return decorated_function
-    return decorator
\ No newline at end of file
+    return decorator
@@ -18,10 +18,13 @@ document.getElementById('uploadForm').addEventListener('submit', async (e) => {
         return;
     }
     
+    const progressContainer = document.getElementById('progressContainer');
+    const progress = document.getElementById('progress');
+    const progressText = document.getElementById('progressText');
+
     try {
         form.classList.add('loading');
         
-        const formData = new FormData();
         const file = document.getElementById('file').files[0];
         const unlockDate = document.getElementById('unlockDate').value;
         const allowedUsersList = allowedUsers
@@ -29,28 +32,10 @@ document.getElementById('uploadForm').addEventListener('submit', async (e) => {
             .map(user => user.trim())
             .filter(user => user);
 
-        formData.append('file', file);
-        formData.append('unlock_date', unlockDate);
-        formData.append('allowed_users', JSON.stringify(allowedUsersList));
-        formData.append('user_id', userId);
-
-        const progressContainer = document.getElementById('progressContainer');
-        const progress = document.getElementById('progress');
-        const progressText = document.getElementById('progressText');
-        
         progressContainer.style.display = 'block';
         progress.style.width = '0%';
-        
-        startSimulatedProgress();
 
-        const response = await fetch('/api/upload', {
-            method: 'POST',
-            body: formData
-        });
-
-        if (!response.ok) {
-            throw new Error(await response.text());
-        }
+        await uploadResumable(file, userId, unlockDate, allowedUsersList, setUploadProgress);
 
         completeProgress();
         showToast('Capsule has been locked successfully!');
@@ -71,7 +56,183 @@ document.getElementById('uploadForm').addEventListener('submit', async (e) => {
     }
 });
 
+// 재개 가능한 업로드 - 세션을 만들고 청크 단위로 전송, 끊기면 서버 오프셋부터 이어서 전송
+const UPLOAD_CHUNK_RETRIES = 5;
+
+function uploadSessionKey(file, userId) {
+    return `upload:${userId}:${file.name}:${file.size}:${file.lastModified}`;
+}
+
+async function openUploadSession(file, userId, unlockDate, allowedUsersList) {
+    const key = uploadSessionKey(file, userId);
+    const savedSessionId = localStorage.getItem(key);
+
+    if (savedSessionId) {
+        const response = await fetch(`/api/upload/session/${savedSessionId}?user_id=${encodeURIComponent(userId)}`);
+        if (response.ok) {
+            return await response.json();
+        }
+        localStorage.removeItem(key);
+    }
+
+    const formData = new FormData();
+    formData.append('filename', file.name);
+    formData.append('file_size', file.size);
+    formData.append('mime_type', file.type);
+    formData.append('unlock_date', unlockDate);
+    formData.append('allowed_users', JSON.stringify(allowedUsersList));
+    formData.append('user_id', userId);
+
+    // 세션 생성은 rate_limit만 거침 - 쿼리의 user_id는 폼의 키와 같아야 하며, 청크 요청의 admit_upload가 같은 키로 한도를 적용
+    const response = await fetch(`/api/upload/session?user_id=${encodeURIComponent(userId)}`, {
+        method: 'POST',
+        body: formData
+    });
+    const data = await response.json();
+    if (!response.ok) {
+        throw new Error(data.message || data.error || 'Failed to start upload');
+    }
+
+    localStorage.setItem(key, data.session_id);
+    return data;
+}
+
+async function uploadResumable(file, userId, unlockDate, allowedUsersList, onProgress) {
+    const key = uploadSessionKey(file, userId);
+    const session = await openUploadSession(file, userId, unlockDate, allowedUsersList);
+    const sessionUrl = `/api/upload/session/${session.session_id}?user_id=${encodeURIComponent(userId)}`;
+    let offset = session.upload_offset;
+    let retries = 0;
+
+    onProgress(offset / Math.max(file.size, 1));
+
+    while (true) {
+        const chunk = file.slice(offset, offset + session.chunk_size);
+        let response;
+        try {
+            response = await fetch(sessionUrl, {
+                method: 'PATCH',
+                headers: {
+                    'Upload-Offset': String(offset),
+                    'Content-Type': 'application/offset+octet-stream'
+                },
+                body: chunk
+            });
+        } catch (error) {
+            response = null;
+        }
+
+        if (response && response.ok) {
+            const data = await response.json();
+            retries = 0;
+            offset = data.upload_offset;
+            onProgress(offset / Math.max(file.size, 1));
+            if (data.status === 'success') {
+                localStorage.removeItem(key);
+                return data;
+            }
+            continue;
+        }
+
+        if (response && response.status === 409) {
+            // 서버가 기록한 오프셋부터 다시 전송
+            const data = await response.json();
+            offset = data.upload_offset;
+            continue;
+        }
+
+        if (response && response.status < 500) {
+            const data = await response.json().catch(() => ({}));
+            localStorage.removeItem(key);
+            throw new Error(data.error || 'Failed to upload capsule');
+        }
+
+        if (++retries > UPLOAD_CHUNK_RETRIES) {
+            throw new Error('Upload interrupted. Select the same file again to resume.');
+        }
+        await new Promise(resolve => setTimeout(resolve, 1000 * retries));
+
+        const status = await fetch(sessionUrl).catch(() => null);
+        if (status && status.ok) {
+            offset = (await status.json()).upload_offset;
+        }
+    }
+}
+
 // 파일 목록 로드
+// 목록 상태 - ETag로 변경 여부 확인, 커서로 다음 페이지 조회
+const FILE_PAGE_SIZE = 50;
+const fileListState = { userId: null, etag: null, nextCursor: null, loading: false };
+let fileListObserver = null;
+
+function renderFileItem(file) {
+    const fileItem = document.createElement('div');
+    fileItem.className = 'file-item glass-card rounded-xl p-4 flex items-center justify-between';
+    fileItem.innerHTML = `
+        <div class="flex-1 min-w-0 mr-4">
+            <h3 class="font-medium truncate">
+                ${file.filename}
+            </h3>
+            <p class="text-sm text-gray-400">Unlock Time: ${formatDate(file.unlock_date)}</p>
+        </div>
+        <div class="flex space-x-2 flex-shrink-0">
+            <button onclick="downloadFile('${file.id}')"
+                    class="btn bg-green-600 text-white px-4 py-2 rounded-lg hover:bg-green-700">
+                Unlock
+            </button>
+            <button onclick="deleteFile('${file.id}')"
+                    class="btn bg-red-600 text-white px-4 py-2 rounded-lg hover:bg-red-700">
+                Del
+            </button>
+        </div>
+    `;
+    return fileItem;
+}
+
+function fetchFilePage(userId, cursor, etag) {
+    let url = `/api/files?user_id=${encodeURIComponent(userId)}&limit=${FILE_PAGE_SIZE}`;
+    if (cursor) url += `&cursor=${encodeURIComponent(cursor)}`;
+    const headers = etag ? { 'If-None-Match': etag } : {};
+    return fetch(url, { headers });
+}
+
+function observeNextPage() {
+    const fileList = document.getElementById('fileList');
+    if (fileListObserver) fileListObserver.disconnect();
+    if (!fileListState.nextCursor || !fileList.lastElementChild) return;
+
+    // 마지막 항목이 화면에 보이면 다음 페이지 로드
+    fileListObserver = new IntersectionObserver(entries => {
+        if (entries.some(entry => entry.isIntersecting)) {
+            fileListObserver.disconnect();
+            loadMoreFiles();
+        }
+    });
+    fileListObserver.observe(fileList.lastElementChild);
+}
+
+async function loadMoreFiles() {
+    const { userId, nextCursor } = fileListState;
+    if (!nextCursor || fileListState.loading) return;
+
+    fileListState.loading = true;
+    try {
+        const response = await fetchFilePage(userId, nextCursor);
+        if (!response.ok) throw new Error(await response.text());
+        if (fileListState.userId !== userId) return;
+
+        const files = await response.json();
+        const fileList = document.getElementById('fileList');
+        files.forEach(file => fileList.appendChild(renderFileItem(file)));
+        fileListState.nextCursor = response.headers.get('X-Next-Cursor');
+        observeNextPage();
+    } catch (error) {
+        showToast(error.message, true);
+    } finally {
+        fileListState.loading = false;
+    }
+}
+
 async function loadUserFiles() {
     const userId = document.getElementById('userId').value.trim();
     if (!userId) {
@@ -82,42 +243,51 @@ async function loadUserFiles() {
 
     console.log(userId)
 
+    // 다른 키로 바뀌면 이전 목록의 ETag를 쓰지 않음
+    const etag = fileListState.userId === userId ? fileListState.etag : null;
+
     try {
-        const response = await fetch(`/api/files?user_id=${userId}`);
+        const response = await fetchFilePage(userId, null, etag);
+        if (response.status === 304) return;
         if (!response.ok) throw new Error(await response.text());
         
         const files = await response.json();
         const fileList = document.getElementById('fileList');
         fileList.innerHTML = '';
+        files.forEach(file => fileList.appendChild(renderFileItem(file)));
 
-        files.forEach(file => {
-            const fileItem = document.createElement('div');
-            fileItem.className = 'file-item glass-card rounded-xl p-4 flex items-center justify-between';
-            fileItem.innerHTML = `
-                <div class="flex-1 min-w-0 mr-4">
-                    <h3 class="font-medium truncate">
-                        ${file.filename}
-                    </h3>
-                    <p class="text-sm text-gray-400">Unlock Time: ${formatDate(file.unlock_date)}</p>
-                </div>
-                <div class="flex space-x-2 flex-shrink-0">
-                    <button onclick="downloadFile('${file.id}')"
-                            class="btn bg-green-600 text-white px-4 py-2 rounded-lg hover:bg-green-700">
-                        Unlock
-                    </button>
-                    <button onclick="deleteFile('${file.id}')"
-                            class="btn bg-red-600 text-white px-4 py-2 rounded-lg hover:bg-red-700">
-                        Del
-                    </button>
-                </div>
-            `;
-            fileList.appendChild(fileItem);
-        });
+        fileListState.userId = userId;
+        fileListState.etag = response.headers.get('ETag');
+        fileListState.nextCursor = response.headers.get('X-Next-Cursor');
+        observeNextPage();
+        subscribeEvents(userId);
     } catch (error) {
         showToast(error.message, true);
     }
 }
 
+// 캡슐 변경 알림 - 서버가 보내는 이벤트를 받으면 목록을 다시 불러옴 (ETag로 변경 없으면 304)
+const CAPSULE_EVENTS = ['capsule_added', 'capsule_unlocked', 'capsule_deleted'];
+let eventSource = null;
+let eventSourceUserId = null;
+let reloadTimer = null;
+
+function scheduleReload() {
+    // 여러 이벤트가 한꺼번에 오면 한 번만 다시 불러옴
+    clearTimeout(reloadTimer);
+    reloadTimer = setTimeout(loadUserFiles, 200);
+}
+
+function subscribeEvents(userId) {
+    if (!window.EventSource || eventSourceUserId === userId) return;
+    if (eventSource) eventSource.close();
+
+    // 연결이 끊기면 브라우저가 Last-Event-ID를 보내며 자동으로 재연결함
+    eventSource = new EventSource(`/api/events?user_id=${encodeURIComponent(userId)}`);
+    eventSourceUserId = userId;
+    CAPSULE_EVENTS.forEach(type => eventSource.addEventListener(type, scheduleReload));
+}
+
 // 파일 다운로드
 async function downloadFile(fileId) {
     const userId = document.getElementById('userId').value.trim();
@@ -191,7 +361,7 @@ async function deleteFile(fileId) {
         fileList.innerHTML = '';
         
         // Force a fresh reload of the file list
-        await new Promise(resolve => setTimeout(resolve, 500)); // Small delay to ensure deletion is processed
+        fileListState.etag = null;
         await loadUserFiles();
         
     } catch (error) {
@@ -85,6 +85,15 @@ function stopSimulatedProgress() {
     }
 }
 
+function setUploadProgress(fraction) {
+    const progress = document.getElementById('progress');
+    const progressText = document.getElementById('progressText');
+    const width = Math.min(100, Math.max(0, fraction * 100));
+
+    progress.style.width = width + '%';
+    progressText.textContent = Math.round(width) + '%';
+}
+
 function completeProgress() {
     stopSimulatedProgress();
     const progress = document.getElementById('progress');
@@ -0,0 +1,87 @@
+from abc import ABC, abstractmethod
+from typing import Any, BinaryIO, Coroutine, Dict, Iterable, Iterator, Optional
+
+class StorageError(Exception):
+    def __init__(self, message: str, status_code: int = 502):
+        self.message = message
+        self.status_code = status_code
+        super().__init__(self.message)
+
+class StorageDownload(ABC):
+    """
+    An open download: ``status`` and ``headers`` as an HTTP response would
+    have them (200, 206 or 416 for ranged reads), and a body read in chunks
+    """
+    status: int
+    headers: Dict[str, str]
+
+    @abstractmethod
+    def iter_chunks(self, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        """Synchronous iterator for WSGI responses; closes the download at the end"""
+
+    @abstractmethod
+    async def read(self, chunk_size: int = 64 * 1024) -> bytes:
+        """Read the next chunk from any event loop; returns b'' at the end"""
+
+    @abstractmethod
+    def close(self):
+        ...
+
+class StorageBackend(ABC):
+    """
+    Where capsule contents live. Objects are immutable once written and are
+    addressed by a storage id. Async methods may be awaited from any event
+    loop (Flask runs each view on its own), and ``run`` lets synchronous
+    code (scheduler jobs, maintenance) call them.
+
+    Deletion is two-phase so a crash between the steps is safe to retry:
+    ``trash`` hides an object (raising StorageError with status 404 if it is
+    already gone) and ``empty_trash`` removes everything trashed, once per
+    batch. ``delete_many`` runs both steps for a batch; trashing an object
+    again is harmless, so a failed batch can simply be retried.
+    """
+    name = "storage"
+
+    @abstractmethod
+    async def upload(self, stream: BinaryIO, metadata: Dict[str, Any], length: Optional[int] = None,
+                     chunk_size: int = 5 * 1024 * 1024, parallelism: int = 4) -> str:
+        """Store a stream and return its location (see ``storage_id``)"""
+
+    @abstractmethod
+    async def create_upload(self, length: Optional[int], metadata: Dict[str, Any]) -> str:
+        """Start a resumable upload of ``length`` bytes and return its location"""
+
+    @abstractmethod
+    async def upload_chunk(self, location: str, offset: int, chunk: bytes) -> int:
+        """Append ``chunk`` at ``offset`` and return the new offset"""
+
+    def storage_id(self, location: str) -> str:
+        """Storage id of the object written through ``location``"""
+        return location.rstrip('/').rsplit('/', 1)[-1]
+
+    def local_path(self, storage_id: str) -> Optional[str]:
+        """Path of the object on this machine, if the backend keeps one, so it can be served with sendfile"""
+        return None
+
+    @abstractmethod
+    async def download(self, storage_id: str, headers: Optional[Dict[str, str]] = None) -> StorageDownload:
+        """Open a streaming download; honours Range and If-Range in ``headers``"""
+
+    @abstractmethod
+    async def trash(self, storage_id: str):
+        ...
+
+    @abstractmethod
+    async def empty_trash(self):
+        ...
+
+    @abstractmethod
+    async def delete_many(self, storage_ids: Iterable[str]) -> Dict[str, Optional[StorageError]]:
+        """Trash several objects and empty the trash once; returns the error (or None) per id"""
+
+    @abstractmethod
+    def run(self, coro: Coroutine):
+        """Run one of the coroutines above from synchronous code"""
+
+    def close(self):
+        pass
@@ -0,0 +1,145 @@
+import asyncio
+import os
+import threading
+from functools import lru_cache
+from typing import Callable, Iterable, Optional
+
+class Completion:
+    """
+    Runs ``on_complete`` once, when a response body has been handed to the
+    server in full: iteration went past the last chunk and the bytes sent
+    equal ``expected`` (the Content-Length, or None if it is unknown).
+    """
+    def __init__(self, expected: Optional[int], on_complete: Callable[[], None]):
+        self.expected = expected
+        self.on_complete = on_complete
+        self._done = False
+        self._lock = threading.Lock()
+
+    def finish(self, sent: int):
+        with self._lock:
+            if self._done or (self.expected is not None and sent != self.expected):
+                return
+            self._done = True
+        self.on_complete()
+
+    async def finish_async(self, sent: int):
+        # DB 갱신은 이벤트 루프를 막지 않도록 스레드에서 실행
+        await asyncio.get_running_loop().run_in_executor(None, self.finish, sent)
+
+class TrackedBody:
+    """
+    Response body wrapper that reports completion. A server asks for the
+    next chunk only after sending the previous one, so iteration ends only
+    once everything was sent; aborted transfers stop early and HEAD
+    responses are never iterated.
+    """
+    def __init__(self, body: Iterable[bytes], completion: Completion):
+        self.body = body
+        self.completion = completion
+
+    def __iter__(self):
+        sent = 0
+        for chunk in self.body:
+            sent += len(chunk)
+            yield chunk
+        self.completion.finish(sent)
+
+    async def __aiter__(self):
+        loop = asyncio.get_running_loop()
+        iterator = iter(self.body)
+        sent = 0
+        while True:
+            chunk = await loop.run_in_executor(None, next, iterator, None)
+            if chunk is None:
+                break
+            sent += len(chunk)
+            yield chunk
+        await self.completion.finish_async(sent)
+
+    def close(self):
+        close = getattr(self.body, 'close', None)
+        if close:
+            close()
+
+class SentFile:
+    """
+    File proxy that remembers the furthest position it was seeked to.
+    socket.sendfile seeks the file to just past the last byte it sent, on
+    success and on error, so this is how far a sendfile transfer got even
+    when the server rewinds the descriptor afterwards.
+    """
+    def __init__(self, file):
+        self.file = file
+        self.furthest = file.tell()
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        position = self.file.seek(offset, whence)
+        self.furthest = max(self.furthest, position)
+        return position
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+@lru_cache(maxsize=None)
+def tracked_file_wrapper(base: type) -> type:
+    """
+    Subclass of a server's wsgi.file_wrapper that reports completion.
+
+    Instances still pass the server's isinstance check, so it keeps its
+    sendfile path. Bytes sent that way are taken from SentFile in close().
+    """
+    class TrackedFileWrapper(base):
+        def __init__(self, file, buffer_size: int = 8192):
+            file = SentFile(file)
+            super().__init__(file, buffer_size)
+            # gunicorn은 close를 인스턴스 속성으로 지정하므로 아래 메서드가 가려지지 않게 꺼내 둠
+            self.base_close = self.__dict__.pop('close', None)
+            self.tracked_file = file
+            self.read_size = getattr(self, 'buffer_size', None) or getattr(self, 'blksize', buffer_size)
+            self.start = file.furthest
+            self.completion: Optional[Completion] = None
+            self.iterated = False
+            self.sent = 0
+
+        # werkzeug의 Range 래퍼가 iter()의 결과를 seek하므로 제너레이터가 아니라 자신을 반환
+        def __iter__(self):
+            self.iterated = True
+            return self
+
+        def __next__(self):
+            chunk = self.tracked_file.read(self.read_size)
+            if not chunk:
+                if self.completion:
+                    self.completion.finish(self.sent)
+                raise StopIteration
+            self.sent += len(chunk)
+            return chunk
+
+        async def __aiter__(self):
+            self.iterated = True
+            sent = 0
+            if hasattr(base, '__aiter__'):
+                async for chunk in super().__aiter__():
+                    sent += len(chunk)
+                    yield chunk
+            else:
+                loop = asyncio.get_running_loop()
+                while True:
+                    chunk = await loop.run_in_executor(None, self.tracked_file.read, self.read_size)
+                    if not chunk:
+                        break
+                    sent += len(chunk)
+                    yield chunk
+            if self.completion:
+                await self.completion.finish_async(sent)
+
+        def close(self):
+            if self.completion and not self.iterated:
+                self.completion.finish(self.tracked_file.furthest - self.start)
+            if self.base_close:
+                self.base_close()
+            elif hasattr(base, 'close'):
+                super().close()
+
+    return TrackedFileWrapper
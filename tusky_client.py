@@ -0,0 +1,471 @@
+import asyncio
+import base64
+import json
+import random
+import threading
+import time
+from concurrent.futures import Future
+from typing import Optional, Dict, Any, BinaryIO, Iterable, Iterator, List, Tuple, Coroutine
+from urllib.parse import urljoin, urlparse
+
+import aiohttp
+
+from metrics import Counter, Histogram
+from storage import StorageBackend, StorageDownload, StorageError
+
+TUS_VERSION = "1.0.0"
+
+# 재시도해도 안전한 상태 코드
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+TUSKY_REQUEST_SECONDS = Histogram(
+    'timecapsule_tusky_request_seconds', 'Tusky API call latency including retries', ['operation']
+)
+TUSKY_ERRORS = Counter(
+    'timecapsule_tusky_errors_total', 'Tusky API calls that failed or returned an error status',
+    ['operation', 'status']
+)
+TUSKY_UPLOAD_BYTES = Counter('timecapsule_tusky_upload_bytes_total', 'Bytes uploaded to Tusky')
+TUSKY_DOWNLOAD_BYTES = Counter('timecapsule_tusky_download_bytes_total', 'Bytes downloaded from Tusky')
+
+def _operation(method: str, path: str) -> str:
+    # 지표 라벨 수가 늘지 않도록 ID를 제외한 첫 경로 조각만 사용
+    segments = [segment for segment in urlparse(path).path.split('/') if segment]
+    return f"{method} /{segments[0]}" if segments else method
+
+class TuskyError(StorageError):
+    pass
+
+def encode_metadata(metadata: Dict[str, Any]) -> str:
+    """Encode metadata as a tus Upload-Metadata header value"""
+    pairs = []
+    for key, value in metadata.items():
+        if value is None:
+            continue
+        encoded = base64.b64encode(str(value).encode('utf-8')).decode('ascii')
+        pairs.append(f"{key} {encoded}")
+    return ",".join(pairs)
+
+def stream_length(stream: BinaryIO) -> Optional[int]:
+    """Return the remaining length of a seekable stream without reading it"""
+    try:
+        position = stream.tell()
+        end = stream.seek(0, 2)
+        stream.seek(position)
+        return end - position
+    except (AttributeError, OSError, ValueError):
+        return None
+
+class TuskyDownload(StorageDownload):
+    """An open download response whose body is read on the client loop"""
+    def __init__(self, client: "TuskyClient", response: aiohttp.ClientResponse):
+        self.client = client
+        self.response = response
+        self.status = response.status
+        self.headers = response.headers
+
+    def iter_chunks(self, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        """Synchronous iterator for WSGI responses"""
+        try:
+            while True:
+                chunk = self.client.run(self.response.content.read(chunk_size))
+                if not chunk:
+                    break
+                TUSKY_DOWNLOAD_BYTES.inc(len(chunk))
+                yield chunk
+        finally:
+            self.close()
+
+    async def read(self, chunk_size: int = 64 * 1024) -> bytes:
+        """Read the next chunk from any event loop; returns b'' at the end"""
+        chunk = await self.client._call(self.response.content.read(chunk_size))
+        TUSKY_DOWNLOAD_BYTES.inc(len(chunk))
+        return chunk
+
+    def close(self):
+        if not self.response.closed:
+            self.client.run(self._release())
+
+    async def _release(self):
+        self.response.release()
+
+class TuskyClient(StorageBackend):
+    """
+    Shared async client for the Tusky API, and the Tusky storage backend.
+
+    All I/O runs on one event loop owned by a background thread, so the
+    keep-alive connection pool survives across requests even though Flask
+    runs every async view on its own short-lived loop. Coroutines can be
+    awaited from any loop, and synchronous callers (the scheduler) can use
+    run().
+    """
+    name = "tusky"
+
+    def __init__(self, base_url: str, api_key: Optional[str], max_connections: int = 32,
+                 max_concurrency: int = 16, timeout: float = 30, connect_timeout: float = 10,
+                 read_timeout: float = 60, retries: int = 3, backoff_base: float = 0.25,
+                 backoff_max: float = 8.0):
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.max_connections = max_connections
+        self.max_concurrency = max_concurrency
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+        self.stream_timeout = aiohttp.ClientTimeout(total=None, connect=connect_timeout, sock_read=read_timeout)
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._extensions: Optional[List[str]] = None
+        self._lock = threading.Lock()
+
+    # --- event loop plumbing ---
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="tusky-client", daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def _submit(self, coro: Coroutine) -> Future:
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    async def _call(self, coro: Coroutine):
+        """Run a coroutine on the client loop and await it from the caller's loop"""
+        loop = self._ensure_loop()
+        try:
+            if asyncio.get_running_loop() is loop:
+                return await coro
+        except RuntimeError:
+            pass
+        return await asyncio.wrap_future(self._submit(coro))
+
+    def run(self, coro: Coroutine):
+        """Run a coroutine on the client loop and block until it finishes"""
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("TuskyClient.run() cannot be called from the client loop")
+        return self._submit(coro).result()
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+    def close(self):
+        if self._loop is None:
+            return
+        if self._session is not None:
+            self.run(self._session.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._loop = None
+        self._thread = None
+        self._session = None
+
+    # --- request core ---
+
+    def _headers(self, extra: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        headers = {}
+        if self.api_key:
+            headers['Api-Key'] = self.api_key
+        if extra:
+            headers.update(extra)
+        return headers
+
+    def _url(self, path_or_url: str) -> str:
+        if path_or_url.startswith('http://') or path_or_url.startswith('https://'):
+            return path_or_url
+        return f"{self.base_url}{path_or_url}"
+
+    async def _backoff(self, attempt: int):
+        # full jitter 지수 백오프
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        await asyncio.sleep(random.uniform(0, delay))
+
+    async def _request(self, method: str, path: str, **kwargs) -> Tuple[int, Dict[str, str], bytes]:
+        operation = _operation(method, path)
+        started = time.perf_counter()
+        try:
+            status, headers, body = await self._send(method, path, **kwargs)
+        except TuskyError as e:
+            TUSKY_ERRORS.inc(operation=operation, status=e.status_code)
+            raise
+        finally:
+            TUSKY_REQUEST_SECONDS.observe(time.perf_counter() - started, operation=operation)
+        if status >= 400:
+            TUSKY_ERRORS.inc(operation=operation, status=status)
+        return status, headers, body
+
+    async def _send(self, method: str, path: str, *, headers: Optional[Dict[str, str]] = None,
+                    json_body: Any = None, data: Any = None, idempotent: bool = True
+                    ) -> Tuple[int, Dict[str, str], bytes]:
+        session = await self._get_session()
+        url = self._url(path)
+        last_error = None
+
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._semaphore:
+                    async with session.request(method, url, headers=self._headers(headers),
+                                               json=json_body, data=data) as response:
+                        body = await response.read()
+                        if response.status in RETRY_STATUSES and idempotent and attempt < self.retries:
+                            last_error = TuskyError(f"Tusky {method} {path} failed: {response.status}", response.status)
+                        else:
+                            return response.status, dict(response.headers), body
+            except aiohttp.ClientConnectorError as e:
+                # 연결 전 실패는 요청이 전달되지 않았으므로 항상 재시도 가능
+                last_error = TuskyError(f"Tusky {method} {path} failed: {str(e)}", 503)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                last_error = TuskyError(f"Tusky {method} {path} failed: {str(e) or type(e).__name__}", 504)
+                if not idempotent:
+                    raise last_error
+            if attempt < self.retries:
+                await self._backoff(attempt)
+        raise last_error
+
+    # --- vaults ---
+
+    async def _create_vault(self, name: str) -> Dict[str, Any]:
+        status, _, body = await self._request('POST', '/vaults', json_body={'name': name}, idempotent=False)
+        if status not in (200, 201):
+            raise TuskyError(f"Failed to create vault: {status} - {body.decode(errors='replace')}", status)
+        return json.loads(body)
+
+    async def create_vault(self, name: str) -> Dict[str, Any]:
+        return await self._call(self._create_vault(name))
+
+    # --- tus uploads ---
+
+    def _tus_headers(self, **extra) -> Dict[str, str]:
+        headers = {'Tus-Resumable': TUS_VERSION}
+        headers.update(extra)
+        return headers
+
+    async def _extensions_list(self) -> List[str]:
+        if self._extensions is None:
+            try:
+                _, headers, _ = await self._request('OPTIONS', '/uploads', headers=self._tus_headers())
+                header = headers.get('Tus-Extension', '')
+                self._extensions = [ext.strip() for ext in header.split(',') if ext.strip()]
+            except TuskyError:
+                return []
+        return self._extensions
+
+    async def _create_upload(self, length: Optional[int], metadata: Optional[Dict[str, Any]] = None,
+                             concat: Optional[str] = None) -> str:
+        headers = self._tus_headers()
+        if metadata:
+            headers['Upload-Metadata'] = encode_metadata(metadata)
+        if concat:
+            headers['Upload-Concat'] = concat
+        if length is None and not (concat or '').startswith('final'):
+            headers['Upload-Defer-Length'] = '1'
+        elif length is not None:
+            headers['Upload-Length'] = str(length)
+
+        status, response_headers, body = await self._request('POST', '/uploads', headers=headers, idempotent=False)
+        location = response_headers.get('Location')
+        if status not in (200, 201) or not location:
+            raise TuskyError(f"Failed to create upload: {status} - {body.decode(errors='replace')}", status if status >= 400 else 502)
+        return urljoin(self._url('/uploads'), location)
+
+    async def create_upload(self, length: Optional[int], metadata: Dict[str, Any]) -> str:
+        return await self._call(self._create_upload(length, metadata))
+
+    async def _get_upload_offset(self, url: str) -> int:
+        status, headers, _ = await self._request('HEAD', url, headers=self._tus_headers())
+        if status != 200:
+            raise TuskyError(f"Failed to query upload offset: {status}", status)
+        return int(headers['Upload-Offset'])
+
+    async def get_upload_offset(self, url: str) -> int:
+        return await self._call(self._get_upload_offset(url))
+
+    async def _upload_chunk(self, url: str, offset: int, chunk: bytes, final_length: Optional[int] = None) -> int:
+        last_error = None
+        for attempt in range(self.retries + 1):
+            headers = self._tus_headers(**{
+                'Upload-Offset': str(offset),
+                'Content-Type': 'application/offset+octet-stream'
+            })
+            if final_length is not None:
+                headers['Upload-Length'] = str(final_length)
+
+            status, response_headers, body = await self._request('PATCH', url, headers=headers, data=chunk)
+            if status in (200, 204):
+                TUSKY_UPLOAD_BYTES.inc(len(chunk))
+                return int(response_headers.get('Upload-Offset', offset + len(chunk)))
+            if status == 409:
+                # 서버의 오프셋과 어긋난 경우 서버 기준으로 다시 맞춤
+                server_offset = await self._get_upload_offset(url)
+                if offset <= server_offset <= offset + len(chunk):
+                    chunk = chunk[server_offset - offset:]
+                    offset = server_offset
+                    if not chunk and final_length is None:
+                        return offset
+                    continue
+            last_error = TuskyError(f"Chunk upload failed: {status} - {body.decode(errors='replace')}", status)
+            break
+        raise last_error or TuskyError("Chunk upload failed")
+
+    async def upload_chunk(self, url: str, offset: int, chunk: bytes) -> int:
+        return await self._call(self._upload_chunk(url, offset, chunk))
+
+    async def _read(self, stream: BinaryIO, size: int) -> bytes:
+        # 동기 스트림 읽기는 스레드 풀에서 수행해 클라이언트 루프를 막지 않음
+        return await asyncio.get_running_loop().run_in_executor(None, stream.read, size)
+
+    async def _upload_sequential(self, stream: BinaryIO, metadata: Dict[str, Any],
+                                 length: Optional[int], chunk_size: int) -> str:
+        url = await self._create_upload(length, metadata)
+        offset = 0
+
+        if length is not None:
+            while offset < length:
+                chunk = await self._read(stream, min(chunk_size, length - offset))
+                if not chunk:
+                    raise TuskyError("Upload stream ended before the declared length", 400)
+                offset = await self._upload_chunk(url, offset, chunk)
+            return url
+
+        # 길이를 모르는 스트림은 한 청크를 미리 읽어 마지막 청크에서 Upload-Length를 확정
+        chunk = await self._read(stream, chunk_size)
+        while chunk:
+            next_chunk = await self._read(stream, chunk_size)
+            final_length = offset + len(chunk) if not next_chunk else None
+            offset = await self._upload_chunk(url, offset, chunk, final_length)
+            chunk = next_chunk
+
+        if offset == 0:
+            await self._upload_chunk(url, 0, b'', 0)
+        return url
+
+    async def _upload_partial(self, chunk: bytes) -> str:
+        url = await self._create_upload(len(chunk), concat='partial')
+        await self._upload_chunk(url, 0, chunk)
+        return url
+
+    async def _upload(self, stream: BinaryIO, metadata: Dict[str, Any], length: Optional[int],
+                      chunk_size: int, parallelism: int) -> str:
+        if length is None:
+            length = stream_length(stream)
+
+        if parallelism <= 1 or 'concatenation' not in await self._extensions_list():
+            return await self._upload_sequential(stream, metadata, length, chunk_size)
+
+        # 부분 업로드를 동시에 전송하고 concatenation 확장으로 합침
+        tasks: List[asyncio.Task] = []
+        try:
+            chunk = await self._read(stream, chunk_size)
+            if not chunk:
+                return await self._upload_sequential(stream, metadata, 0, chunk_size)
+
+            while chunk:
+                pending = [t for t in tasks if not t.done()]
+                if len(pending) >= parallelism:
+                    await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                tasks.append(asyncio.ensure_future(self._upload_partial(chunk)))
+                chunk = await self._read(stream, chunk_size)
+
+            partial_urls = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+        return await self._create_upload(None, metadata, concat='final;' + ' '.join(partial_urls))
+
+    async def upload(self, stream: BinaryIO, metadata: Dict[str, Any], length: Optional[int] = None,
+                     chunk_size: int = 5 * 1024 * 1024, parallelism: int = 4) -> str:
+        """Upload a stream with tus and return the upload URL"""
+        return await self._call(self._upload(stream, metadata, length, chunk_size, parallelism))
+
+    # --- files ---
+
+    async def _open_download(self, file_id: str, headers: Optional[Dict[str, str]] = None) -> TuskyDownload:
+        session = await self._get_session()
+        url = self._url(f"/files/{file_id}/data")
+        last_error = None
+
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._semaphore:
+                    response = await session.get(url, headers=self._headers(headers), timeout=self.stream_timeout)
+                if response.status in RETRY_STATUSES and attempt < self.retries:
+                    response.release()
+                    last_error = TuskyError(f"Failed to view capsule: {response.status}", response.status)
+                else:
+                    return TuskyDownload(self, response)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                last_error = TuskyError(f"Download failed: {str(e) or type(e).__name__}", 502)
+            if attempt < self.retries:
+                await self._backoff(attempt)
+        raise last_error
+
+    async def download(self, file_id: str, headers: Optional[Dict[str, str]] = None) -> TuskyDownload:
+        """Open a streaming download; the caller must consume or close it"""
+        started = time.perf_counter()
+        try:
+            response = await self._call(self._open_download(file_id, headers))
+        except TuskyError as e:
+            TUSKY_ERRORS.inc(operation='GET /files', status=e.status_code)
+            raise
+        finally:
+            TUSKY_REQUEST_SECONDS.observe(time.perf_counter() - started, operation='GET /files')
+        if response.status >= 400:
+            TUSKY_ERRORS.inc(operation='GET /files', status=response.status)
+        return response
+
+    async def _trash(self, file_id: str):
+        status, _, body = await self._request(
+            'PATCH', f"/files/{file_id}",
+            headers={'Content-Type': 'application/json'},
+            json_body={'status': 'deleted'}
+        )
+        if status != 200:
+            raise TuskyError(f"Failed to move capsule to trash: {body.decode(errors='replace')}", status)
+
+    async def trash(self, file_id: str):
+        return await self._call(self._trash(file_id))
+
+    async def _empty_trash(self):
+        status, _, body = await self._request('DELETE', '/trash')
+        if status not in (200, 204):
+            raise TuskyError(f"Failed to empty trash: {body.decode(errors='replace')}", status)
+
+    async def empty_trash(self):
+        return await self._call(self._empty_trash())
+
+    async def _delete_many(self, file_ids: List[str]) -> Dict[str, Optional[StorageError]]:
+        results = await asyncio.gather(*(self._trash(file_id) for file_id in file_ids), return_exceptions=True)
+        errors: Dict[str, Optional[StorageError]] = {}
+        for file_id, result in zip(file_ids, results):
+            if isinstance(result, BaseException) and not isinstance(result, StorageError):
+                raise result
+            # 이미 없는 파일은 삭제된 것으로 간주
+            errors[file_id] = result if isinstance(result, StorageError) and result.status_code != 404 else None
+        trashed = [file_id for file_id in file_ids if errors[file_id] is None]
+        if trashed:
+            try:
+                await self._empty_trash()
+            except StorageError as e:
+                errors.update((file_id, e) for file_id in trashed)
+        return errors
+
+    async def delete_many(self, file_ids: Iterable[str]) -> Dict[str, Optional[StorageError]]:
+        """Move a batch of files to trash concurrently and empty the trash once"""
+        return await self._call(self._delete_many(list(dict.fromkeys(file_ids))))
+
+    async def delete_file(self, file_id: str):
+        """Move a file to trash and empty the trash"""
+        await self.trash(file_id)
+        await self.empty_trash()
@@ -0,0 +1,235 @@
+import asyncio
+import collections
+import logging
+import math
+import os
+import shutil
+import threading
+import time
+from functools import wraps
+from typing import Deque, Dict, Optional
+
+from flask import request, jsonify, make_response
+
+from metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_ADMISSION_WAIT_SECONDS = Histogram(
+    'timecapsule_upload_admission_wait_seconds', 'Time uploads spent queued for admission', ['outcome']
+)
+UPLOAD_ADMISSION_REJECTIONS = Counter(
+    'timecapsule_upload_admission_rejections_total', 'Uploads rejected by admission control', ['reason']
+)
+
+class AdmissionRejected(Exception):
+    def __init__(self, message: str, reason: str, retry_after: int):
+        self.message = message
+        self.reason = reason
+        self.retry_after = retry_after
+        super().__init__(message)
+
+class _Waiter:
+    __slots__ = ('user_id', 'size', 'loop', 'future', 'admitted')
+
+    def __init__(self, user_id: str, size: int, loop: asyncio.AbstractEventLoop):
+        self.user_id = user_id
+        self.size = size
+        self.loop = loop
+        self.future = loop.create_future()
+        self.admitted = False
+
+class Admission:
+    """Bytes reserved for one upload; released when the upload finishes"""
+    def __init__(self, controller: "UploadAdmission", user_id: str, size: int):
+        self.controller = controller
+        self.user_id = user_id
+        self.size = size
+        self.started = time.monotonic()
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.controller._release(self)
+
+class UploadAdmission:
+    """
+    Bounds the upload bytes a process has in flight, in total and per user,
+    and keeps ``min_free_disk`` free where request bodies are spooled.
+
+    Uploads reserve their declared size before the body is read. One that
+    does not fit waits in a FIFO queue, so the client's body stays in the
+    socket buffers. If the queue holds ``max_queued`` uploads, or the wait
+    exceeds ``max_wait`` seconds, the upload is rejected with a Retry-After
+    estimate. Waiters may be on different event loops (one per Flask view),
+    so they are woken with call_soon_threadsafe.
+
+    An upload bigger than a budget is admitted on its own once nothing else
+    holds that budget.
+    """
+    def __init__(self, max_bytes: int, max_bytes_per_user: int, spool_dir: str,
+                 min_free_disk: int = 0, max_queued: int = 32, max_wait: float = 10):
+        self.max_bytes = max_bytes
+        self.max_bytes_per_user = max_bytes_per_user
+        self.spool_dir = spool_dir
+        self.min_free_disk = min_free_disk
+        self.max_queued = max_queued
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self.in_flight_bytes = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.hold_seconds: Optional[float] = None  # 업로드 한 건이 예약을 잡고 있는 평균 시간
+        self._user_bytes: Dict[str, int] = {}
+        self._queue: Deque[_Waiter] = collections.deque()
+        self._lock = threading.Lock()
+
+    def _free_disk(self) -> int:
+        try:
+            return shutil.disk_usage(self.spool_dir).free
+        except OSError:
+            return shutil.disk_usage(os.path.dirname(os.path.abspath(self.spool_dir))).free
+
+    def _fits_disk(self, size: int) -> bool:
+        # 예약된 바이트는 아직 디스크에 쓰이지 않은 것으로 보고 여유 공간에서 뺌
+        return self._free_disk() - self.in_flight_bytes - size >= self.min_free_disk
+
+    def _fits_total(self, size: int) -> bool:
+        return self.in_flight_bytes == 0 or self.in_flight_bytes + size <= self.max_bytes
+
+    def _fits_user(self, user_id: str, size: int) -> bool:
+        used = self._user_bytes.get(user_id, 0)
+        return used == 0 or used + size <= self.max_bytes_per_user
+
+    def _reserve(self, user_id: str, size: int):
+        self.in_flight += 1
+        self.in_flight_bytes += size
+        self._user_bytes[user_id] = self._user_bytes.get(user_id, 0) + size
+        self.admitted += 1
+
+    def retry_after(self) -> int:
+        """Seconds a rejected client should wait: about one upload's hold time"""
+        if self.hold_seconds is None:
+            return max(1, math.ceil(self.max_wait))
+        return max(1, min(60, math.ceil(self.hold_seconds)))
+
+    def _reject(self, message: str, reason: str) -> AdmissionRejected:
+        self.rejected += 1
+        UPLOAD_ADMISSION_REJECTIONS.inc(reason=reason)
+        logger.warning("Upload rejected", extra={
+            'reason': reason, 'in_flight': self.in_flight, 'in_flight_bytes': self.in_flight_bytes,
+            'queued': len(self._queue)
+        })
+        return AdmissionRejected(message, reason, self.retry_after())
+
+    async def acquire(self, user_id: str, size: int) -> Admission:
+        """Reserve ``size`` bytes for ``user_id``, waiting up to ``max_wait`` seconds"""
+        started = time.monotonic()
+        with self._lock:
+            if self._free_disk() - size < self.min_free_disk:
+                raise self._reject("Not enough storage for this upload, please try again later", 'disk')
+            # 앞에 기다리는 업로드가 없을 때만 바로 입장 (FIFO 유지)
+            if not self._queue and self._fits_total(size) and self._fits_user(user_id, size) \
+                    and self._fits_disk(size):
+                self._reserve(user_id, size)
+                UPLOAD_ADMISSION_WAIT_SECONDS.observe(0, outcome='admitted')
+                return Admission(self, user_id, size)
+            if len(self._queue) >= self.max_queued:
+                raise self._reject("Too many uploads in progress, please try again later", 'queue_full')
+            waiter = _Waiter(user_id, size, asyncio.get_running_loop())
+            self._queue.append(waiter)
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.max_wait)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+
+        if not self._abandon(waiter):
+            UPLOAD_ADMISSION_WAIT_SECONDS.observe(time.monotonic() - started, outcome='rejected')
+            with self._lock:
+                raise self._reject("Too many uploads in progress, please try again later", 'timeout')
+        UPLOAD_ADMISSION_WAIT_SECONDS.observe(time.monotonic() - started, outcome='admitted')
+        return Admission(self, user_id, size)
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """Leave the queue; returns True if the waiter had already been admitted"""
+        with self._lock:
+            if waiter.admitted:
+                return True
+            self._queue.remove(waiter)
+            self._admit_waiters()
+            return False
+
+    def _release(self, admission: Admission):
+        with self._lock:
+            self.in_flight -= 1
+            self.in_flight_bytes -= admission.size
+            remaining = self._user_bytes[admission.user_id] - admission.size
+            if remaining:
+                self._user_bytes[admission.user_id] = remaining
+            else:
+                del self._user_bytes[admission.user_id]
+            held = time.monotonic() - admission.started
+            self.hold_seconds = held if self.hold_seconds is None else 0.8 * self.hold_seconds + 0.2 * held
+            self._admit_waiters()
+
+    def _admit_waiters(self):
+        # 사용자 한도에 걸린 업로드는 건너뛰되, 전체/디스크 한도에 걸리면 뒤의 업로드도 기다림
+        for waiter in list(self._queue):
+            if not self._fits_total(waiter.size) or not self._fits_disk(waiter.size):
+                break
+            if not self._fits_user(waiter.user_id, waiter.size):
+                continue
+            self._queue.remove(waiter)
+            self._reserve(waiter.user_id, waiter.size)
+            waiter.admitted = True
+            waiter.loop.call_soon_threadsafe(
+                lambda future=waiter.future: future.done() or future.set_result(None)
+            )
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                'in_flight': self.in_flight,
+                'in_flight_bytes': self.in_flight_bytes,
+                'max_bytes': self.max_bytes,
+                'queued': len(self._queue),
+                'queued_bytes': sum(waiter.size for waiter in self._queue),
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'hold_seconds': self.hold_seconds or 0.0
+            }
+
+def admit_upload(controller: UploadAdmission):
+    """
+    Decorator that reserves the request's Content-Length before the body is
+    read. Apply it outside ``rate_limit``, which parses the form. Per-user
+    budgets use the ``user_id`` query parameter, or the client address when
+    it is absent (the form cannot be read without receiving the body). The
+    upload views reject a query ``user_id`` that differs from the form's.
+    """
+    def decorator(f):
+        @wraps(f)
+        async def decorated_function(*args, **kwargs):
+            size = request.content_length
+            if size is None:
+                return jsonify({'error': 'Content-Length is required for uploads'}), 411
+
+            user_id = request.args.get('user_id') or f"addr:{request.remote_addr}"
+            try:
+                admission = await controller.acquire(user_id, size)
+            except AdmissionRejected as e:
+                response = make_response(jsonify({'error': 'Upload capacity exceeded', 'message': e.message}), 503)
+                response.headers['Retry-After'] = str(e.retry_after)
+                return response
+
+            try:
+                return await f(*args, **kwargs)
+            finally:
+                admission.release()
+        return decorated_function
+    return decorator